@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк извлечения сущностей: python -m benchmarks.bench_entities
+"""
+import json
+import timeit
+
+from core.entity_extractor import EntityExtractor
+
+MESSAGES = [
+    "ок",
+    "а сколько стоит для команды из 10 человек?",
+    "Меня зовут Иван, мой email ivan@mail.ru, телефон 8 (916) 123-45-67",
+    "я Саша из «Ромашки», давайте 05.11.2025 в 14:30 или в пятницу вечером",
+    "Здравствуйте! " * 20 + "напишите на sales@example.com"
+]
+
+
+def main(number: int = 20000):
+    with open("config/leads.json", 'r', encoding='utf-8') as f:
+        extractor = EntityExtractor(json.load(f))
+
+    print(f"{'символов':>9} {'сущностей':>10} {'мкс/сообщение':>14}")
+    for message in MESSAGES:
+        seconds = timeit.timeit(lambda: extractor.extract(message), number=number)
+        print(f"{len(message):>9} {len(extractor.extract(message)):>10} "
+              f"{seconds / number * 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
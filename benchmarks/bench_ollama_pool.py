@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк пула Ollama: python -m benchmarks.bench_ollama_pool [число запросов]
+Поднимает три поддельных сервера (один с редкими очень медленными ответами, один недоступный)
+и сравнивает p50/p95/p99 задержки одного сервера и пула с дублированием запросов.
+"""
+import asyncio
+import sys
+import time
+from typing import List
+
+from benchmarks.fake_ollama import FakeOllama
+from core.ollama_client import OllamaClient, OllamaError
+from core.ollama_health import OllamaHealth, percentile_of
+from core.ollama_pool import OllamaPool
+
+
+async def measure(client: OllamaClient, requests: int, concurrency: int) -> List[float]:
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await client.generate(f"Сообщение {i}", timeout=5.0)
+            except OllamaError:
+                return
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies
+
+
+def report(name: str, latencies: List[float], requests: int):
+    print(f"{name}: успешно {len(latencies)}/{requests}, "
+          + ", ".join(f"p{p} {percentile_of(latencies, p) * 1000:.0f} мс" for p in (50, 95, 99)))
+
+
+def backend(url: str) -> OllamaClient:
+    return OllamaClient(url, model="fake", health=OllamaHealth(name=url, probe_interval=0.5))
+
+
+async def main(requests: int = 400, concurrency: int = 8):
+    servers = [FakeOllama(latency=0.03, jitter=0.02, slow_rate=0.05, slow_latency=1.0, seed=1),
+               FakeOllama(latency=0.03, jitter=0.02, slow_rate=0.05, slow_latency=1.0, seed=2),
+               FakeOllama(latency=0.03, seed=3)]
+    urls = [await server.start() for server in servers]
+    servers[2].down = True
+
+    single = backend(urls[0])
+    report("Один сервер", await measure(single, requests, concurrency), requests)
+    await single.close()
+
+    pool = OllamaPool([backend(url) for url in urls], hedge_percentile=90, hedge_min_delay=0.05)
+    await pool.start()
+    report("Пул с дублированием", await measure(pool, requests, concurrency), requests)
+    stats = pool.stats()
+    print(f"Дублировано: {stats['hedged']}, дубль быстрее: {stats['hedge_wins']}, "
+          f"переходов после ошибки: {stats['failovers']}")
+    for url, backend_stats in stats['backends'].items():
+        print(f"  {url}: {backend_stats['state']}, p50 {backend_stats['p50'] * 1000:.0f} мс")
+    await pool.close()
+
+    for server in servers:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*(int(arg) for arg in sys.argv[1:2])))
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Сквозной бенчмарк конвейера: python -m benchmarks.bench_pipeline [--concurrency 1,4,16,64] [--output файл]
+Прогоняет сценарии диалогов из benchmarks/conversations.json через _process_message_logic
+(NLU, диалоговый автомат, состояние, шаблоны) с поддельным сервером Ollama в том же процессе.
+Для каждого уровня параллельности печатает p50/p95/p99 по этапам и сообщений в секунду,
+результаты пишет в JSON (по умолчанию benchmarks/results/pipeline-<коммит>-<время>.json),
+чтобы сравнивать прогоны разных коммитов. Остальные настройки агента - через те же
+переменные окружения, что и в проде (например, NLU_MODE=structured или NLU_CACHE_SIZE=0).
+"""
+import argparse
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import subprocess
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks import fake_ollama
+from core.ollama_health import percentile_of
+from main import UniversalTelegramAgent
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "conversations.json")
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+PERCENTILES = (50, 95, 99)
+
+
+class MessageTiming:
+    """Время одного сообщения по этапам: вложенные этапы вычитаются из внешних"""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = defaultdict(float)
+        self._children: List[float] = []
+
+    def enter(self):
+        self._children.append(0.0)
+
+    def leave(self, stage: str, elapsed: float):
+        self.stages[stage] += elapsed - self._children.pop()
+        if self._children:
+            self._children[-1] += elapsed
+
+
+_current: contextvars.ContextVar[Optional[MessageTiming]] = contextvars.ContextVar('timing', default=None)
+
+
+def instrument(obj: Any, method: str, stage: str):
+    """Подменяет метод экземпляра оберткой, которая засекает время этапа текущего сообщения"""
+    original: Callable = getattr(obj, method)
+
+    if asyncio.iscoroutinefunction(original):
+        @functools.wraps(original)
+        async def timed(*args, **kwargs):
+            timing = _current.get()
+            if timing is None:
+                return await original(*args, **kwargs)
+            timing.enter()
+            started = time.perf_counter()
+            try:
+                return await original(*args, **kwargs)
+            finally:
+                timing.leave(stage, time.perf_counter() - started)
+    else:
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            timing = _current.get()
+            if timing is None:
+                return original(*args, **kwargs)
+            timing.enter()
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                timing.leave(stage, time.perf_counter() - started)
+
+    setattr(obj, method, timed)
+
+
+def instrument_agent(agent):
+    """Этапы конвейера: методы, которые вызывает _run_dialog_pipeline"""
+    for method in ('load_user', 'commit_user', 'get_user_context', 'set_user_context',
+                   'clear_user_context', 'update_dialog_history', 'get_dialog_history'):
+        instrument(agent.state_manager, method, 'state')
+    for tenant in agent.tenants.values():
+        snapshot = tenant.snapshot
+        instrument(tenant.nlu, '_rule_based_intent', 'nlu_rules')
+        if tenant.nlu.embedding_classifier:
+            instrument(tenant.nlu, '_embedding_based_intent', 'nlu_embeddings')
+        instrument(tenant.nlu, '_llm_based_intent', 'nlu_llm')
+        instrument(tenant.nlu, '_structured_llm_nlu', 'nlu_llm')
+        instrument(snapshot.entity_extractor, 'extract', 'entities')
+        instrument(snapshot.entity_extractor, 'extract_slots', 'entities')
+        for method in ('initialize_conversation', 'fill_slots', 'get_next_action'):
+            instrument(snapshot.dialog_manager, method, 'dialog')
+        instrument(snapshot.response_gen, 'generate_from_template', 'templates')
+    instrument(agent, '_generate_answer', 'llm_answer')
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Количество, среднее и перцентили в миллисекундах"""
+    summary = {'count': len(values), 'mean_ms': sum(values) / len(values) * 1000 if values else 0.0}
+    for p in PERCENTILES:
+        summary[f'p{p}_ms'] = (percentile_of(values, p) or 0.0) * 1000
+    return summary
+
+
+async def run_level(config_path: str, corpus: List[Dict], concurrency: int, rounds: int) -> Dict:
+    """Один уровень: concurrency пользователей, каждый проходит rounds сценариев подряд"""
+    agent = UniversalTelegramAgent(config_path)
+    await agent.start_services()
+    instrument_agent(agent)
+    timings: List[MessageTiming] = []
+    totals: List[float] = []
+    errors = 0
+
+    async def user(index: int):
+        nonlocal errors
+        user_id = f"bench-{concurrency}-{index}"
+        for round_number in range(rounds):
+            conversation = corpus[(index + round_number) % len(corpus)]
+            for text in conversation['messages']:
+                timing = MessageTiming()
+                _current.set(timing)
+                started = time.perf_counter()
+                try:
+                    await agent._process_message_logic(user_id, text)
+                except Exception:
+                    errors += 1
+                    continue
+                finally:
+                    _current.set(None)
+                totals.append(time.perf_counter() - started)
+                timings.append(timing)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(index) for index in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    stages = sorted({stage for timing in timings for stage in timing.stages})
+    result = {
+        'concurrency': concurrency,
+        'messages': len(totals),
+        'errors': errors,
+        'seconds': elapsed,
+        'messages_per_second': len(totals) / elapsed if elapsed else 0.0,
+        'total': summarize(totals),
+        'stages': {
+            stage: summarize([timing.stages[stage] for timing in timings if stage in timing.stages])
+            for stage in stages
+        },
+        'llm_cache': {'hits': agent.llm_cache.hits, 'misses': agent.llm_cache.misses},
+        'ollama': agent.ollama_client.stats()
+    }
+    await agent.shutdown()
+    return result
+
+
+def print_level(result: Dict):
+    print(f"\n⚡ Параллельно {result['concurrency']}: {result['messages']} сообщений за "
+          f"{result['seconds']:.2f} с, {result['messages_per_second']:.0f} сообщ./с, ошибок {result['errors']}")
+    rows = [('всего', result['total'])] + list(result['stages'].items())
+    for name, summary in rows:
+        print(f"  {name:<15} n={summary['count']:<6} "
+              + "  ".join(f"p{p} {summary[f'p{p}_ms']:8.2f} мс" for p in PERCENTILES))
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+async def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк конвейера обработки сообщений")
+    parser.add_argument('--config', default="config/leads.json")
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    parser.add_argument('--concurrency', default="1,4,16,64", help="уровни параллельности через запятую")
+    parser.add_argument('--rounds', type=int, default=3, help="сценариев подряд на пользователя")
+    fake_ollama.add_arguments(parser)
+    parser.add_argument('--output', help="файл результатов JSON")
+    args = parser.parse_args(argv)
+
+    # main.py настраивает INFO-логи на каждое сообщение: в замерах они только мешают
+    logging.getLogger().setLevel(logging.ERROR)
+    with open(args.corpus, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+
+    servers = await fake_ollama.start_for_agent(args)
+    levels = []
+    try:
+        for concurrency in (int(level) for level in args.concurrency.split(',')):
+            result = await run_level(args.config, corpus, concurrency, args.rounds)
+            print_level(result)
+            levels.append(result)
+    finally:
+        for server in servers:
+            await server.stop()
+
+    commit = git_commit()
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"pipeline-{commit}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'commit': commit,
+            'timestamp': time.time(),
+            'config': args.config,
+            'fake_ollama': fake_ollama.settings(args),
+            'levels': levels
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Результаты: {output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
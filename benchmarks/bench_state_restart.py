@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк перезапуска SQLite-хранилища: python -m benchmarks.bench_state_restart [число пользователей]
+Заполняет базу контекстами и историей, затем замеряет время прогрева при повторном открытии
+и стоимость записи контекста на горячем пути.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from core.sqlite_state import SQLiteStateManager
+
+
+async def fill(path: str, users: int, history_per_user: int):
+    state = SQLiteStateManager(path)
+    await state.start()
+    for i in range(users):
+        user_id = str(100000 + i)
+        state.set_user_context(user_id, {
+            'active_goal': 'collect_contact_info',
+            'current_step': 2,
+            'collected_data': {'user_name': f'Пользователь {i}'},
+            'awaiting_slot': 'user_email',
+            'last_intent': 'express_interest'
+        })
+        for turn in range(history_per_user):
+            state.update_dialog_history(user_id, f"сообщение {turn}", f"ответ {turn}")
+    await state.close()
+
+
+async def hot_path(path: str, operations: int) -> float:
+    """Средняя стоимость set_user_context (без ожидания диска), мкс"""
+    state = SQLiteStateManager(path)
+    await state.start()
+    started = time.perf_counter()
+    for i in range(operations):
+        state.set_user_context(str(i % 1000), {'active_goal': 'schedule_demo', 'current_step': i})
+        if i % 100 == 0:
+            await asyncio.sleep(0)
+    elapsed = time.perf_counter() - started
+    await state.close()
+    return elapsed / operations * 1e6
+
+
+async def main(users: int = 10000, history_per_user: int = 5):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "state.db")
+
+        started = time.perf_counter()
+        await fill(path, users, history_per_user)
+        print(f"Заполнение: {users} контекстов, {users * history_per_user} строк истории "
+              f"за {time.perf_counter() - started:.2f} с")
+
+        restarted = SQLiteStateManager(path)
+        print(f"Прогрев после перезапуска: {restarted.warmup_seconds * 1000:.0f} мс, "
+              f"контекстов в памяти: {len(restarted.user_states)}")
+        await restarted.close()
+
+        print(f"set_user_context на горячем пути: {await hot_path(path, 50000):.1f} мкс")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*(int(arg) for arg in sys.argv[1:2])))
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк отрисовки шаблонов ответа: python -m benchmarks.bench_templates
+Сравнивает скомпилированные шаблоны с построчной заменой подстрок.
+"""
+import json
+import timeit
+
+from core.entity_extractor import EntityExtractor
+from core.response_generator import ResponseGenerator
+
+CONTEXT = {
+    'user_name': 'Иван',
+    'user_email': 'ivan@mail.ru',
+    'user_company': 'Ромашка',
+    'preferred_date': '2025-11-05',
+    'preferred_time': '14:30',
+    'user_phone': '79161234567'
+}
+
+
+def replace_render(template: str, context: dict) -> str:
+    """Прежний способ: проверка и str.replace для каждого ключа контекста"""
+    for key, value in context.items():
+        placeholder = '{' + key + '}'
+        if placeholder in template:
+            template = template.replace(placeholder, str(value))
+    return template
+
+
+def main(number: int = 200000):
+    with open("config/leads.json", 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    generator = ResponseGenerator(config, known_slots=EntityExtractor(config).slots)
+
+    print(f"{'шаблон':<18} {'полей':>6} {'replace, мкс':>13} {'compiled, мкс':>14}")
+    for name in ('welcome_message', 'ask_email', 'success_message'):
+        source = generator.templates[name]
+        compiled = generator.compiled[name]
+        assert compiled.render(CONTEXT) == replace_render(source, CONTEXT)
+        old = timeit.timeit(lambda: replace_render(source, CONTEXT), number=number)
+        new = timeit.timeit(lambda: generator.generate_from_template(name, CONTEXT), number=number)
+        print(f"{name:<18} {len(compiled.fields):>6} {old / number * 1e6:>13.2f} "
+              f"{new / number * 1e6:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Поддельный сервер Ollama для бенчмарков и проверки пула: /api/generate (с потоком и без),
+/api/embed и /api/tags на локальном порту, с настраиваемой задержкой и сбоями.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+
+class FakeOllama:
+    """
+    latency - базовая задержка ответа, jitter - случайная добавка к ней;
+    slow_rate/slow_latency - доля очень медленных ответов (например, загрузка модели);
+    failure_rate - доля ответов HTTP 500; down - сервер отвечает 503 на всё, включая /api/tags.
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, slow_rate: float = 0.0,
+                 slow_latency: float = 2.0, failure_rate: float = 0.0, intent: str = 'unknown',
+                 tokens_per_second: float = 50.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.failure_rate = failure_rate
+        self.intent = intent
+        self.tokens_per_second = tokens_per_second
+        self.down = False
+        self.random = random.Random(seed)
+
+        self.requests = 0
+        self.cancelled = 0
+        self.url: Optional[str] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    def _delay(self) -> float:
+        if self.slow_rate and self.random.random() < self.slow_rate:
+            return self.slow_latency
+        return self.latency + self.random.random() * self.jitter
+
+    def _failed(self) -> bool:
+        return self.down or (self.failure_rate and self.random.random() < self.failure_rate)
+
+    def _answer(self, body: Dict) -> str:
+        if body.get('format'):
+            return json.dumps({'intent': self.intent, 'confidence': 0.9, 'slots': {}})
+        if body.get('stream'):
+            return "Мы помогаем автоматизировать продажи. Подробности расскажет менеджер."
+        return self.intent
+
+    async def _generate(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        body = await request.json()
+        try:
+            await asyncio.sleep(self._delay())
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self._failed():
+            return web.json_response({'error': 'fake failure'}, status=500)
+
+        context = list(body.get('context') or []) + [1] * 8
+        answer = self._answer(body)
+        if not body.get('stream'):
+            return web.json_response({'response': answer, 'done': True, 'context': context,
+                                      'prompt_eval_count': len(body.get('prompt', '')) // 4,
+                                      'eval_count': len(answer.split())})
+
+        response = web.StreamResponse()
+        response.content_type = 'application/x-ndjson'
+        await response.prepare(request)
+        for word in answer.split(' '):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            await response.write((json.dumps({'response': word + ' ', 'done': False}) + '\n').encode())
+        await response.write((json.dumps({'response': '', 'done': True, 'context': context,
+                                          'prompt_eval_count': len(body.get('prompt', '')) // 4,
+                                          'eval_count': len(answer.split(' '))}) + '\n').encode())
+        return response
+
+    async def _embed(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        body = await request.json()
+        await asyncio.sleep(self._delay())
+        if self._failed():
+            return web.json_response({'error': 'fake failure'}, status=500)
+        texts: List[str] = body.get('input') or []
+        return web.json_response({'embeddings': [[float(len(text) % 7), 1.0, 0.5] for text in texts]})
+
+    async def _tags(self, request: web.Request) -> web.Response:
+        if self.down:
+            return web.json_response({'error': 'down'}, status=503)
+        return web.json_response({'models': [{'name': 'fake'}]})
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Запускает сервер (port=0 - свободный порт) и возвращает его адрес"""
+        app = web.Application()
+        app.router.add_post('/api/generate', self._generate)
+        app.router.add_post('/api/embed', self._embed)
+        app.router.add_get('/api/tags', self._tags)
+        self._runner = web.AppRunner(app, handler_cancellation=True)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{bound_port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Параметры поддельных серверов для бенчмарков"""
+    parser.add_argument('--backends', type=int, default=1, help="число поддельных серверов Ollama")
+    parser.add_argument('--latency', type=float, default=0.05, help="задержка ответа Ollama, с")
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--slow-rate', type=float, default=0.0, help="доля очень медленных ответов")
+    parser.add_argument('--slow-latency', type=float, default=2.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="доля ответов HTTP 500")
+    parser.add_argument('--llm-intent', default='unknown', help="намерение, которое возвращает LLM")
+
+
+def settings(args: argparse.Namespace) -> Dict:
+    """Параметры серверов для файла результатов"""
+    return {key: getattr(args, key) for key in
+            ('backends', 'latency', 'jitter', 'slow_rate', 'slow_latency', 'failure_rate', 'llm_intent')}
+
+
+async def start_for_agent(args: argparse.Namespace) -> List[FakeOllama]:
+    """Поднимает серверы по параметрам; адреса передаются агенту через OLLAMA_URLS"""
+    servers = [
+        FakeOllama(latency=args.latency, jitter=args.jitter, slow_rate=args.slow_rate,
+                   slow_latency=args.slow_latency, failure_rate=args.failure_rate,
+                   intent=args.llm_intent, seed=index)
+        for index in range(args.backends)
+    ]
+    urls = [await server.start() for server in servers]
+    os.environ["OLLAMA_URLS"] = ','.join(urls)
+    # Без лишних фоновых задач: конфигурация в бенчмарке не меняется
+    os.environ.setdefault("CONFIG_RELOAD_INTERVAL", "0")
+    os.environ.setdefault("OLLAMA_PROBE_INTERVAL", "1")
+    return servers
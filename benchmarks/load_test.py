@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест обработчика Telegram: python -m benchmarks.load_test [--users 500] [--rate 0]
+Виртуальные пользователи пишут боту через UniversalTelegramAgent.process_incoming_message
+(склейка, маршрутизация, диспетчер, конвейер, отправка ответа) без подключения к Telegram:
+события имитируют NewMessage (sender_id, text, reply()), Ollama - поддельный сервер.
+Пользователи приходят с заданной частотой (--rate в секунду, 0 - все сразу), каждый проходит
+сценарий из benchmarks/conversations.json по смеси --mix и отвечает после паузы --think.
+Раз в --interval секунд печатается срез: ответы, очередь диспетчера, задержка event loop,
+память. Итоги (распределение времени ответа и весь ряд срезов) пишутся в JSON.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+from benchmarks import fake_ollama
+from benchmarks.bench_pipeline import CORPUS_PATH, PERCENTILES, RESULTS_DIR, git_commit, summarize
+from main import UniversalTelegramAgent
+
+
+class FakeMessage:
+    """Отправленный ботом ответ: правки (генеративные ответы) только считаются"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.edits = 0
+
+    async def edit(self, text: str):
+        self.text = text
+        self.edits += 1
+        return self
+
+
+class FakeEvent:
+    """Входящее сообщение в духе telethon NewMessage.Event: reply() засекает время ответа"""
+
+    def __init__(self, recorder: 'LoadRecorder', sender_id: int, text: str, send_latency: float = 0.0):
+        self.recorder = recorder
+        self.sender_id = sender_id
+        self.chat_id = sender_id
+        self.text = text
+        self.send_latency = send_latency
+        self.received_at = time.perf_counter()
+        self.replied = asyncio.get_running_loop().create_future()
+
+    async def reply(self, text: str) -> FakeMessage:
+        if self.send_latency:
+            # Время запроса к Telegram: ответ засчитывается, когда отправка завершилась
+            await asyncio.sleep(self.send_latency)
+        if not self.replied.done():
+            self.recorder.record_reply(time.perf_counter() - self.received_at)
+            self.replied.set_result(text)
+        return FakeMessage(text)
+
+
+class LoadRecorder:
+    """Счетчики нагрузки и ряд периодических срезов"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sent = 0
+        self.replied = 0
+        self.timed_out = 0
+        self.users_started = 0
+        self.users_finished = 0
+        self.latencies: List[float] = []
+        self.loop_lag_max = 0.0
+        self.samples: List[Dict] = []
+        self._sampled_replies = 0
+
+    def record_reply(self, latency: float):
+        self.replied += 1
+        self.latencies.append(latency)
+
+    def sample(self, agent: UniversalTelegramAgent) -> Dict:
+        dispatcher = agent.dispatcher.stats()
+        # p95 ответов, полученных после предыдущего среза
+        recent = self.latencies[self._sampled_replies:]
+        point = {
+            't': time.perf_counter() - self.started,
+            'users_active': self.users_started - self.users_finished,
+            'sent': self.sent,
+            'replied': self.replied,
+            'timed_out': self.timed_out,
+            'pending': dispatcher['pending'],
+            'users_waiting': dispatcher['users_waiting'],
+            'dispatcher_active': dispatcher['active'],
+            'reply_p95_ms': summarize(recent)['p95_ms'],
+            'loop_lag_max_ms': self.loop_lag_max * 1000,
+            'rss_mb': rss_bytes() / 2 ** 20,
+            'state_entries': agent.state_manager.memory_stats()['entries']
+        }
+        if tracemalloc.is_tracing():
+            point['traced_mb'] = tracemalloc.get_traced_memory()[0] / 2 ** 20
+        self.loop_lag_max = 0.0
+        self._sampled_replies = len(self.latencies)
+        self.samples.append(point)
+        return point
+
+
+def rss_bytes() -> int:
+    """Текущий RSS процесса (Linux), иначе пиковый"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+async def watch_loop_lag(recorder: LoadRecorder, interval: float = 0.05):
+    """Задержка event loop: насколько позже положенного просыпается sleep(interval)"""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        recorder.loop_lag_max = max(recorder.loop_lag_max, time.perf_counter() - started - interval)
+
+
+async def report_progress(recorder: LoadRecorder, agent: UniversalTelegramAgent, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        point = recorder.sample(agent)
+        print(f"  {point['t']:6.1f} с  польз. {point['users_active']:<5} отправлено {point['sent']:<6} "
+              f"ответов {point['replied']:<6} очередь {point['pending']:<5} "
+              f"p95 {point['reply_p95_ms']:7.0f} мс  лаг loop {point['loop_lag_max_ms']:6.1f} мс  "
+              f"RSS {point['rss_mb']:.0f} МБ")
+
+
+def parse_mix(mix: Optional[str], corpus: List[Dict]) -> List[float]:
+    """Веса сценариев: "contact_rules=3,free_form_llm=1" (не указанные - 0), по умолчанию поровну"""
+    if not mix:
+        return [1.0] * len(corpus)
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        weights[name.strip()] = float(weight or 1)
+    unknown = set(weights) - {conversation['name'] for conversation in corpus}
+    if unknown:
+        raise ValueError(f"Нет сценариев: {', '.join(sorted(unknown))}")
+    return [weights.get(conversation['name'], 0.0) for conversation in corpus]
+
+
+async def virtual_user(agent: UniversalTelegramAgent, recorder: LoadRecorder, sender_id: int,
+                       conversation: Dict, rng: random.Random, args: argparse.Namespace):
+    """Пользователь проходит сценарий: следующее сообщение - после ответа и паузы"""
+    recorder.users_started += 1
+    try:
+        for index, text in enumerate(conversation['messages']):
+            if index and args.think:
+                await asyncio.sleep(rng.expovariate(1 / args.think))
+            event = FakeEvent(recorder, sender_id, text, send_latency=args.send_latency)
+            recorder.sent += 1
+            await agent.process_incoming_message(event)
+            try:
+                await asyncio.wait_for(asyncio.shield(event.replied), args.reply_timeout)
+            except asyncio.TimeoutError:
+                recorder.timed_out += 1
+                return
+    finally:
+        recorder.users_finished += 1
+
+
+async def run(args: argparse.Namespace, corpus: List[Dict]) -> LoadRecorder:
+    agent = UniversalTelegramAgent(args.config)
+    await agent.start_services()
+    agent.dispatcher.start()
+    recorder = LoadRecorder()
+    rng = random.Random(args.seed)
+    weights = parse_mix(args.mix, corpus)
+    background = [asyncio.create_task(watch_loop_lag(recorder)),
+                  asyncio.create_task(report_progress(recorder, agent, args.interval))]
+
+    users = []
+    try:
+        for number in range(args.users):
+            conversation = rng.choices(corpus, weights)[0]
+            users.append(asyncio.create_task(
+                virtual_user(agent, recorder, 100000 + number, conversation, rng, args)))
+            if args.rate:
+                await asyncio.sleep(rng.expovariate(args.rate))
+        await asyncio.gather(*users)
+    finally:
+        for task in users + background:
+            task.cancel()
+        await asyncio.gather(*users, *background, return_exceptions=True)
+        recorder.sample(agent)
+        if agent.coalescer:
+            await agent.coalescer.flush_all()
+        await agent.dispatcher.stop(drain=False)
+        await agent.shutdown()
+    return recorder
+
+
+async def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест обработчика входящих сообщений")
+    parser.add_argument('--config', default="config/leads.json")
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    parser.add_argument('--users', type=int, default=500, help="число виртуальных пользователей")
+    parser.add_argument('--rate', type=float, default=0.0, help="новых пользователей в секунду (0 - все сразу)")
+    parser.add_argument('--mix', help='веса сценариев, например "contact_rules=3,free_form_llm=1"')
+    parser.add_argument('--think', type=float, default=1.0, help="средняя пауза пользователя перед ответом, с")
+    parser.add_argument('--send-latency', type=float, default=0.05, help="время отправки ответа в Telegram, с")
+    parser.add_argument('--reply-timeout', type=float, default=60.0)
+    parser.add_argument('--interval', type=float, default=1.0, help="период срезов, с")
+    parser.add_argument('--tracemalloc', action='store_true', help="учитывать память Python (медленнее)")
+    parser.add_argument('--seed', type=int, default=1)
+    fake_ollama.add_arguments(parser)
+    parser.add_argument('--output', help="файл результатов JSON")
+    args = parser.parse_args(argv)
+
+    # main.py настраивает INFO-логи на каждое сообщение: в замерах они только мешают
+    logging.getLogger().setLevel(logging.ERROR)
+    with open(args.corpus, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    servers = await fake_ollama.start_for_agent(args)
+    print(f"👥 {args.users} пользователей, {'все сразу' if not args.rate else f'{args.rate}/с'}, "
+          f"Ollama {args.latency * 1000:.0f} мс")
+    try:
+        recorder = await run(args, corpus)
+    finally:
+        for server in servers:
+            await server.stop()
+
+    elapsed = time.perf_counter() - recorder.started
+    replies = summarize(recorder.latencies)
+    print(f"\n📬 Отправлено {recorder.sent}, ответов {recorder.replied}, без ответа {recorder.timed_out} "
+          f"за {elapsed:.1f} с ({recorder.replied / elapsed:.0f} ответов/с)")
+    print("⏱️  Время ответа: " + ", ".join(f"p{p} {replies[f'p{p}_ms']:.0f} мс" for p in PERCENTILES)
+          + f", макс {max(recorder.latencies, default=0) * 1000:.0f} мс")
+    print(f"📈 Пик очереди: {max(point['pending'] for point in recorder.samples)}, "
+          f"пик лага loop: {max(point['loop_lag_max_ms'] for point in recorder.samples):.1f} мс, "
+          f"пик RSS: {max(point['rss_mb'] for point in recorder.samples):.0f} МБ")
+
+    commit = git_commit()
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"load-{commit}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'commit': commit,
+            'timestamp': time.time(),
+            'config': args.config,
+            'load': {key: getattr(args, key) for key in
+                     ('users', 'rate', 'mix', 'think', 'send_latency', 'reply_timeout', 'seed')},
+            'fake_ollama': fake_ollama.settings(args),
+            'sent': recorder.sent,
+            'replied': recorder.replied,
+            'timed_out': recorder.timed_out,
+            'seconds': elapsed,
+            'reply_latency': replies,
+            'samples': recorder.samples
+        }, f, ensure_ascii=False, indent=2)
+    print(f"💾 Результаты: {output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,197 @@
+import logging
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from core.llm_context import LLMContextSession
+from core.metrics import LLM_FALLBACKS
+from core.ollama_client import OllamaClient, OllamaError
+
+logger = logging.getLogger(__name__)
+
+ANSWER_FALLBACKS = LLM_FALLBACKS.labels('answer')
+
+# Конец предложения: знак препинания и пробел/конец текста, либо перевод строки
+SENTENCE_END = re.compile(r'[.!?…](?=\s|$)|\n')
+
+
+def first_sentence(text: str, min_chars: int = 10) -> Optional[str]:
+    """Начало текста до конца первого законченного предложения не короче min_chars"""
+    for match in SENTENCE_END.finditer(text):
+        if match.end() >= min_chars:
+            return text[:match.end()].strip()
+    return None
+
+
+class ProgressiveReply:
+    """
+    Ответ, который появляется у пользователя по частям: первое сообщение отправляется
+    сразу, дальше оно редактируется не чаще раза в edit_interval секунд
+    (в Telegram частые правки упираются в ограничения флуда).
+    """
+
+    def __init__(self, send: Callable[[str], Awaitable[Any]], edit_interval: float = 1.0):
+        self.send = send
+        self.edit_interval = edit_interval
+        self.message = None
+        self.text = ''
+        self.edits = 0
+        self._last_update = 0.0
+
+    @property
+    def sent(self) -> bool:
+        return self.message is not None
+
+    async def update(self, text: str, final: bool = False):
+        """Отправляет первый фрагмент или правит сообщение (с учетом интервала)"""
+        text = text.strip()
+        if not text or text == self.text:
+            return
+        now = time.monotonic()
+        if self.message is None:
+            self.message = await self.send(text)
+        elif final or now - self._last_update >= self.edit_interval:
+            try:
+                await self.message.edit(text)
+            except Exception as e:
+                # Неудачная промежуточная правка не критична: следующая перезапишет текст
+                logger.warning(f"⚠️ Не удалось обновить сообщение: {e}")
+                return
+            self.edits += 1
+        else:
+            return
+        self.text = text
+        self._last_update = now
+
+    async def finish(self, text: str):
+        """Итоговый текст ответа (правка без ожидания интервала)"""
+        await self.update(text, final=True)
+
+
+class AnswerStreamer:
+    """
+    Генеративный ответ на свободные вопросы, которые не покрыты шаблонами.
+    Ответ читается из Ollama потоком (stream: true) с жестким бюджетом токенов и времени;
+    при ProgressiveReply пользователь видит первое предложение, как только оно готово.
+    """
+
+    DEFAULT_INTENTS = ('unknown', 'ask_about_product')
+
+    def __init__(self, client: OllamaClient, intents: Tuple[str, ...] = DEFAULT_INTENTS,
+                 max_tokens: int = 200, max_seconds: float = 20.0, history_turns: int = 3,
+                 temperature: float = 0.3):
+        self.client = client
+        self.intents = frozenset(intents)
+        self.max_tokens = max_tokens
+        self.max_seconds = max_seconds
+        self.history_turns = history_turns
+        self.temperature = temperature
+
+        self.answers = 0
+        self.failures = 0
+        self.truncated = 0
+        self.first_text_total = 0.0
+        self.first_text_count = 0
+
+    @staticmethod
+    def instruction(config: Dict) -> str:
+        """Инструкция из agent_config (от нее зависит версия контекста Ollama)"""
+        agent = config.get('agent_config', {})
+        brand = f" компании {agent['brand']}" if agent.get('brand') else ''
+        return (
+            f"Ты - {agent.get('role', 'ассистент')}{brand}.\n"
+            "Отвечай кратко (2-4 предложения), по делу и на языке пользователя. "
+            "Не выдумывай цены и сроки: если не знаешь, предложи связаться с менеджером.\n"
+        )
+
+    def history_block(self, history: List[Dict] = None) -> str:
+        """Последние реплики диалога (нужны, только если нет сохраненного контекста)"""
+        return ''.join(f"\nПользователь: {turn['user']}\nАссистент: {turn['bot']}"
+                       for turn in (history or [])[-self.history_turns:])
+
+    @staticmethod
+    def turn(message: str) -> str:
+        return f"\nПользователь: {message}\nАссистент:"
+
+    def build_prompt(self, config: Dict, message: str, history: List[Dict] = None) -> str:
+        """Инструкция из agent_config, последние реплики диалога и вопрос пользователя"""
+        return self.instruction(config) + self.history_block(history) + self.turn(message)
+
+    async def answer(self, prompt: str, reply: ProgressiveReply = None,
+                     context: List[int] = None, session: LLMContextSession = None) -> Optional[str]:
+        """
+        Генерирует ответ потоком. Возвращает итоговый текст или None, если
+        не удалось получить ни одного фрагмента (тогда отвечает обычный сценарий).
+        context - сохраненный контекст Ollama; новый контекст из последней части
+        ответа записывается в session (ответ, прерванный бюджетом, контекст сбрасывает).
+        """
+        started = time.monotonic()
+        deadline = started + self.max_seconds
+        parts: List[str] = []
+        tokens = 0
+        truncated = False
+        new_context = None
+
+        stream = self.client.generate_stream(
+            prompt,
+            options={"num_predict": self.max_tokens, "temperature": self.temperature},
+            timeout=self.max_seconds,
+            **({'context': context} if context else {})
+        )
+        try:
+            async for chunk in stream:
+                parts.append(chunk.get('response', ''))
+                tokens += 1
+                if reply is not None:
+                    await self._progress(reply, ''.join(parts), started)
+                if chunk.get('done'):
+                    new_context = chunk.get('context')
+                    break
+                if tokens >= self.max_tokens or time.monotonic() >= deadline:
+                    truncated = True
+                    break
+        except OllamaError as e:
+            logger.warning(f"⚠️ Генеративный ответ прерван: {e}")
+            truncated = bool(parts)
+        finally:
+            await stream.aclose()
+        if session is not None:
+            session.save(new_context)
+
+        text = ''.join(parts).strip()
+        if not text:
+            self.failures += 1
+            ANSWER_FALLBACKS.inc()
+            return None
+        if truncated:
+            self.truncated += 1
+            text = text.rstrip('.,;: ') + '…'
+
+        self.answers += 1
+        if reply is not None:
+            was_sent = reply.sent
+            await reply.finish(text)
+            if not was_sent:
+                self._record_first_text(started)
+        return text
+
+    async def _progress(self, reply: ProgressiveReply, text: str, started: float):
+        if reply.sent:
+            await reply.update(text)
+            return
+        sentence = first_sentence(text)
+        if sentence:
+            await reply.update(sentence)
+            self._record_first_text(started)
+
+    def _record_first_text(self, started: float):
+        self.first_text_total += time.monotonic() - started
+        self.first_text_count += 1
+
+    def stats(self) -> Dict:
+        return {
+            'answers': self.answers,
+            'failures': self.failures,
+            'truncated': self.truncated,
+            'avg_first_text': self.first_text_total / self.first_text_count if self.first_text_count else 0.0
+        }
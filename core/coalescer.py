@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+FlushCallback = Callable[[str, List[Any], str], Awaitable[None]]
+
+
+class _Burst:
+    """Сообщения пользователя, ожидающие склейки"""
+    __slots__ = ('events', 'texts', 'first_at', 'deadline', 'task')
+
+    def __init__(self, now: float):
+        self.events: List[Any] = []
+        self.texts: List[str] = []
+        self.first_at = now
+        self.deadline = now
+        self.task: asyncio.Task = None
+
+
+class MessageCoalescer:
+    """
+    Склеивает сообщения, которые пользователь отправляет очередью
+    ("привет" / "сколько стоит" / "для команды 10 человек"), в одно.
+    Каждое новое сообщение продлевает окно ожидания на window секунд,
+    но не дольше max_hold секунд от первого сообщения пачки.
+    """
+
+    def __init__(self, on_flush: FlushCallback, window: float = 1.5, max_hold: float = 4.0,
+                 separator: str = '\n'):
+        self.on_flush = on_flush
+        self.window = window
+        self.max_hold = max(max_hold, window)
+        self.separator = separator
+        self._bursts: Dict[str, _Burst] = {}
+
+        self.received = 0
+        self.flushed = 0
+
+    async def add(self, user_id: str, event: Any, text: str):
+        """Добавляет сообщение в пачку пользователя"""
+        self.received += 1
+        now = time.monotonic()
+        burst = self._bursts.get(user_id)
+        if burst is None:
+            burst = self._bursts[user_id] = _Burst(now)
+            burst.task = asyncio.create_task(self._hold(user_id, burst))
+
+        burst.events.append(event)
+        burst.texts.append(text)
+        burst.deadline = min(now + self.window, burst.first_at + self.max_hold)
+
+    async def _hold(self, user_id: str, burst: _Burst):
+        """Ждет окончания окна (оно может сдвигаться) и отдает пачку"""
+        while True:
+            delay = burst.deadline - time.monotonic()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+
+        await self._flush(user_id, burst)
+
+    async def _flush(self, user_id: str, burst: _Burst):
+        # Пачка отдается ровно один раз: из _hold или из flush_all
+        if self._bursts.get(user_id) is not burst:
+            return
+        del self._bursts[user_id]
+
+        self.flushed += 1
+        if len(burst.texts) > 1:
+            logger.info(f"🧩 Склеено {len(burst.texts)} сообщений от {user_id}")
+
+        try:
+            await self.on_flush(user_id, burst.events, self.separator.join(burst.texts))
+        except Exception as e:
+            logger.exception(f"❌ Ошибка передачи склеенного сообщения от {user_id}: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            'holding': len(self._bursts),
+            'received': self.received,
+            'flushed': self.flushed
+        }
+
+    async def flush_all(self):
+        """Немедленно отдает все ожидающие пачки (при остановке)"""
+        # В словаре остаются только пачки, которые еще ждут окна
+        bursts = list(self._bursts.items())
+        for _, burst in bursts:
+            burst.task.cancel()
+        await asyncio.gather(*(burst.task for _, burst in bursts), return_exceptions=True)
+        for user_id, burst in bursts:
+            await self._flush(user_id, burst)
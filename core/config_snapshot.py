@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from core.dialog_manager import DialogManager
+from core.entity_extractor import EntityExtractor
+from core.response_generator import ResponseGenerator
+from core.tools import ToolExecutor
+from utils.config_loader import ConfigLoader
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigSnapshot:
+    """
+    Неизменяемый снимок конфигурации: проверенный по схеме конфиг и всё,
+    что из него компилируется (диалоговые автоматы, шаблоны, сущности, инструменты).
+    Обработка сообщения берет ссылку на снимок один раз и работает только с ней,
+    поэтому подмена снимка не затрагивает сообщения, которые уже обрабатываются.
+    """
+
+    __slots__ = ('config', 'version', 'loaded_at', 'agent_name', 'goals', 'intents',
+                 'intent_keywords', 'entity_extractor', 'dialog_manager', 'response_gen',
+                 'tool_executor')
+
+    def __init__(self, config: Dict[str, Any], version: int = 1):
+        config = ConfigLoader.parse_config(config)
+        self.config = config
+        self.version = version
+        self.loaded_at = time.time()
+        self.agent_name: str = config['agent_config']['name']
+        self.goals: Tuple[str, ...] = tuple(config['goals'])
+        self.intents: Tuple[str, ...] = tuple(config['intents'])
+        self.intent_keywords: Optional[Dict[str, List[str]]] = config.get('intent_keywords')
+        self.entity_extractor = EntityExtractor(config)
+        slots = self.entity_extractor.slots
+        self.dialog_manager = DialogManager(config, known_slots=slots)
+        self.response_gen = ResponseGenerator(config, known_slots=slots)
+        self.tool_executor = ToolExecutor(config.get('tools', []))
+
+    @classmethod
+    def load(cls, path: str, version: int = 1) -> "ConfigSnapshot":
+        """Читает, проверяет и компилирует конфиг; любая ошибка - исключение"""
+        return cls(ConfigLoader.load_validated(path), version)
+
+
+class ConfigWatcher:
+    """
+    Следит за файлом конфигурации (опрос mtime и размера) и при изменении
+    собирает новый снимок. Снимок с ошибкой отбрасывается: продолжает работать прежний.
+    """
+
+    def __init__(self, path: str, on_reload: Callable[[ConfigSnapshot], Awaitable[None]],
+                 interval: float = 1.0, version: int = 1):
+        self.path = path
+        self.on_reload = on_reload
+        self.interval = interval
+        self.version = version
+        self._signature = self._stat()
+        self._task: asyncio.Task = None
+
+        self.reloads = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def _stat(self) -> Optional[Tuple[float, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            signature = self._stat()
+            if signature is None or signature == self._signature:
+                continue
+            self._signature = signature
+            await self.reload()
+
+    async def reload(self) -> bool:
+        """Собирает новый снимок (в отдельном потоке) и передает его on_reload"""
+        try:
+            snapshot = await asyncio.to_thread(ConfigSnapshot.load, self.path, self.version + 1)
+        except Exception as e:
+            # Файл может быть сохранен наполовину: следующее изменение вызовет новую попытку
+            self.failures += 1
+            self.last_error = str(e)
+            logger.error(f"❌ Конфигурация {self.path} не применена: {e}")
+            return False
+
+        try:
+            await self.on_reload(snapshot)
+        except Exception as e:
+            # Ошибка применения не должна останавливать слежение: работает прежний снимок
+            self.failures += 1
+            self.last_error = str(e)
+            logger.exception(f"❌ Конфигурация {self.path} не применена: {e}")
+            return False
+
+        self.version = snapshot.version
+        self.reloads += 1
+        self.last_error = None
+        return True
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            'version': self.version,
+            'reloads': self.reloads,
+            'failures': self.failures,
+            'last_error': self.last_error
+        }
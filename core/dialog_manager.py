@@ -1,66 +1,212 @@
-import json
-from typing import Dict, Any, List
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
+
+
+class DialogConfigError(ValueError):
+    """Ошибка в описании dialog_flows (битые ссылки на шаблоны, цели, сущности)"""
+
+
+class FlowStep(NamedTuple):
+    """Шаг диалога: generate_response (template) или collect_entity (entity, question_template)"""
+    type: str
+    template: Optional[str] = None
+    entity: Optional[str] = None
+    validation: Optional[str] = None
+
+
+class DialogAction(NamedTuple):
+    """
+    Что ответить пользователю:
+    respond - шаблон шага, ask - вопрос о сущности, complete - цель достигнута
+    """
+    type: str
+    template: str
+    entity: Optional[str] = None
+
+
+class CompiledFlow:
+    """
+    Неизменяемый автомат одной цели.
+    Заполненные слоты кодируются битовой маской, а переход "следующий шаг,
+    пропуская уже собранные сущности" заранее посчитан для каждой пары (шаг, маска).
+    """
+
+    MAX_SLOTS = 10
+
+    def __init__(self, goal: str, steps: List[FlowStep], completion_template: str):
+        self.goal = goal
+        self.steps: Tuple[FlowStep, ...] = tuple(steps)
+        self.completion_template = completion_template
+
+        slots: List[str] = []
+        for step in self.steps:
+            if step.type == 'collect_entity' and step.entity not in slots:
+                slots.append(step.entity)
+        if len(slots) > self.MAX_SLOTS:
+            raise DialogConfigError(f"Цель {goal}: больше {self.MAX_SLOTS} сущностей")
+
+        self.slot_bits: Dict[str, int] = {slot: 1 << i for i, slot in enumerate(slots)}
+        self.full_mask = (1 << len(slots)) - 1
+        # Вопрос о сущности: первый шаг, который её собирает
+        self.slot_steps: Dict[str, FlowStep] = {}
+        for step in self.steps:
+            if step.type == 'collect_entity':
+                self.slot_steps.setdefault(step.entity, step)
+
+        self._next_step = self._build_next_step_table()
+        self._first_missing = [
+            next((slot for slot in slots if not mask & self.slot_bits[slot]), None)
+            for mask in range(self.full_mask + 1)
+        ]
+
+    def _build_next_step_table(self) -> List[List[int]]:
+        """table[шаг][маска] -> индекс первого шага, который нужно выполнить (len(steps) - конец)"""
+        size = len(self.steps)
+        table = [[size] * (self.full_mask + 1) for _ in range(size + 1)]
+
+        for index in range(size - 1, -1, -1):
+            step = self.steps[index]
+            for mask in range(self.full_mask + 1):
+                if step.type == 'collect_entity' and mask & self.slot_bits[step.entity]:
+                    table[index][mask] = table[index + 1][mask]
+                else:
+                    table[index][mask] = index
+
+        return table
+
+    def mask(self, collected: Dict) -> int:
+        """Битовая маска заполненных слотов цели"""
+        mask = 0
+        for slot, bit in self.slot_bits.items():
+            if collected.get(slot):
+                mask |= bit
+        return mask
+
+    def next_step(self, step: int, mask: int) -> int:
+        return self._next_step[min(step, len(self.steps))][mask]
+
+    def first_missing(self, mask: int) -> Optional[str]:
+        return self._first_missing[mask]
+
 
 class DialogManager:
-    """Управляет диалоговым потоком на основе конфигурации"""
-    
-    def __init__(self, config: Dict):
+    """
+    Управляет диалоговым потоком на основе конфигурации.
+    dialog_flows компилируются при загрузке в неизменяемые автоматы; положение
+    пользователя в диалоге хранится только в его контексте, поэтому один
+    экземпляр безопасно обслуживает всех пользователей одновременно.
+    """
+
+    DEFAULT_INTENT_GOALS = {
+        'express_interest': 'collect_contact_info',
+        'ask_about_product': 'qualify_lead',
+        'request_price': 'collect_contact_info',
+        'schedule_meeting': 'schedule_demo',
+        'request_info': 'collect_contact_info'
+    }
+
+    # Проверки, при которых в слот можно записать ответ пользователя целиком
+    FREE_TEXT_VALIDATIONS = (None, 'text')
+
+    def __init__(self, config: Dict, known_slots: List[str] = None):
         self.config = config
-        self.current_goal = None
-        self.current_step = 0
-        self.completed_steps = []
-        
-    def initialize_conversation(self, intent: str) -> str:
-        """Инициализирует диалог на основе намерения"""
-        # Сопоставляем намерение с целью
-        intent_to_goal = {
-            "express_interest": "collect_contact_info",
-            "schedule_meeting": "schedule_demo",
-            "ask_about_product": "qualify_lead"
-        }
-        
-        self.current_goal = intent_to_goal.get(intent, "collect_contact_info")
-        self.current_step = 0
-        
-        # Получаем первый шаг диалога
-        return self.get_next_action()
-    
-    def get_next_action(self, entity_collected: str = None, value: Any = None) -> Dict:
-        """Возвращает следующее действие в диалоге"""
-        if not self.current_goal:
-            return {"type": "error", "message": "No active goal"}
-        
-        flow = self.config['dialog_flows'].get(self.current_goal, [])
-        
-        if self.current_step >= len(flow):
-            return {"type": "complete", "message": "Goal completed"}
-        
-        action = flow[self.current_step]
-        
-        # Если это сбор сущности и она уже собрана, переходим к следующему шагу
-        if action.get('type') == 'collect_entity' and entity_collected == action.get('entity'):
-            self.completed_steps.append({
-                'entity': entity_collected,
-                'value': value
-            })
-            self.current_step += 1
-            
-            if self.current_step < len(flow):
-                return flow[self.current_step]
-            else:
-                return {"type": "complete", "message": "Goal completed"}
-        
-        return action
-    
-    def get_current_context(self) -> Dict:
-        """Возвращает текущий контекст диалога"""
+        templates = config.get('templates', {})
+
+        self.flows: Dict[str, CompiledFlow] = {}
+        completion_templates = config.get('completion_templates', {})
+        for goal, raw_steps in config.get('dialog_flows', {}).items():
+            steps = [self._compile_step(goal, i, raw, templates, known_slots)
+                     for i, raw in enumerate(raw_steps)]
+            completion = completion_templates.get(goal, 'success_message')
+            if completion not in templates:
+                raise DialogConfigError(f"Цель {goal}: нет шаблона завершения '{completion}'")
+            self.flows[goal] = CompiledFlow(goal, steps, completion)
+
+        self.intent_goals: Dict[str, str] = dict(config.get('intent_goals', self.DEFAULT_INTENT_GOALS))
+        self.default_goal: str = config.get('default_goal', 'collect_contact_info')
+        for intent, goal in list(self.intent_goals.items()) + [('default_goal', self.default_goal)]:
+            if goal not in self.flows:
+                raise DialogConfigError(f"{intent} -> '{goal}': цель не описана в dialog_flows")
+
+    @staticmethod
+    def _compile_step(goal: str, index: int, raw: Dict, templates: Dict,
+                      known_slots: Optional[List[str]]) -> FlowStep:
+        """Проверяет и компилирует один шаг конфигурации"""
+        where = f"dialog_flows.{goal}[{index}]"
+        step_type = raw.get('type')
+
+        if step_type == 'generate_response':
+            template = raw.get('template', 'welcome_message')
+            if template not in templates:
+                raise DialogConfigError(f"{where}: неизвестный шаблон '{template}'")
+            return FlowStep(step_type, template=template)
+
+        if step_type == 'collect_entity':
+            entity = raw.get('entity')
+            if not entity:
+                raise DialogConfigError(f"{where}: не указана сущность")
+            if known_slots is not None and entity not in known_slots:
+                raise DialogConfigError(f"{where}: неизвестная сущность '{entity}'")
+            template = raw.get('question_template', f'ask_{entity}')
+            if template not in templates:
+                raise DialogConfigError(f"{where}: неизвестный шаблон вопроса '{template}'")
+            return FlowStep(step_type, template=template, entity=entity,
+                            validation=raw.get('validation'))
+
+        raise DialogConfigError(f"{where}: неизвестный тип шага '{step_type}'")
+
+    def goal_for_intent(self, intent: str) -> str:
+        """Цель диалога для намерения"""
+        return self.intent_goals.get(intent, self.default_goal)
+
+    def initialize_conversation(self, intent: str) -> Dict[str, Any]:
+        """Новый контекст диалога для намерения"""
         return {
-            "goal": self.current_goal,
-            "step": self.current_step,
-            "completed": self.completed_steps,
-            "collected_entities": {
-                step['entity']: step['value'] 
-                for step in self.completed_steps 
-                if 'entity' in step
-            }
-        }
\ No newline at end of file
+            'active_goal': self.goal_for_intent(intent),
+            'current_step': 0,
+            'collected_data': {},
+            'awaiting_slot': None,
+            'last_intent': intent
+        }
+
+    def fill_slots(self, context: Dict, message: str, entities: Dict) -> Dict:
+        """
+        Собранные данные с учетом нового сообщения. Если бот ждал ответа на вопрос
+        о сущности со свободным текстом и в сообщении нет никаких сущностей, ответ
+        пишется целиком (email в ответ на вопрос об имени именем не становится).
+        """
+        collected = dict(context.get('collected_data', {}))
+        collected.update(entities)
+
+        awaiting = context.get('awaiting_slot')
+        flow = self.flows.get(context.get('active_goal'))
+        if awaiting and flow and not entities and not collected.get(awaiting):
+            step = flow.slot_steps.get(awaiting)
+            if step and step.validation in self.FREE_TEXT_VALIDATIONS and message.strip():
+                collected[awaiting] = message.strip()
+
+        return collected
+
+    def get_next_action(self, context: Dict) -> Tuple[DialogAction, Dict[str, Any]]:
+        """
+        Следующее действие для контекста пользователя и изменения контекста.
+        Чистая функция: контекст не изменяется, общий экземпляр не хранит состояния.
+        """
+        flow = self.flows[context['active_goal']]
+        mask = flow.mask(context.get('collected_data', {}))
+        index = flow.next_step(context.get('current_step', 0), mask)
+
+        if index < len(flow.steps):
+            step = flow.steps[index]
+            if step.type == 'collect_entity':
+                return (DialogAction('ask', step.template, step.entity),
+                        {'current_step': index + 1, 'awaiting_slot': step.entity})
+            return (DialogAction('respond', step.template),
+                    {'current_step': index + 1, 'awaiting_slot': None})
+
+        if mask == flow.full_mask:
+            return DialogAction('complete', flow.completion_template), {'awaiting_slot': None}
+
+        # Шаги пройдены, но что-то не собрано: переспрашиваем первую недостающую сущность
+        slot = flow.first_missing(mask)
+        return (DialogAction('ask', flow.slot_steps[slot].template, slot),
+                {'current_step': len(flow.steps), 'awaiting_slot': slot})
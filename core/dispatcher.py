@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[None]]
+
+
+class MessageDispatcher:
+    """
+    Диспетчер входящих сообщений.
+    Сообщения одного пользователя выполняются строго по очереди (FIFO),
+    разных пользователей - параллельно на ограниченном пуле воркеров.
+    При переполнении очереди submit() ждет освобождения места (backpressure),
+    а try_submit() сразу отказывает: обработчик Telethon запускается отдельной задачей
+    на каждое обновление, и ожидание в нем копило бы задачи без ограничения.
+    """
+
+    def __init__(self, workers: int = 8, max_pending: int = 1000):
+        self.workers = workers
+        self.max_pending = max_pending
+
+        self._queues: Dict[str, Deque[Tuple[Job, float]]] = {}
+        # Пользователи, у которых есть сообщения и которые сейчас не обрабатываются
+        self._ready: "asyncio.Queue[str]" = None
+        self._slots: asyncio.Semaphore = None
+        self._tasks: List[asyncio.Task] = []
+        self._active = 0
+
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._wait_total = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """Запускает воркеры в текущем event loop"""
+        if self.running:
+            return
+        self._ready = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def submit(self, user_id: str, job: Job):
+        """Ставит задачу пользователя в его очередь; ждет, если очередь диспетчера заполнена"""
+        if not self.running:
+            self.start()
+
+        await self._slots.acquire()
+        self._enqueue(user_id, job)
+
+    async def try_submit(self, user_id: str, job: Job) -> bool:
+        """Ставит задачу, только если в очереди диспетчера есть место; иначе False"""
+        if not self.running:
+            self.start()
+
+        if self._slots.locked():
+            self.rejected += 1
+            return False
+        # Семафор не заблокирован: acquire() занимает слот, не уступая управление
+        await self._slots.acquire()
+        self._enqueue(user_id, job)
+        return True
+
+    def _enqueue(self, user_id: str, job: Job):
+        queue = self._queues.get(user_id)
+        if queue is None:
+            # Пользователь не в обработке и не в очереди готовых - планируем его
+            queue = self._queues[user_id] = deque()
+            self._ready.put_nowait(user_id)
+        queue.append((job, time.monotonic()))
+
+    async def _worker(self, number: int):
+        while True:
+            user_id = await self._ready.get()
+            queue = self._queues[user_id]
+            job, enqueued_at = queue.popleft()
+
+            wait = time.monotonic() - enqueued_at
+            self._wait_total += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._active += 1
+            try:
+                await job()
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.exception(f"❌ Ошибка обработки сообщения от {user_id}: {e}")
+            finally:
+                self._active -= 1
+                self._slots.release()
+                # Следующее сообщение пользователя встает в конец общей очереди:
+                # порядок внутри пользователя сохраняется, остальные не голодают
+                if queue:
+                    self._ready.put_nowait(user_id)
+                else:
+                    del self._queues[user_id]
+
+    def stats(self) -> Dict:
+        """Глубина очередей и время ожидания"""
+        pending = sum(len(queue) for queue in self._queues.values())
+        started = self.processed + self.failed + self._active
+        return {
+            'pending': pending,
+            'users_waiting': sum(1 for queue in self._queues.values() if queue),
+            'active': self._active,
+            'workers': self.workers,
+            'processed': self.processed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'avg_wait': self._wait_total / started if started else 0.0,
+            'max_wait': self.max_wait
+        }
+
+    async def join(self):
+        """Ждет, пока все поставленные сообщения будут обработаны"""
+        while self._queues:
+            await asyncio.sleep(0.01)
+
+    async def stop(self, drain: bool = True):
+        """Останавливает воркеры (по умолчанию после обработки очереди)"""
+        if drain and self.running:
+            await self.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
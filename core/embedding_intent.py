@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy необязателен: без него уровень эмбеддингов отключается
+    np = None
+
+from core.ollama_client import OllamaClient, OllamaError
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingIntentClassifier:
+    """
+    Классификатор намерений по эмбеддингам.
+    Примеры фраз для каждого намерения (секция конфига intent_examples) один раз
+    векторизуются через Ollama при запуске (prepare) и кешируются на диске в .npy;
+    сообщение сравнивается со всеми примерами одним матричным умножением.
+    Если примеры построить не удалось, уровень не работает, а prepare() повторяется
+    в фоне при очередной классификации - не чаще, чем позволяет растущая пауза
+    (RETRY_DELAY, удваивается до MAX_RETRY_DELAY), а не на каждом сообщении.
+    """
+
+    RETRY_DELAY = 30.0
+    MAX_RETRY_DELAY = 600.0
+
+    def __init__(self, client: OllamaClient, intent_examples: Dict[str, List[str]],
+                 model: str = "nomic-embed-text", cache_dir: str = ".cache/embeddings",
+                 min_similarity: float = 0.6, min_margin: float = 0.05, timeout: float = 5.0):
+        self.client = client
+        self.model = model
+        self.cache_dir = cache_dir
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.timeout = timeout
+
+        # Примеры сгруппированы по намерениям подряд: так максимум по намерению
+        # считается одним np.maximum.reduceat по границам групп
+        self.intents: List[str] = []
+        self.examples: List[str] = []
+        self._group_starts: List[int] = []
+        for intent, phrases in intent_examples.items():
+            phrases = [phrase for phrase in phrases if phrase.strip()]
+            if not phrases:
+                continue
+            self.intents.append(intent)
+            self._group_starts.append(len(self.examples))
+            self.examples.extend(phrases)
+
+        self._matrix = None
+        self._lock = asyncio.Lock()
+        self._retry_at = 0.0
+        self._retry_delay = self.RETRY_DELAY
+        self._prepare_task: Optional[asyncio.Task] = None
+
+    @property
+    def available(self) -> bool:
+        """Уровень возможен при установленном numpy и непустых примерах"""
+        return np is not None and bool(self.examples)
+
+    @property
+    def ready(self) -> bool:
+        """Матрица примеров построена (prepare() удался)"""
+        return self._matrix is not None
+
+    def _cache_path(self) -> str:
+        """Путь к .npy, зависящий от модели и содержимого примеров"""
+        digest = hashlib.sha1(
+            json.dumps([self.model, self.intents, self.examples], ensure_ascii=False).encode('utf-8')
+        ).hexdigest()[:16]
+        safe_model = ''.join(c if c.isalnum() else '_' for c in self.model)
+        return os.path.join(self.cache_dir, f"{safe_model}-{digest}.npy")
+
+    @staticmethod
+    def _normalize_rows(matrix):
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    async def prepare(self) -> bool:
+        """
+        Загружает матрицу примеров с диска или строит её через Ollama.
+        При ошибке Ollama следующая попытка возможна только после паузы; возвращает успех.
+        """
+        async with self._lock:
+            if self._matrix is not None:
+                return True
+            if time.monotonic() < self._retry_at:
+                return False
+
+            path = self._cache_path()
+            if os.path.exists(path):
+                self._matrix = np.load(path, mmap_mode='r')
+                logger.info(f"📐 Эмбеддинги примеров загружены из {path}")
+                return True
+
+            try:
+                vectors = await self.client.embed(self.examples, model=self.model,
+                                                  timeout=self.timeout * 6)
+            except OllamaError as e:
+                self._retry_at = time.monotonic() + self._retry_delay
+                logger.error(f"❌ Эмбеддинги примеров не построены ({self.model}), "
+                             f"повтор через {self._retry_delay:.0f} с: {e}")
+                self._retry_delay = min(self._retry_delay * 2, self.MAX_RETRY_DELAY)
+                return False
+            self._retry_delay = self.RETRY_DELAY
+            matrix = self._normalize_rows(np.asarray(vectors, dtype=np.float32))
+
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{path}.tmp.npy"
+                np.save(tmp_path, matrix)
+                os.replace(tmp_path, path)
+                self._matrix = np.load(path, mmap_mode='r')
+            except OSError as e:
+                logger.warning(f"⚠️ Не удалось сохранить эмбеддинги: {e}")
+                self._matrix = matrix
+
+            logger.info(f"📐 Построены эмбеддинги {len(self.examples)} примеров ({self.model})")
+            return True
+
+    def _schedule_prepare(self):
+        if time.monotonic() < self._retry_at or self._lock.locked():
+            return
+        if self._prepare_task is None or self._prepare_task.done():
+            self._prepare_task = asyncio.create_task(self.prepare())
+
+    def score(self, vector) -> List[Tuple[str, float]]:
+        """Максимальное косинусное сходство по каждому намерению, по убыванию"""
+        vector = self._normalize_rows(np.asarray(vector, dtype=np.float32))
+        similarities = self._matrix @ vector
+        per_intent = np.maximum.reduceat(similarities, self._group_starts)
+        order = np.argsort(per_intent)[::-1]
+        return [(self.intents[i], float(per_intent[i])) for i in order]
+
+    async def classify(self, text: str) -> Optional[Tuple[str, float]]:
+        """
+        Возвращает (намерение, сходство) или None, если ответ неоднозначен:
+        сходство ниже порога или отрыв от второго намерения слишком мал.
+        До prepare() уровень не работает: примеры не строятся на пути сообщения,
+        а подготовка (если пауза после ошибки истекла) запускается в фоне.
+        """
+        if self._matrix is None:
+            self._schedule_prepare()
+            return None
+
+        vector = (await self.client.embed([text], model=self.model, timeout=self.timeout))[0]
+        ranked = self.score(vector)
+
+        best_intent, best = ranked[0]
+        second = ranked[1][1] if len(ranked) > 1 else -1.0
+        if best < self.min_similarity or best - second < self.min_margin:
+            return None
+
+        return best_intent, round(best, 3)
@@ -0,0 +1,231 @@
+import re
+from datetime import date, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+
+class EntityMatch(NamedTuple):
+    """Найденная сущность: слот, нормализованное значение, исходный текст и позиция"""
+    slot: str
+    value: str
+    raw: str
+    start: int
+    end: int
+
+
+# Основы названий дней недели: "в пятницу", "в среду" тоже распознаются
+WEEKDAY_STEMS = ['понедельник', 'вторник', 'сред', 'четверг', 'пятниц', 'суббот', 'воскресень']
+# Падежные формы целиком: основа "сред" без окончания совпала бы со "среди" и "среде"
+# (окружение), поэтому у среды нет формы на -е
+WEEKDAY_FORMS = (r'(?:понедельник[ау]?|вторник[ау]?|сред[аыу]|четверг[ау]?|'
+                 r'пятниц[ауые]|суббот[ауые]|воскресень[еяю])')
+# День недели - дата только после предлога ("в среду", "до пятницы", "на следующий вторник")
+# или как весь ответ ("Среда"): иначе "в рабочей среде" стало бы датой
+WEEKDAY_DATE = (r'(?<!\w)(?:во?|на|до|к|по|со?)\s+(?:(?:следующ|эт|ближайш)\w*\s+)?'
+                + WEEKDAY_FORMS + r'(?!\w)|^\s*' + WEEKDAY_FORMS + r'\s*[.!]?\s*$')
+
+# Название без кавычек: до четырех слов, до знака препинания или союза ("Ромашка и хочу ...")
+COMPANY_STOP_WORDS = ('и', 'а', 'но', 'или', 'что', 'чтобы', 'где', 'когда', 'хочу', 'хотим', 'хотел',
+                      'хотела', 'нужно', 'нужен', 'нужна', 'интересует', 'ищу', 'ищем', 'звоните', 'пишите')
+LEGAL_FORMS = r'ооо|оао|зао|пао|ао|ип'
+COMPANY_WORDS = (r'[а-яёa-z0-9][\w&-]*(?:\s+(?!(?:' + '|'.join(COMPANY_STOP_WORDS) + r')(?!\w))'
+                 r'[а-яёa-z0-9][\w&-]*){0,3}')
+
+
+def _normalize_name(raw: str) -> str:
+    return raw.capitalize()
+
+
+def _normalize_email(raw: str) -> str:
+    return raw.lower()
+
+
+def _normalize_company(raw: str) -> str:
+    """«Ромашка» -> Ромашка; кавычки после формы собственности (ООО «Вектор») сохраняются"""
+    raw = raw.strip()
+    if raw[:1] in '«"' and raw[-1:] in '»"':
+        raw = raw[1:-1].strip()
+    return raw
+
+
+def _normalize_phone(raw: str) -> str:
+    """Оставляет только цифры, 8XXXXXXXXXX -> 7XXXXXXXXXX"""
+    digits = re.sub(r'\D', '', raw)
+    if len(digits) == 11 and digits.startswith('8'):
+        digits = '7' + digits[1:]
+    return digits
+
+
+def _normalize_date(raw: str, today: date = None) -> str:
+    """Переводит дату (дд.мм.гггг, завтра, день недели) в ISO формат"""
+    today = today or date.today()
+    word = raw.lower().strip(' .!')
+
+    if word == 'завтра':
+        return (today + timedelta(days=1)).isoformat()
+    if word == 'послезавтра':
+        return (today + timedelta(days=2)).isoformat()
+    for weekday, stem in enumerate(WEEKDAY_STEMS):
+        # Предлог и "следующий" перед днем недели отбрасываются
+        if word.split()[-1].startswith(stem):
+            # Ближайший такой день недели в будущем
+            days_ahead = (weekday - today.weekday() - 1) % 7 + 1
+            return (today + timedelta(days=days_ahead)).isoformat()
+
+    day, month, year = (int(part) for part in re.split(r'[./-]', raw))
+    if year < 100:
+        year += 2000
+    try:
+        return date(year, month, day).isoformat()
+    except ValueError:
+        return raw
+
+
+def _normalize_time(raw: str) -> str:
+    if ':' in raw:
+        hours, minutes = raw.split(':')
+        return f"{int(hours):02d}:{minutes}"
+    return raw.lower()
+
+
+# Декларативная таблица шаблонов: вид сущности -> регулярка, нормализатор, слот по умолчанию.
+# Группа "value" (если есть) выделяет значение внутри совпадения.
+# Порядок важен: при пересечении совпадений побеждает вид, объявленный раньше.
+ENTITY_PATTERNS: Dict[str, Dict] = {
+    'email': {
+        'regex': r'[a-z0-9._%+-]+@[a-z0-9.-]+\.[a-z]{2,}',
+        'normalize': _normalize_email,
+        'slot': 'user_email'
+    },
+    'phone': {
+        'regex': r'(?<!\d)\+?[78][\s(-]*\d{3}[)\s-]*\d{3}[\s-]?\d{2}[\s-]?\d{2}(?!\d)',
+        'normalize': _normalize_phone,
+        'slot': 'user_phone'
+    },
+    'date': {
+        'regex': r'(?<!\d)\d{1,2}[./-]\d{1,2}[./-](?:\d{4}|\d{2})(?!\d)|'
+                 r'(?<!\w)(?:послезавтра|завтра)(?!\w)|' + WEEKDAY_DATE,
+        'normalize': _normalize_date,
+        'slot': 'preferred_date'
+    },
+    'time': {
+        'regex': r'(?<!\d)(?:[01]?\d|2[0-3]):[0-5]\d(?!\d)|'
+                 r'(?<!\w)(?:утром|днем|днём|вечером|ночью|после обеда)(?!\w)',
+        'normalize': _normalize_time,
+        'slot': 'preferred_time'
+    },
+    'name': {
+        'regex': r'(?<!\w)(?:меня зовут|мое имя|моё имя|зовут)\s+(?P<value>[а-яё]+)',
+        'normalize': _normalize_name,
+        'slot': 'user_name'
+    },
+    'company': {
+        # Только явные признаки компании: просто "из" ("какой из тарифов", "я из Москвы")
+        # считается признаком лишь перед формой собственности или названием в кавычках
+        'regex': r'(?<!\w)(?:(?:из|в)\s+(?:компании|фирмы|организации)|компания|'
+                 r'работаю в(?:\s+компании)?|из(?=\s+(?:' + LEGAL_FORMS + r')\s|\s+[«"]))(?:\s*:)?\s+'
+                 r'(?P<value>(?:(?:' + LEGAL_FORMS + r')\s+)?'
+                 r'(?:[«"][^«»"\n]{1,60}[»"]|' + COMPANY_WORDS + r'))',
+        'normalize': _normalize_company,
+        'slot': 'user_company'
+    }
+}
+
+
+class EntityExtractor:
+    """
+    Извлекатель сущностей, скомпилированный один раз из таблицы шаблонов.
+    Все шаблоны объединены в одно регулярное выражение: текст сканируется за один проход,
+    возвращаются все совпадения с позициями и нормализованными значениями.
+    """
+
+    def __init__(self, config: Dict = None, patterns: Dict[str, Dict] = None):
+        self.patterns = patterns or ENTITY_PATTERNS
+        self.slot_by_kind = self._build_slot_map(config or {})
+        self._normalizers: Dict[str, Callable[[str], str]] = {
+            kind: spec['normalize'] for kind, spec in self.patterns.items()
+        }
+        self._pattern = re.compile(
+            '|'.join(self._group(kind, spec['regex']) for kind, spec in self.patterns.items()),
+            re.IGNORECASE
+        )
+        # Шаблоны без группы value описывают само значение (email, телефон, дата, время)
+        # и годятся для проверки значений, пришедших не из регулярок (например, от LLM)
+        self._kind_by_slot = {slot: kind for kind, slot in self.slot_by_kind.items()}
+        self._value_patterns = {
+            kind: re.compile(spec['regex'], re.IGNORECASE)
+            for kind, spec in self.patterns.items() if '(?P<value>' not in spec['regex']
+        }
+
+    def _build_slot_map(self, config: Dict) -> Dict[str, str]:
+        """
+        Сопоставляет виды сущностей слотам конфигурации: шаг collect_entity
+        с validation, совпадающим с видом из таблицы, переопределяет слот по умолчанию.
+        """
+        slot_by_kind = {kind: spec['slot'] for kind, spec in self.patterns.items()}
+
+        for steps in config.get('dialog_flows', {}).values():
+            for step in steps:
+                kind = step.get('validation')
+                if step.get('type') == 'collect_entity' and kind in self.patterns:
+                    slot_by_kind[kind] = step['entity']
+
+        return slot_by_kind
+
+    @staticmethod
+    def _group(kind: str, regex: str) -> str:
+        """Оборачивает шаблон в именованную группу, переименовывая внутреннюю группу value"""
+        regex = regex.replace('(?P<value>', f'(?P<{kind}__value>')
+        return f'(?P<{kind}>{regex})'
+
+    def extract(self, text: str) -> List[EntityMatch]:
+        """Возвращает все найденные сущности в порядке появления в тексте"""
+        matches = []
+
+        for match in self._pattern.finditer(text):
+            kind = match.lastgroup
+            group = f'{kind}__value'
+            if group in match.re.groupindex and match.group(group) is not None:
+                start, end = match.span(group)
+            else:
+                start, end = match.span(kind)
+
+            raw = text[start:end]
+            matches.append(EntityMatch(
+                slot=self.slot_by_kind[kind],
+                value=self._normalizers[kind](raw),
+                raw=raw,
+                start=start,
+                end=end
+            ))
+
+        return matches
+
+    def extract_slots(self, text: str, matches: Optional[List[EntityMatch]] = None) -> Dict[str, str]:
+        """Значения для заполнения слотов: первое совпадение для каждого слота"""
+        slots: Dict[str, str] = {}
+        for entity in matches if matches is not None else self.extract(text):
+            slots.setdefault(entity.slot, entity.value)
+        return slots
+
+    @property
+    def slots(self) -> List[str]:
+        """Имена слотов, которые умеет заполнять извлекатель"""
+        return list(self._kind_by_slot)
+
+    def normalize_slot(self, slot: str, value: str) -> Optional[str]:
+        """
+        Проверяет и нормализует внешнее значение слота.
+        Для проверяемых видов (email, телефон, дата, время) значение должно
+        соответствовать шаблону, иначе возвращается None.
+        """
+        value = str(value).strip()
+        kind = self._kind_by_slot.get(slot)
+        if not value or kind is None:
+            return value or None
+
+        pattern = self._value_patterns.get(kind)
+        if pattern is None:
+            return self._normalizers[kind](value)
+
+        match = pattern.search(value)
+        return self._normalizers[kind](match.group()) if match else None
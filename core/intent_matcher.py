@@ -0,0 +1,78 @@
+import re
+from typing import Dict, List, Tuple
+
+
+def normalize_text(text: str) -> str:
+    """Приводит текст к нижнему регистру и заменяет ё на е"""
+    return text.lower().replace('ё', 'е').strip()
+
+
+class IntentMatcher:
+    """
+    Скомпилированный сопоставитель ключевых слов намерений.
+    Все ключевые слова собираются в одно регулярное выражение, поэтому
+    проход по тексту один и не зависит от количества намерений.
+
+    Ключевое слово со звездочкой в конце (``интерес*``) совпадает как основа слова,
+    без звездочки - только целым словом. Фразы из нескольких слов
+    ("не интересно") проверяются раньше одиночных слов и весят больше.
+    """
+
+    def __init__(self, intent_keywords: Dict[str, List[str]]):
+        self.intents = list(intent_keywords)
+        # Номер группы в регулярке -> [(намерение, вес), ...]
+        self._group_intents: List[List[Tuple[str, int]]] = []
+        self._pattern = self._compile(intent_keywords)
+
+    def _compile(self, intent_keywords: Dict[str, List[str]]):
+        """Собирает единое регулярное выражение из таблицы ключевых слов"""
+        alternatives: Dict[str, List[Tuple[str, int]]] = {}
+
+        for intent, keywords in intent_keywords.items():
+            for keyword in keywords:
+                is_stem = keyword.endswith('*')
+                words = normalize_text(keyword.rstrip('*')).split()
+                if not words:
+                    continue
+
+                body = r'\W+'.join(re.escape(word) for word in words)
+                regex = r'(?<!\w)' + body + (r'\w*' if is_stem else r'(?!\w)')
+                alternatives.setdefault(regex, []).append((intent, len(words)))
+
+        if not alternatives:
+            return None
+
+        # Длинные фразы первыми: "не интересно" должно победить "интерес*"
+        ordered = sorted(alternatives, key=len, reverse=True)
+        self._group_intents = [alternatives[regex] for regex in ordered]
+        return re.compile('|'.join(f'({regex})' for regex in ordered))
+
+    def scores(self, text: str) -> Dict[str, int]:
+        """Суммарные веса совпавших ключевых слов по намерениям"""
+        scores: Dict[str, int] = {}
+        if self._pattern is None:
+            return scores
+
+        for match in self._pattern.finditer(normalize_text(text)):
+            for intent, weight in self._group_intents[match.lastindex - 1]:
+                scores[intent] = scores.get(intent, 0) + weight
+
+        return scores
+
+    def match(self, text: str) -> Tuple[str, float]:
+        """
+        Возвращает (намерение, уверенность).
+        Уверенность растет с весом лучшего намерения и падает,
+        если в тексте есть совпадения других намерений.
+        """
+        scores = self.scores(text)
+        if not scores:
+            return 'unknown', 0.0
+
+        # При равенстве побеждает намерение, объявленное раньше
+        best = max(self.intents, key=lambda intent: scores.get(intent, 0))
+        best_score = scores[best]
+        share = best_score / sum(scores.values())
+        confidence = share * (1 - 0.5 ** (best_score + 1))
+
+        return best, round(confidence, 3)
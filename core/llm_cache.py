@@ -0,0 +1,145 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from core.metrics import LLM_CACHE
+
+logger = logging.getLogger(__name__)
+
+CACHE_HITS = LLM_CACHE.labels('hit')
+CACHE_MISSES = LLM_CACHE.labels('miss')
+
+
+class _ComputeCancelled(Exception):
+    """Инициатор вычисления отменен: ожидающие не отменяются, а вычисляют сами"""
+
+
+class LLMCache:
+    """
+    Ограниченный LRU-кеш с TTL для результатов LLM.
+    Одновременные запросы с одинаковым ключом ждут один общий вызов.
+    Ошибки не кешируются. Если отменен тот, кто вычислял значение, ожидающие
+    не получают чужую отмену: один из них запускает вычисление заново.
+    """
+
+    def __init__(self, max_size: int = 5000, ttl: float = 24 * 3600,
+                 persist_path: str = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persist_path = persist_path
+        # ключ -> (значение, время истечения по time.time())
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+        if persist_path:
+            self.load()
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """Собирает ключ кеша из частей (текст, модель, версия промпта)"""
+        return '\x1f'.join(parts)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Возвращает значение из кеша или None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        value, expires_at = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        """Сохраняет значение и вытесняет самые старые записи сверх лимита"""
+        self._entries[key] = (value, time.time() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Возвращает значение из кеша или вычисляет его один раз для всех ожидающих"""
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            CACHE_HITS.inc()
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.hits += 1
+            CACHE_HITS.inc()
+            try:
+                return await asyncio.shield(pending)
+            except _ComputeCancelled:
+                return await self.get_or_compute(key, compute)
+
+        self.misses += 1
+        CACHE_MISSES.inc()
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except BaseException as e:
+            future.set_exception(_ComputeCancelled() if isinstance(e, asyncio.CancelledError) else e)
+            # Исключение уже получит инициатор; не шумим "never retrieved"
+            future.exception()
+            raise
+        else:
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика кеша"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+    def load(self):
+        """Загружает непросроченные записи из файла"""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+
+        try:
+            with open(self.persist_path, 'r', encoding='utf-8') as f:
+                rows = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Не удалось загрузить кеш LLM: {e}")
+            return
+
+        now = time.time()
+        for key, value, expires_at in rows[-self.max_size:]:
+            if expires_at > now:
+                self._entries[key] = (value, expires_at)
+
+        logger.info(f"💾 Кеш LLM загружен: {len(self._entries)} записей")
+
+    def save(self):
+        """Сохраняет кеш в файл (атомарно через временный файл)"""
+        if not self.persist_path:
+            return
+
+        rows = [[key, value, expires_at] for key, (value, expires_at) in self._entries.items()]
+        tmp_path = f"{self.persist_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(rows, f, ensure_ascii=False)
+            os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось сохранить кеш LLM: {e}")
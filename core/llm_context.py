@@ -0,0 +1,42 @@
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from core.state_manager import StateManager
+
+
+def prompt_version(*parts: str) -> str:
+    """Отпечаток шаблона промпта и модели: другой отпечаток - контекст недействителен"""
+    return f"{zlib.crc32(chr(31).join(parts).encode('utf-8')):08x}"
+
+
+class LLMContextSession:
+    """
+    Контекст Ollama (массив токенов из ответа /api/generate) одного пользователя
+    для одного шаблона промпта. Первый запрос отправляет инструкцию целиком;
+    следующие - только новую реплику с сохраненным контекстом, поэтому Ollama
+    не кодирует инструкцию заново. Контекст хранится в StateManager и сбрасывается,
+    если сменились шаблон или модель (version) или он вырос больше max_tokens.
+    """
+
+    def __init__(self, state_manager: StateManager, user_id: str, purpose: str, version: str,
+                 max_tokens: int = 1536):
+        self.state_manager = state_manager
+        self.user_id = user_id
+        self.purpose = purpose
+        self.version = version
+        self.max_tokens = max_tokens
+        self.reused = False
+
+    def request(self, instruction: str, turn: str) -> Tuple[str, Dict]:
+        """Промпт и дополнительные поля запроса (context) для очередной реплики"""
+        tokens = self.state_manager.get_llm_context(self.user_id, self.purpose, self.version)
+        self.reused = bool(tokens)
+        if tokens:
+            return turn, {'context': tokens}
+        return instruction + turn, {}
+
+    def save(self, tokens: Optional[List[int]]):
+        """Запоминает контекст из ответа; слишком длинный или пустой - сбрасывает"""
+        if not isinstance(tokens, list) or len(tokens) > self.max_tokens:
+            tokens = None
+        self.state_manager.set_llm_context(self.user_id, self.purpose, self.version, tokens or None)
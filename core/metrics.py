@@ -0,0 +1,273 @@
+import logging
+import math
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм, секунды: от правил NLU (микросекунды) до LLM (секунды)
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _CounterValue:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class _HistogramValue:
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # Последняя корзина - значения больше всех границ (+Inf)
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        """Одна операция bisect и два сложения: годится для горячего пути"""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class _Metric:
+    """Общая часть метрик с метками; значения по меткам создаются при первом обращении"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _new_value(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Значение для набора меток (его стоит получить заранее и держать в модуле)"""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}")
+        key = tuple(str(value) for value in values)
+        value = self._values.get(key)
+        if value is None:
+            value = self._values[key] = self._new_value()
+        return value
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Монотонный счетчик"""
+
+    kind = 'counter'
+
+    def _new_value(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value.value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными корзинами (накопительные суммы считаются при выдаче)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_value(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, value in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), value.counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(value.sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+GaugeSamples = Union[float, Dict[Tuple[str, ...], float]]
+
+
+class GaugeFunction(_Metric):
+    """
+    Показатель, который вычисляется при каждом запросе /metrics (размер очереди,
+    число контекстов): на горячем пути он ничего не стоит.
+    Функция возвращает число или словарь {значения меток: число}.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], GaugeSamples],
+                 labelnames: Iterable[str] = (), kind: str = 'gauge'):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        try:
+            samples = self.function()
+        except Exception as e:
+            logger.warning(f"⚠️ Метрика {self.name} не вычислена: {e}")
+            return []
+        if not isinstance(samples, dict):
+            samples = {(): samples}
+        lines = self.header()
+        for key, value in sorted(samples.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Набор метрик процесса; повторная регистрация имени заменяет метрику"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_function(self, name: str, documentation: str, function: Callable[[], GaugeSamples],
+                       labelnames: Iterable[str] = (), kind: str = 'gauge') -> GaugeFunction:
+        return self.register(GaugeFunction(name, documentation, function, labelnames, kind))
+
+    def render(self) -> str:
+        """Текстовый формат экспозиции Prometheus 0.0.4"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# Время этапов обработки сообщения
+STAGE_SECONDS = REGISTRY.histogram(
+    'agent_stage_seconds',
+    'Время этапа обработки сообщения, секунды',
+    ['stage']
+)
+INTENT_TIER = REGISTRY.counter(
+    'agent_intent_tier_total',
+    'Каким уровнем NLU определено намерение (rules, classifier, embeddings, llm, none)',
+    ['tier']
+)
+LLM_CACHE = REGISTRY.counter(
+    'agent_llm_cache_total',
+    'Обращения к кешу результатов LLM',
+    ['result']
+)
+LLM_ERRORS = REGISTRY.counter(
+    'agent_llm_errors_total',
+    'Ошибки запросов к Ollama (timeout, connection, http, unavailable)',
+    ['kind']
+)
+LLM_FALLBACKS = REGISTRY.counter(
+    'agent_llm_fallbacks_total',
+    'Ответы без LLM после ее ошибки или при разомкнутом выключателе',
+    ['component']
+)
+FLOWS = REGISTRY.counter(
+    'agent_flows_total',
+    'Сценарии диалога: начатые, завершенные и брошенные',
+    ['goal', 'outcome']
+)
+TOOL_CALLS = REGISTRY.counter(
+    'agent_tool_calls_total',
+    'Вызовы внешних инструментов',
+    ['tool', 'result']
+)
+
+
+def stage(name: str) -> _HistogramValue:
+    """Гистограмма этапа (получается один раз при импорте модуля, а не на каждое сообщение)"""
+    return STAGE_SECONDS.labels(name)
+
+
+class MetricsServer:
+    """HTTP-эндпоинт /metrics для Prometheus на отдельном локальном порту"""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY, host: str = "127.0.0.1", port: int = 9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        # Формирование текста - синхронный проход по метрикам без ожиданий,
+        # поэтому выдача согласована и не требует блокировок
+        return web.Response(body=self.registry.render().encode('utf-8'),
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except OSError as e:
+            logger.error(f"❌ Не удалось открыть порт метрик {self.host}:{self.port}: {e}")
+            await self.stop()
+            return
+        logger.info(f"📈 Метрики: http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
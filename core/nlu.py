@@ -1,144 +1,531 @@
-import requests
 import json
-import re
-from typing import Dict, Any, List
+import logging
+import os
+import sys
+import time
+import zlib
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # без numpy локальный классификатор недоступен
+    np = None
+
+from core.embedding_intent import EmbeddingIntentClassifier
+from core.entity_extractor import EntityExtractor
+from core.intent_matcher import IntentMatcher, normalize_text
+from core.llm_cache import LLMCache
+from core.llm_context import LLMContextSession, prompt_version
+from core.metrics import INTENT_TIER, LLM_FALLBACKS, stage
+from core.ollama_client import OllamaClient, OllamaError
+from core.tracing import TraceWriter, stage_done
+
+logger = logging.getLogger(__name__)
+
+# Гистограммы этапов NLU (метки привязываются один раз)
+RULE_NLU_SECONDS = stage('rule_nlu')
+CLASSIFIER_NLU_SECONDS = stage('classifier_nlu')
+EMBEDDING_NLU_SECONDS = stage('embedding_nlu')
+LLM_NLU_SECONDS = stage('llm_nlu')
+ENTITIES_SECONDS = stage('entities')
+NLU_FALLBACKS = LLM_FALLBACKS.labels('nlu')
+
+class LocalIntentClassifier:
+    """
+    Локальный классификатор намерений без сети: хешированные символьные n-граммы
+    и линейная (softmax) модель на NumPy. Обучается на JSONL-корпусе
+    {"text": ..., "intent": ...}, который пишет сам автоответчик.
+    Порог уверенности калибруется на отложенной выборке под заданную точность.
+    """
+    
+    def __init__(self, intents: List[str], weights=None, bias=None,
+                 threshold: float = 1.0, n_features: int = 2 ** 14, ngram_range: Tuple[int, int] = (2, 4)):
+        self.intents = list(intents)
+        self.n_features = n_features
+        self.ngram_range = tuple(ngram_range)
+        self.weights = weights if weights is not None else np.zeros((n_features, len(intents)), np.float32)
+        self.bias = bias if bias is not None else np.zeros(len(intents), np.float32)
+        self.threshold = threshold
+    
+    def _features(self, text: str) -> Tuple[Any, Any]:
+        """Индексы хешированных n-грамм и их L2-нормированные веса"""
+        padded = f" {' '.join(normalize_text(text).split())} "
+        counts: Dict[int, int] = {}
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(padded) - n + 1):
+                index = zlib.crc32(padded[i:i + n].encode('utf-8')) % self.n_features
+                counts[index] = counts.get(index, 0) + 1
+        
+        indices = np.fromiter(counts.keys(), np.int64, len(counts))
+        values = np.fromiter(counts.values(), np.float32, len(counts))
+        norm = np.linalg.norm(values)
+        return indices, values / norm if norm else values
+    
+    def predict_proba(self, text: str):
+        """Вероятности намерений для одного сообщения"""
+        indices, values = self._features(text)
+        logits = values @ self.weights[indices] + self.bias
+        logits = np.exp(logits - logits.max())
+        return logits / logits.sum()
+    
+    def predict(self, text: str) -> Tuple[str, float]:
+        """(намерение, вероятность); 'unknown' при вероятности ниже калиброванного порога"""
+        probabilities = self.predict_proba(text)
+        best = int(probabilities.argmax())
+        confidence = round(float(probabilities[best]), 3)
+        if confidence < self.threshold:
+            return 'unknown', confidence
+        return self.intents[best], confidence
+    
+    @staticmethod
+    def load_corpus(path: str) -> List[Tuple[str, str]]:
+        """Читает JSONL-корпус, пропуская битые строки и 'unknown'"""
+        examples = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                text, intent = row.get('text'), row.get('intent')
+                if text and intent and intent != 'unknown':
+                    examples.append((text, intent))
+        return examples
+    
+    @classmethod
+    def train(cls, examples: List[Tuple[str, str]], epochs: int = 30, learning_rate: float = 0.5,
+              l2: float = 1e-5, target_precision: float = 0.95, holdout: float = 0.2,
+              seed: int = 13, **kwargs) -> 'LocalIntentClassifier':
+        """Обучает модель мини-батчами и калибрует порог на отложенной части корпуса"""
+        intents = sorted({intent for _, intent in examples})
+        model = cls(intents, **kwargs)
+        rng = np.random.default_rng(seed)
+        order = rng.permutation(len(examples))
+        split = int(len(examples) * (1 - holdout)) if len(examples) >= 20 else len(examples)
+        train_rows = [examples[i] for i in order[:split]]
+        holdout_rows = [examples[i] for i in order[split:]]
+        
+        features = [model._features(text) for text, _ in train_rows]
+        labels = np.array([intents.index(intent) for _, intent in train_rows])
+        batch_size = 64
+        
+        for _ in range(epochs):
+            permutation = rng.permutation(len(features))
+            for start in range(0, len(features), batch_size):
+                batch = permutation[start:start + batch_size]
+                # Разреженный батч: все n-граммы подряд и номер строки для каждой
+                indices = np.concatenate([features[row][0] for row in batch])
+                values = np.concatenate([features[row][1] for row in batch])
+                rows = np.repeat(np.arange(len(batch)), [len(features[row][0]) for row in batch])
+                
+                logits = np.tile(model.bias, (len(batch), 1))
+                np.add.at(logits, rows, model.weights[indices] * values[:, None])
+                probabilities = np.exp(logits - logits.max(axis=1, keepdims=True))
+                probabilities /= probabilities.sum(axis=1, keepdims=True)
+                probabilities[np.arange(len(batch)), labels[batch]] -= 1.0
+                
+                grad_w = np.zeros_like(model.weights)
+                np.add.at(grad_w, indices, probabilities[rows] * values[:, None])
+                model.weights -= learning_rate * (grad_w / len(batch) + l2 * model.weights)
+                model.bias -= learning_rate * probabilities.mean(axis=0)
+        
+        model.threshold = model._calibrate(holdout_rows or train_rows, target_precision)
+        return model
+    
+    def _calibrate(self, rows: List[Tuple[str, str]], target_precision: float) -> float:
+        """Наименьший порог, при котором точность предсказаний выше порога не ниже целевой"""
+        scored = []
+        for text, intent in rows:
+            probabilities = self.predict_proba(text)
+            best = int(probabilities.argmax())
+            scored.append((float(probabilities[best]), self.intents[best] == intent))
+        
+        scored.sort(reverse=True)
+        threshold, correct = 1.0, 0
+        for count, (confidence, is_correct) in enumerate(scored, 1):
+            correct += is_correct
+            if correct / count >= target_precision:
+                threshold = confidence
+        return threshold
+    
+    def save(self, path: str):
+        """Сохраняет модель в .npz"""
+        np.savez_compressed(
+            path, weights=self.weights, bias=self.bias, threshold=self.threshold,
+            intents=np.array(self.intents), ngram_range=np.array(self.ngram_range)
+        )
+    
+    @classmethod
+    def load(cls, path: str) -> 'LocalIntentClassifier':
+        """Загружает модель из .npz"""
+        data = np.load(path)
+        return cls(
+            [str(intent) for intent in data['intents']],
+            weights=data['weights'], bias=data['bias'], threshold=float(data['threshold']),
+            n_features=data['weights'].shape[0], ngram_range=tuple(int(n) for n in data['ngram_range'])
+        )
+
 
 class NLUModule:
     """Улучшенный модуль понимания естественного языка"""
     
-    def __init__(self, ollama_url: str = "http://localhost:11434", model: str = "phi"):
+    # Ключевые слова намерений; "*" в конце - совпадение по основе слова
+    DEFAULT_INTENT_KEYWORDS = {
+        'express_interest': ['хочу', 'хотим', 'интерес*', 'расскаж*', 'покаж*', 'подробн*'],
+        'ask_about_product': ['работ*', 'делаешь', 'умеешь', 'возможност*', 'функци*', 'что ты'],
+        'request_price': ['цен*', 'стоимост*', 'сколько стоит', 'а сколько', 'прайс*', 'тариф*'],
+        'schedule_meeting': ['встреч*', 'звонок', 'созвон*', 'демо*', 'запис*'],
+        'decline_offer': ['не интерес*', 'не надо', 'не нужно', 'отказ*', 'нет спасибо', 'не хочу'],
+        'request_info': ['информаци*', 'контакт*', 'связат*', 'связь', 'поддержк*'],
+        'greeting': ['привет*', 'здравств*', 'добрый', 'доброе', 'hi', 'hello'],
+        'thanks': ['спасибо', 'благодар*'],
+        'goodbye': ['пока', 'до свидания', 'выход']
+    }
+    
+    # Меняется при правке промпта, чтобы не брать из кеша старые ответы
+    INTENT_PROMPT_VERSION = "intent-v2"
+    INTENT_INSTRUCTION = """Определи основное намерение каждого сообщения пользователя из списка:
+- greeting (приветствие)
+- express_interest (проявил интерес)
+- ask_about_product (спросил о продукте/работе)
+- request_price (запросил цену)
+- schedule_meeting (хочет встретиться/записаться)
+- request_info (запросил информацию)
+- thanks (поблагодарил)
+- goodbye (попрощался)
+- unknown (не понятно)
+
+Ответь ТОЛЬКО одним словом из списка выше.
+"""
+    STRUCTURED_PROMPT_VERSION = "structured-v2"
+    
+    # Режимы LLM-уровня: "intent" - только намерение, "structured" - намерение и слоты одним JSON
+    LLM_MODES = ('intent', 'structured')
+    
+    LLM_CONFIDENCE = 0.8
+    UNKNOWN_CONFIDENCE = 0.3
+    
+    def __init__(self, ollama_url: str = "http://localhost:11434", model: str = "phi",
+                 client: OllamaClient = None, llm_timeout: float = 10.0,
+                 intent_keywords: Dict[str, List[str]] = None,
+                 rule_confidence_threshold: float = 0.4,
+                 llm_cache: LLMCache = None,
+                 entity_extractor: EntityExtractor = None,
+                 llm_mode: str = "intent",
+                 intents: List[str] = None,
+                 embedding_classifier: EmbeddingIntentClassifier = None,
+                 local_classifier: LocalIntentClassifier = None,
+                 corpus_writer: TraceWriter = None,
+                 state_manager=None,
+                 context_max_tokens: int = 1536):
         self.ollama_url = ollama_url
         self.model = model
-        self.intent_keywords = {
-            'express_interest': ['хочу', 'интерес', 'интересно', 'интересует', 'расскажи', 'покажи', 'подробнее'],
-            'ask_about_product': ['работа', 'делаешь', 'умеешь', 'возможности', 'функции', 'что ты'],
-            'request_price': ['цена', 'стоимость', 'сколько стоит', 'прайс', 'тариф'],
-            'schedule_meeting': ['встреча', 'звонок', 'созвон', 'демо', 'демонстрация', 'запись', 'записаться'],
-            'decline_offer': ['не интересно', 'не надо', 'отказ', 'нет спасибо', 'не хочу'],
-            'request_info': ['информация', 'контакты', 'связаться', 'связь', 'поддержка']
-        }
+        # Общий асинхронный клиент: один пул соединений на все диалоги
+        self.client = client or OllamaClient(ollama_url, model, timeout=llm_timeout)
+        self.llm_timeout = llm_timeout
+        self.intent_keywords = intent_keywords or self.DEFAULT_INTENT_KEYWORDS
+        # Таблица компилируется один раз: проход по тексту O(len(text))
+        self.intent_matcher = IntentMatcher(self.intent_keywords)
+        self.rule_confidence_threshold = rule_confidence_threshold
+        self.llm_cache = llm_cache or LLMCache()
+        self.entity_extractor = entity_extractor or EntityExtractor()
+        
+        if llm_mode not in self.LLM_MODES:
+            raise ValueError(f"Неизвестный режим NLU: {llm_mode}")
+        self.llm_mode = llm_mode
+        self.embedding_classifier = embedding_classifier
+        self.local_classifier = local_classifier
+        # Корпус для обучения локального классификатора: сообщение + итоговое намерение.
+        # Пишется фоновой задачей пачками, event loop не ждет диска
+        self.corpus_writer = corpus_writer
+        # Контексты Ollama по пользователям: инструкция кодируется один раз на диалог
+        self.state_manager = state_manager
+        self.context_max_tokens = context_max_tokens
+        self.intents = self._collect_intents(intents)
+        self._prepare_structured_request()
     
-    def extract_intent_and_entities(self, text: str, context: Dict = None) -> Dict:
+    async def prepare(self):
+        """Подготовка при запуске: эмбеддинги примеров намерений (один запрос к Ollama)"""
+        if self.embedding_classifier and self.embedding_classifier.available:
+            await self.embedding_classifier.prepare()
+    
+    async def extract_intent_and_entities(self, text: str, context: Dict = None,
+                                          user_id: str = None) -> Dict:
         """
         Определяет намерение и извлекает сущности
         Используем комбинацию правил и LLM
         """
-        text_lower = text.lower().strip()
-        
         # 1. Сначала проверяем по ключевым словам (быстро)
-        detected_intent = self._rule_based_intent(text_lower)
+        started = time.perf_counter()
+        detected_intent, confidence = self._rule_based_intent(text)
+        source = 'rules'
+        stage_done(RULE_NLU_SECONDS, 'rule_nlu', started)
+        
+        # 2. Локальный классификатор: микросекунды, без сети
+        if confidence < self.rule_confidence_threshold and self.local_classifier:
+            started = time.perf_counter()
+            local_intent, local_confidence = self.local_classifier.predict(text)
+            if local_intent != 'unknown':
+                detected_intent, confidence, source = local_intent, local_confidence, 'classifier'
+            stage_done(CLASSIFIER_NLU_SECONDS, 'classifier_nlu', started)
         
-        # 2. Если не нашли или уверенность низкая, используем LLM
-        if detected_intent == 'unknown':
-            detected_intent = self._llm_based_intent(text)
+        # 3. Затем сходство эмбеддингов с примерами фраз (один запрос без генерации)
+        if confidence < self.rule_confidence_threshold and self.embedding_classifier:
+            started = time.perf_counter()
+            embedding_result = await self._embedding_based_intent(text)
+            if embedding_result:
+                (detected_intent, confidence), source = embedding_result, 'embeddings'
+            stage_done(EMBEDDING_NLU_SECONDS, 'embedding_nlu', started)
+        
+        # 4. Если не нашли или уверенность низкая, используем LLM.
+        # При разомкнутом выключателе Ollama этот шаг пропускается сразу, без ожидания таймаута
+        llm_entities = {}
+        if confidence < self.rule_confidence_threshold and not self.client.available:
+            NLU_FALLBACKS.inc()
+            if detected_intent == 'unknown':
+                confidence, source = self.UNKNOWN_CONFIDENCE, 'none'
+        elif confidence < self.rule_confidence_threshold:
+            started = time.perf_counter()
+            if self.llm_mode == 'structured':
+                llm_intent, llm_confidence, llm_entities = await self._structured_llm_nlu(text, user_id)
+            else:
+                llm_intent, llm_confidence = await self._llm_based_intent(text, user_id), self.LLM_CONFIDENCE
+            stage_done(LLM_NLU_SECONDS, 'llm_nlu', started)
+            
+            if llm_intent != 'unknown':
+                detected_intent, confidence, source = llm_intent, llm_confidence, 'llm'
+            elif detected_intent == 'unknown':
+                confidence, source = self.UNKNOWN_CONFIDENCE, 'none'
         
-        # 3. Извлекаем сущности
-        entities = self._extract_entities(text)
+        INTENT_TIER.labels(source).inc()
+        if source != 'classifier' and detected_intent != 'unknown':
+            self._log_example(text, detected_intent, confidence, source)
+        
+        # 5. Извлекаем сущности (один проход, все совпадения с позициями);
+        # значения из регулярок надежнее и перекрывают значения от LLM
+        started = time.perf_counter()
+        entity_matches = self.entity_extractor.extract(text)
+        entities = {**llm_entities, **self.entity_extractor.extract_slots(text, entity_matches)}
+        stage_done(ENTITIES_SECONDS, 'entities', started)
         
         return {
             "intent": detected_intent,
             "entities": entities,
-            "confidence": 0.8 if detected_intent != 'unknown' else 0.3
+            "entity_matches": entity_matches,
+            "confidence": confidence,
+            "source": source
         }
     
-    def _rule_based_intent(self, text: str) -> str:
-        """Определение намерения по правилам"""
-        for intent, keywords in self.intent_keywords.items():
-            for keyword in keywords:
-                if keyword in text:
-                    return intent
-        
-        # Специальные случаи
-        if any(word in text for word in ['привет', 'здравствуй', 'добрый', 'hi', 'hello']):
-            return 'greeting'
-        elif any(word in text for word in ['спасибо', 'благодарю']):
-            return 'thanks'
-        elif any(word in text for word in ['пока', 'до свидания', 'выход']):
-            return 'goodbye'
+    def _rule_based_intent(self, text: str) -> Tuple[str, float]:
+        """Определение намерения по правилам: (намерение, уверенность)"""
+        return self.intent_matcher.match(text)
+    
+    def _log_example(self, text: str, intent: str, confidence: float, source: str):
+        """Ставит размеченный пример в очередь записи JSONL-корпуса"""
+        if self.corpus_writer is not None:
+            self.corpus_writer.put({"text": text, "intent": intent, "confidence": confidence, "source": source})
+    
+    async def _embedding_based_intent(self, text: str) -> Optional[Tuple[str, float]]:
+        """Определение намерения по эмбеддингам; None - уровень отключен или ответ неоднозначен"""
+        if not self.embedding_classifier or not self.embedding_classifier.available:
+            return None
+        if not self.client.available:
+            return None
         
-        return 'unknown'
+        try:
+            return await self.embedding_classifier.classify(text)
+        except OllamaError as e:
+            logger.warning(f"NLU Embedding Error: {e}")
+        
+        return None
+    
+    def _context_session(self, user_id: Optional[str], purpose: str,
+                         *template: str) -> Optional[LLMContextSession]:
+        """Сессия контекста Ollama пользователя; версия учитывает шаблон и модель"""
+        if self.state_manager is None or user_id is None:
+            return None
+        return LLMContextSession(self.state_manager, user_id, purpose,
+                                 prompt_version(self.model, *template),
+                                 max_tokens=self.context_max_tokens)
     
-    def _llm_based_intent(self, text: str) -> str:
-        """Определение намерения через LLM"""
+    async def _generate(self, session: Optional[LLMContextSession], instruction: str, turn: str,
+                        **kwargs: Any) -> Dict:
+        """Запрос к LLM с повторным использованием контекста пользователя (если есть)"""
+        if session is None:
+            return await self.client.generate(instruction + turn, **kwargs)
+        prompt, extra = session.request(instruction, turn)
+        result = await self.client.generate(prompt, **kwargs, **extra)
+        session.save(result.get('context'))
+        return result
+    
+    async def _llm_based_intent(self, text: str, user_id: str = None) -> str:
+        """Определение намерения через LLM (с кешем по нормализованному тексту)"""
+        key = LLMCache.make_key(self._cache_text(text), self.model, self.INTENT_PROMPT_VERSION)
+        session = self._context_session(user_id, 'intent', self.INTENT_PROMPT_VERSION, self.INTENT_INSTRUCTION)
         try:
-            prompt = f"""
-            Пользователь написал: "{text}"
-            
-            Определи основное намерение из списка:
-            - greeting (приветствие)
-            - express_interest (проявил интерес)
-            - ask_about_product (спросил о продукте/работе)
-            - request_price (запросил цену)
-            - schedule_meeting (хочет встретиться/записаться)
-            - request_info (запросил информацию)
-            - thanks (поблагодарил)
-            - goodbye (попрощался)
-            - unknown (не понятно)
-            
-            Ответь ТОЛЬКО одним словом из списка выше.
-            """
-            
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {"temperature": 0.3}
-                },
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                intent = result.get('response', 'unknown').strip().lower()
-                return intent if intent in ['greeting', 'express_interest', 'ask_about_product', 
-                                          'request_price', 'schedule_meeting', 'request_info',
-                                          'thanks', 'goodbye', 'unknown'] else 'unknown'
-                
-        except Exception as e:
-            print(f"NLU LLM Error: {e}")
+            return await self.llm_cache.get_or_compute(key, lambda: self._classify_with_llm(text, session))
+        except OllamaError as e:
+            logger.warning(f"NLU LLM Error: {e}")
+            NLU_FALLBACKS.inc()
             
         return 'unknown'
     
+    @staticmethod
+    def _cache_text(text: str) -> str:
+        """Нормализует текст для ключа кеша: регистр, ё, пробелы, концевая пунктуация"""
+        return ' '.join(normalize_text(text).split()).strip('.!?,;:)( ')
+    
+    async def _classify_with_llm(self, text: str, session: LLMContextSession = None) -> str:
+        """Запрос намерения у LLM; ошибки Ollama пробрасываются (и не кешируются)"""
+        result = await self._generate(
+            session,
+            self.INTENT_INSTRUCTION,
+            f'\nСообщение: "{text}"\nНамерение:',
+            options={"temperature": 0.3},
+            timeout=self.llm_timeout
+        )
+        
+        intent = result.get('response', 'unknown').strip().lower()
+        return intent if intent in ['greeting', 'express_interest', 'ask_about_product', 
+                                  'request_price', 'schedule_meeting', 'request_info',
+                                  'thanks', 'goodbye', 'unknown'] else 'unknown'
+    
+    def _collect_intents(self, intents: List[str] = None) -> List[str]:
+        """Список допустимых намерений: из конфига плюс известные по ключевым словам"""
+        collected = list(intents or [])
+        for intent in list(self.intent_keywords) + ['unknown']:
+            if intent not in collected:
+                collected.append(intent)
+        return collected
+    
+    def _prepare_structured_request(self):
+        """
+        Инструкция и схема структурного режима. Они зависят от намерений и слотов конфига,
+        поэтому их отпечаток входит в ключ кеша (общего для нескольких агентов)
+        """
+        self._structured_prompt, self._structured_schema = self._build_structured_request()
+        fingerprint = zlib.crc32(json.dumps([self._structured_prompt, self._structured_schema],
+                                            ensure_ascii=False, sort_keys=True).encode('utf-8'))
+        self._structured_cache_version = f"{self.STRUCTURED_PROMPT_VERSION}:{fingerprint:08x}"
+    
+    def _build_structured_request(self) -> Tuple[str, Dict]:
+        """Собирает (один раз) инструкцию и JSON-схему ответа для структурного режима"""
+        slots = self.entity_extractor.slots
+        instruction = (
+            "Ты модуль понимания сообщений для чат-бота.\n"
+            f"Намерения: {', '.join(self.intents)}.\n"
+            f"Слоты: {', '.join(slots)}.\n"
+            "Определи одно намерение, уверенность от 0 до 1 и значения только тех слотов, "
+            "которые явно указаны в сообщении. Ответь только JSON."
+        )
+        schema = {
+            "type": "object",
+            "properties": {
+                "intent": {"type": "string", "enum": self.intents},
+                "confidence": {"type": "number"},
+                "slots": {
+                    "type": "object",
+                    "properties": {slot: {"type": "string"} for slot in slots}
+                }
+            },
+            "required": ["intent", "confidence", "slots"]
+        }
+        return instruction, schema
+    
+    async def _structured_llm_nlu(self, text: str, user_id: str = None) -> Tuple[str, float, Dict]:
+        """Намерение, уверенность и слоты одним JSON-запросом к LLM (с кешем)"""
+        key = LLMCache.make_key(self._cache_text(text), self.model, self._structured_cache_version)
+        session = self._context_session(user_id, 'structured', self._structured_cache_version)
+        try:
+            result = await self.llm_cache.get_or_compute(key, lambda: self._structured_with_llm(text, session))
+            return result['intent'], result['confidence'], dict(result['slots'])
+        except OllamaError as e:
+            logger.warning(f"NLU LLM Error: {e}")
+            NLU_FALLBACKS.inc()
+        
+        return 'unknown', self.UNKNOWN_CONFIDENCE, {}
+    
+    async def _structured_with_llm(self, text: str, session: LLMContextSession = None) -> Dict:
+        """Запрос с format=JSON-схема; ответ проверяется и приводится к ожидаемым типам"""
+        result = await self._generate(
+            session,
+            self._structured_prompt,
+            f"\nСообщение: {json.dumps(text, ensure_ascii=False)}",
+            options={"temperature": 0, "num_predict": 200},
+            timeout=self.llm_timeout,
+            format=self._structured_schema
+        )
+        
+        try:
+            payload = json.loads(result.get('response', ''))
+        except ValueError as e:
+            raise OllamaError(f"Некорректный JSON от LLM: {e}") from e
+        
+        return self._coerce_structured(payload)
+    
+    def _coerce_structured(self, payload: Any) -> Dict:
+        """Приводит ответ LLM к виду {intent, confidence, slots}, отбрасывая лишнее"""
+        if not isinstance(payload, dict):
+            raise OllamaError("Ответ LLM не является JSON-объектом")
+        
+        intent = str(payload.get('intent', 'unknown')).strip().lower()
+        if intent not in self.intents:
+            intent = 'unknown'
+        
+        try:
+            confidence = min(max(float(payload.get('confidence', 0)), 0.0), 1.0)
+        except (TypeError, ValueError):
+            confidence = self.LLM_CONFIDENCE
+        
+        slots = {}
+        raw_slots = payload.get('slots')
+        if isinstance(raw_slots, dict):
+            for slot, value in raw_slots.items():
+                if slot in self._structured_schema['properties']['slots']['properties'] and value:
+                    normalized = self.entity_extractor.normalize_slot(slot, value)
+                    if normalized:
+                        slots[slot] = normalized
+        
+        return {'intent': intent, 'confidence': confidence, 'slots': slots}
+    
+    async def close(self):
+        """Освобождает HTTP-сессию LLM клиента и сохраняет кеш"""
+        self.llm_cache.save()
+        await self.client.close()
+    
     def _extract_entities(self, text: str) -> Dict:
-        """Извлечение сущностей из текста"""
-        entities = {}
-        
-        # Имя (слова с заглавной буквы, кроме начала предложения)
-        name_pattern = r'(?:меня зовут|мое имя|зовут)\s+([А-Я][а-я]+)'
-        name_match = re.search(name_pattern, text, re.IGNORECASE)
-        if name_match:
-            entities['name'] = name_match.group(1)
-        
-        # Email
-        email_pattern = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
-        email_match = re.search(email_pattern, text)
-        if email_match:
-            entities['email'] = email_match.group()
-        
-        # Компания
-        company_pattern = r'(?:компания|работаю в|из)\s+([«"]?[А-ЯA-Z][^,.!?]+[»"]?)'
-        company_match = re.search(company_pattern, text, re.IGNORECASE)
-        if company_match:
-            entities['company'] = company_match.group(1)
-        
-        # Дата и время
-        date_pattern = r'(\d{1,2}[./-]\d{1,2}[./-]\d{2,4})|(завтра|послезавтра|понедельник|вторник|среда|четверг|пятница|суббота|воскресенье)'
-        date_match = re.search(date_pattern, text, re.IGNORECASE)
-        if date_match:
-            entities['date'] = date_match.group()
-        
-        # Время
-        time_pattern = r'(\d{1,2}:\d{2})|(утром|днем|вечером|ночью|после обеда)'
-        time_match = re.search(time_pattern, text, re.IGNORECASE)
-        if time_match:
-            entities['time'] = time_match.group()
-        
-        # Телефон
-        phone_pattern = r'[\+]?[78][\s\(]?\d{3}[\)\s]?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}'
-        phone_match = re.search(phone_pattern, text)
-        if phone_match:
-            entities['phone'] = phone_match.group()
-        
-        return entities
\ No newline at end of file
+        """Извлечение сущностей из текста: слот -> нормализованное значение"""
+        return self.entity_extractor.extract_slots(text)
+
+
+def main(argv: List[str] = None):
+    """
+    Обучение локального классификатора:
+    python -m core.nlu train data/nlu_corpus.jsonl models/intent_classifier.npz
+    """
+    argv = argv if argv is not None else sys.argv[1:]
+    if len(argv) != 3 or argv[0] != 'train':
+        print(main.__doc__)
+        return 1
+    if np is None:
+        print("❌ Для обучения нужен numpy")
+        return 1
+    
+    _, corpus_path, model_path = argv
+    examples = LocalIntentClassifier.load_corpus(corpus_path)
+    if not examples:
+        print(f"❌ В корпусе {corpus_path} нет размеченных примеров")
+        return 1
+    
+    classifier = LocalIntentClassifier.train(examples)
+    os.makedirs(os.path.dirname(model_path) or '.', exist_ok=True)
+    classifier.save(model_path)
+    print(f"✅ Обучено на {len(examples)} примерах, намерений: {len(classifier.intents)}, "
+          f"порог уверенности: {classifier.threshold:.3f}")
+    print(f"💾 Модель сохранена в {model_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
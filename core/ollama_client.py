@@ -0,0 +1,261 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Any, AsyncIterator, List, Optional
+
+import aiohttp
+
+from core.metrics import LLM_ERRORS
+from core.ollama_health import OllamaHealth
+from core.tracing import current_trace
+
+logger = logging.getLogger(__name__)
+
+TIMEOUTS = LLM_ERRORS.labels('timeout')
+CONNECTION_ERRORS = LLM_ERRORS.labels('connection')
+HTTP_ERRORS = LLM_ERRORS.labels('http')
+REJECTED = LLM_ERRORS.labels('unavailable')
+
+
+class OllamaError(Exception):
+    """Ошибка обращения к Ollama (таймаут, HTTP-статус, сеть)"""
+
+
+class OllamaUnavailable(OllamaError):
+    """Выключатель разомкнут: запрос не отправлялся"""
+
+
+class OllamaRequestError(OllamaError):
+    """
+    Ollama ответила 4xx (модель не загружена, неверный запрос): сервер работает,
+    поэтому это не сбой для выключателя
+    """
+
+
+class OllamaClient:
+    """
+    Асинхронный клиент Ollama с общей keep-alive сессией.
+    keep_alive (например "30m") передается в каждом запросе, чтобы модель
+    оставалась загруженной в память между сообщениями.
+    health учитывает успехи и ошибки запросов; при разомкнутом выключателе
+    запросы сразу завершаются OllamaUnavailable вместо ожидания таймаута.
+    """
+
+    def __init__(self, base_url: str = "http://localhost:11434", model: str = "phi",
+                 timeout: float = 10.0, max_connections: int = 20, keep_alive: str = None,
+                 health: OllamaHealth = None):
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.keep_alive = keep_alive
+        self.health = health or OllamaHealth(name=f"Ollama {self.base_url}")
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def available(self) -> bool:
+        """Выключатель замкнут: есть смысл обращаться к LLM"""
+        return self.health.available
+
+    async def start(self):
+        """Запускает фоновую проверку доступности"""
+        self.health.start(self.probe)
+
+    async def probe(self, timeout: float = 2.0) -> bool:
+        """Легкая проверка: GET /api/tags"""
+        session = await self._get_session()
+        try:
+            async with session.get(f"{self.base_url}/api/tags",
+                                   timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                return response.status == 200
+        except (asyncio.TimeoutError, aiohttp.ClientError):
+            return False
+
+    def _trace(self, path: str, started: float, payload: Dict, result: Dict = None, error: str = None):
+        """Этап запроса к Ollama в трассе сообщения: сервер, модель и число токенов"""
+        trace = current_trace()
+        if trace is None:
+            return
+        attrs = {'backend': self.base_url, 'path': path, 'model': payload.get('model')}
+        if result and 'eval_count' in result:
+            attrs['prompt_tokens'] = result.get('prompt_eval_count', 0)
+            attrs['response_tokens'] = result['eval_count']
+        if error:
+            attrs['error'] = error
+        trace.add_span('ollama', started, time.perf_counter(), **attrs)
+    
+    def _check_circuit(self, path: str):
+        if not self.health.allow():
+            REJECTED.inc()
+            raise OllamaUnavailable(f"{self.health.name} недоступен, {path} не вызывался")
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Возвращает общую сессию, создавая её при первом обращении"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                keepalive_timeout=60
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def _http_error(self, path: str, status: int):
+        """Ответ не 200: 5xx - сбой сервера, 4xx - ошибка запроса (в выключатель не идет)"""
+        if 400 <= status < 500:
+            logger.warning(f"⚠️ {self.base_url}{path}: HTTP {status} (проверьте модель и запрос)")
+            raise OllamaRequestError(f"HTTP {status} от {path}")
+        raise OllamaError(f"HTTP {status} от {path}")
+
+    async def post(self, path: str, payload: Dict, timeout: float = None) -> Dict:
+        """
+        POST-запрос к Ollama с дедлайном на весь запрос.
+        Отмена корутины (CancelledError) прерывает HTTP-запрос и пробрасывается дальше.
+        """
+        self._check_circuit(path)
+        session = await self._get_session()
+        deadline = aiohttp.ClientTimeout(total=timeout or self.timeout)
+        started = time.perf_counter()
+
+        try:
+            async with session.post(f"{self.base_url}{path}", json=payload,
+                                    timeout=deadline) as response:
+                if response.status != 200:
+                    self._http_error(path, response.status)
+                result = await response.json(content_type=None)
+                if not isinstance(result, dict):
+                    raise ValueError(f"ожидался объект JSON, получен {type(result).__name__}")
+        except asyncio.TimeoutError as e:
+            self.health.record_failure('таймаут')
+            TIMEOUTS.inc()
+            self._trace(path, started, payload, error='timeout')
+            raise OllamaError(f"Таймаут {deadline.total}с для {path}") from e
+        except aiohttp.ClientError as e:
+            self.health.record_failure('соединение')
+            CONNECTION_ERRORS.inc()
+            self._trace(path, started, payload, error='connection')
+            raise OllamaError(f"Ошибка соединения с {path}: {e}") from e
+        except ValueError as e:
+            # Вместо ответа Ollama пришло что-то другое (страница прокси, обрезанный ответ)
+            self.health.record_failure('ответ')
+            HTTP_ERRORS.inc()
+            self._trace(path, started, payload, error='invalid')
+            raise OllamaError(f"Некорректный ответ {path}: {e}") from e
+        except OllamaRequestError:
+            HTTP_ERRORS.inc()
+            self._trace(path, started, payload, error='http')
+            raise
+        except OllamaError:
+            self.health.record_failure('HTTP')
+            HTTP_ERRORS.inc()
+            self._trace(path, started, payload, error='http')
+            raise
+        except asyncio.CancelledError:
+            # Проигравший дублирующий запрос пула тоже виден в трассе
+            self._trace(path, started, payload, error='cancelled')
+            raise
+        self.health.record_success(time.perf_counter() - started)
+        self._trace(path, started, payload, result)
+        return result
+
+    async def generate(self, prompt: str, options: Dict = None, timeout: float = None,
+                       **extra: Any) -> Dict:
+        """Вызывает /api/generate без стриминга и возвращает JSON-ответ"""
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "options": options or {}
+        }
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        payload.update(extra)
+        return await self.post("/api/generate", payload, timeout=timeout)
+
+    async def generate_stream(self, prompt: str, options: Dict = None, timeout: float = None,
+                              **extra: Any) -> AsyncIterator[Dict]:
+        """
+        Вызывает /api/generate со стримингом и отдает части ответа по мере генерации.
+        Если перестать читать (aclose генератора), соединение закрывается и Ollama прекращает генерацию.
+        """
+        self._check_circuit("/api/generate")
+        session = await self._get_session()
+        deadline = aiohttp.ClientTimeout(total=timeout or self.timeout)
+        started = time.perf_counter()
+        first_chunk = True
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "options": options or {}
+        }
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        payload.update(extra)
+        final, error = None, None
+
+        try:
+            async with session.post(f"{self.base_url}/api/generate", json=payload,
+                                    timeout=deadline) as response:
+                if response.status != 200:
+                    HTTP_ERRORS.inc()
+                    error = 'http'
+                    if response.status >= 500:
+                        self.health.record_failure('HTTP')
+                    self._http_error("/api/generate", response.status)
+                async for line in response.content:
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    if 'error' in chunk:
+                        error = 'generation'
+                        raise OllamaError(f"Ошибка генерации: {chunk['error']}")
+                    if first_chunk:
+                        # Для потока важна задержка до первой части ответа
+                        first_chunk = False
+                        self.health.record_success(time.perf_counter() - started)
+                    if chunk.get('done'):
+                        final = chunk
+                    yield chunk
+                    if final is not None:
+                        return
+        except asyncio.TimeoutError as e:
+            if first_chunk:
+                self.health.record_failure('таймаут')
+            TIMEOUTS.inc()
+            error = 'timeout'
+            raise OllamaError(f"Таймаут {deadline.total}с для /api/generate") from e
+        except aiohttp.ClientError as e:
+            if first_chunk:
+                self.health.record_failure('соединение')
+            CONNECTION_ERRORS.inc()
+            error = 'connection'
+            raise OllamaError(f"Ошибка соединения с /api/generate: {e}") from e
+        except ValueError as e:
+            error = 'invalid'
+            raise OllamaError(f"Некорректная строка потока /api/generate: {e}") from e
+        finally:
+            # Поток, закрытый потребителем до конца (бюджет ответа), отмечается как stopped
+            self._trace("/api/generate", started, payload, final,
+                        error or (None if final is not None else 'stopped'))
+
+    async def embed(self, texts: List[str], model: str = None, timeout: float = None) -> List[List[float]]:
+        """Вызывает /api/embed и возвращает векторы для списка текстов"""
+        payload = {"model": model or self.model, "input": texts}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        result = await self.post("/api/embed", payload, timeout=timeout)
+        embeddings = result.get("embeddings")
+        if not isinstance(embeddings, list) or len(embeddings) != len(texts):
+            raise OllamaError("Некорректный ответ /api/embed")
+        return embeddings
+
+    def stats(self) -> Dict:
+        return {'backends': {self.base_url: dict(self.health.stats(), in_flight=0)}}
+
+    async def close(self):
+        """Останавливает проверку доступности и закрывает HTTP-сессию"""
+        await self.health.stop()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
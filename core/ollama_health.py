@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def percentile_of(values: Iterable[float], percentile: float) -> Optional[float]:
+    """Перцентиль по ближайшему рангу (None для пустых данных)"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(percentile / 100 * len(ordered)))]
+
+
+class OllamaHealth:
+    """
+    Здоровье одного сервера Ollama и автоматический выключатель (circuit breaker).
+    Держит окно последних запросов (успех, задержка). Выключатель размыкается после
+    failure_threshold ошибок подряд или при доле ошибок в окне не ниже error_rate;
+    пока он разомкнут, запросы к LLM не отправляются вовсе. Фоновая проверка
+    /api/tags замыкает его, как только сервер снова отвечает.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+
+    def __init__(self, name: str = "ollama", failure_threshold: int = 3, error_rate: float = 0.5,
+                 window: int = 20, min_calls: int = 10, probe_interval: float = 5.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.probe_interval = probe_interval
+        self._window = deque(maxlen=window)
+        self._latencies = deque(maxlen=window)
+
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._probe_task: asyncio.Task = None
+
+    @property
+    def available(self) -> bool:
+        return self.state == self.CLOSED
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос; отказ учитывается в статистике"""
+        if self.state == self.CLOSED:
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self, latency: float):
+        self._window.append(True)
+        self._latencies.append(latency)
+        self.consecutive_failures = 0
+        if self.state == self.OPEN:
+            self._close()
+
+    def record_failure(self, reason: str = ''):
+        self._window.append(False)
+        self.consecutive_failures += 1
+        if self.state == self.OPEN:
+            return
+        failures = self._window.count(False)
+        if (self.consecutive_failures >= self.failure_threshold
+                or (len(self._window) >= self.min_calls
+                    and failures / len(self._window) >= self.error_rate)):
+            self._open(reason)
+
+    def _open(self, reason: str):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        logger.warning(f"🔌 {self.name}: выключатель разомкнут ({self.consecutive_failures} ошибок подряд"
+                       f"{': ' + reason if reason else ''}), ответы только без LLM")
+
+    def _close(self):
+        downtime = time.monotonic() - self.opened_at if self.opened_at else 0.0
+        self.state = self.CLOSED
+        self.opened_at = None
+        self._window.clear()
+        logger.info(f"✅ {self.name}: снова доступен (простой {downtime:.1f} с)")
+
+    def latencies(self) -> List[float]:
+        """Задержки успешных запросов в окне"""
+        return list(self._latencies)
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Перцентиль задержки успешных запросов в окне (None, если данных нет)"""
+        return percentile_of(self._latencies, percentile)
+
+    def start(self, probe: Callable[[], Awaitable[bool]]):
+        """Запускает фоновую проверку: probe() -> True, если сервер отвечает"""
+        if self._probe_task is None and self.probe_interval > 0:
+            self._probe_task = asyncio.create_task(self._probe_loop(probe))
+
+    async def _probe_loop(self, probe: Callable[[], Awaitable[bool]]):
+        while True:
+            await asyncio.sleep(self.probe_interval)
+            started = time.monotonic()
+            try:
+                healthy = await probe()
+            except Exception as e:
+                logger.debug(f"{self.name}: проверка не удалась: {e}")
+                healthy = False
+            if healthy:
+                if self.state == self.OPEN:
+                    self.record_success(time.monotonic() - started)
+            else:
+                # Недоступность видна до того, как на неё наткнется сообщение пользователя
+                self.record_failure('проверка /api/tags')
+
+    async def stop(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            await asyncio.gather(self._probe_task, return_exceptions=True)
+            self._probe_task = None
+
+    def stats(self) -> Dict:
+        p50 = self.latency_percentile(50)
+        p95 = self.latency_percentile(95)
+        return {
+            'state': self.state,
+            'times_opened': self.times_opened,
+            'rejected': self.rejected,
+            'error_rate': self._window.count(False) / len(self._window) if self._window else 0.0,
+            'p50': p50 or 0.0,
+            'p95': p95 or 0.0
+        }
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from core.ollama_client import REJECTED, OllamaClient, OllamaError, OllamaUnavailable
+from core.ollama_health import percentile_of
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaPool(OllamaClient):
+    """
+    Несколько серверов Ollama за интерфейсом OllamaClient.
+    Запрос уходит на наименее загруженный сервер (меньше запросов в работе, затем меньше p50).
+    Если ответа нет дольше заданного перцентиля задержки запросов пула, отправляется
+    дублирующий запрос на следующий сервер; первый ответ побеждает, второй запрос отменяется.
+    Серверы с разомкнутым выключателем (ошибки, неудачная проверка /api/tags)
+    исключаются из выбора до восстановления.
+    """
+
+    def __init__(self, backends: List[OllamaClient], hedge_percentile: float = 95.0,
+                 hedge_min_delay: float = 0.2, hedge_default_delay: float = 1.0):
+        if not backends:
+            raise ValueError("Нужен хотя бы один сервер Ollama")
+        first = backends[0]
+        super().__init__(first.base_url, first.model, timeout=first.timeout,
+                         max_connections=first.max_connections, keep_alive=first.keep_alive)
+        self.backends = list(backends)
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+        self.in_flight: Dict[str, int] = {backend.base_url: 0 for backend in self.backends}
+
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    @property
+    def available(self) -> bool:
+        return any(backend.available for backend in self.backends)
+
+    async def start(self):
+        for backend in self.backends:
+            await backend.start()
+
+    def _ranked(self) -> List[OllamaClient]:
+        """Доступные серверы, от наименее загруженного"""
+        healthy = [backend for backend in self.backends if backend.available]
+        return sorted(healthy, key=lambda backend: (
+            self.in_flight[backend.base_url],
+            backend.health.latency_percentile(50) or 0.0
+        ))
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Задержка до дублирования: перцентиль недавних задержек всего пула"""
+        if not self.hedge_percentile:
+            return None
+        latency = percentile_of(
+            [value for backend in self.backends for value in backend.health.latencies()],
+            self.hedge_percentile
+        )
+        return max(self.hedge_min_delay, latency if latency is not None else self.hedge_default_delay)
+
+    def _launch(self, backend: OllamaClient, path: str, payload: Dict, timeout: float) -> asyncio.Task:
+        """Запускает запрос; счетчик в работе меняется сразу, чтобы его видели параллельные выборы"""
+        self.in_flight[backend.base_url] += 1
+        task = asyncio.create_task(backend.post(path, payload, timeout=timeout))
+        task.add_done_callback(lambda _: self._release(backend))
+        return task
+
+    def _release(self, backend: OllamaClient):
+        self.in_flight[backend.base_url] -= 1
+
+    async def post(self, path: str, payload: Dict, timeout: float = None) -> Dict:
+        """Запрос с выбором сервера, дублированием по задержке и переходом на другой сервер при ошибке"""
+        candidates = self._ranked()
+        if not candidates:
+            REJECTED.inc()
+            raise OllamaUnavailable(f"Все серверы Ollama недоступны, {path} не вызывался")
+
+        primary = candidates.pop(0)
+        tasks: Dict[asyncio.Task, OllamaClient] = {
+            self._launch(primary, path, payload, timeout): primary
+        }
+        hedge_delay = self._hedge_delay() if candidates else None
+        last_error: Optional[OllamaError] = None
+        hedge: Optional[OllamaClient] = None
+
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Основной сервер медлит: дублируем запрос (один раз)
+                    hedge = candidates.pop(0)
+                    tasks[self._launch(hedge, path, payload, timeout)] = hedge
+                    self.hedged += 1
+                    hedge_delay = None
+                    continue
+
+                failed = False
+                for task in done:
+                    backend = tasks.pop(task)
+                    try:
+                        result = task.result()
+                    except OllamaError as e:
+                        last_error, failed = e, True
+                        logger.warning(f"⚠️ {backend.base_url}: {e}")
+                        continue
+                    if backend is hedge:
+                        self.hedge_wins += 1
+                    return result
+
+                if failed and candidates:
+                    # Запрос упал: вместо него пробуем следующий сервер
+                    backend = candidates.pop(0)
+                    tasks[self._launch(backend, path, payload, timeout)] = backend
+                    self.failovers += 1
+                    hedge_delay = None
+        finally:
+            # Проигравший запрос отменяется: соединение закрывается, генерация прекращается
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        raise last_error
+
+    async def generate_stream(self, prompt: str, options: Dict = None, timeout: float = None,
+                              **extra: Any) -> AsyncIterator[Dict]:
+        """Поток без дублирования: наименее загруженный сервер"""
+        candidates = self._ranked()
+        if not candidates:
+            REJECTED.inc()
+            raise OllamaUnavailable("Все серверы Ollama недоступны, /api/generate не вызывался")
+        backend = candidates[0]
+        self.in_flight[backend.base_url] += 1
+        stream = backend.generate_stream(prompt, options=options, timeout=timeout, **extra)
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            self.in_flight[backend.base_url] -= 1
+            await stream.aclose()
+
+    async def probe(self, timeout: float = 2.0) -> bool:
+        results = await asyncio.gather(*(backend.probe(timeout) for backend in self.backends))
+        return any(results)
+
+    async def close(self):
+        for backend in self.backends:
+            await backend.close()
+        await super().close()
+
+    def stats(self) -> Dict:
+        return {
+            'backends': {
+                backend.base_url: dict(backend.health.stats(), in_flight=self.in_flight[backend.base_url])
+                for backend in self.backends
+            },
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+            'failovers': self.failovers
+        }
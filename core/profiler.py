@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Компоненты, между которыми делится время (по классу функции в стеке)
+COMPONENTS = {
+    'NLUModule': 'NLUModule',
+    'LocalIntentClassifier': 'NLUModule',
+    'DialogManager': 'DialogManager',
+    'ResponseGenerator': 'ResponseGenerator',
+    'CompiledTemplate': 'ResponseGenerator',
+    'StateManager': 'StateManager',
+    'SQLiteStateManager': 'StateManager',
+    'RedisStateManager': 'StateManager',
+    'AnswerStreamer': 'AnswerStreamer',
+    'ProgressiveReply': 'Telethon send',
+}
+# Обработка сообщения: стеки задач без этих функций (ожидающие воркеры и т.п.) не учитываются
+MESSAGE_FUNCTIONS = ('UniversalTelegramAgent._reply_to_message',
+                     'UniversalTelegramAgent._process_message_logic')
+TELETHON_DIR = f"{os.sep}telethon{os.sep}"
+
+# До Python 3.11 у кода нет co_qualname: имена "Класс.метод" собираются из классов
+# загруженных модулей автоответчика при старте профилирования
+_INDEXED_QUALNAMES: Dict = {}
+
+
+def index_qualnames():
+    """Сопоставляет код методов классов из main и core.* их полным именам"""
+    for name, module in list(sys.modules.items()):
+        if name not in ('main', '__main__') and not name.startswith('core.'):
+            continue
+        for cls in list(vars(module).values()):
+            if not isinstance(cls, type) or cls.__module__ != name:
+                continue
+            for attr in vars(cls).values():
+                func = attr.fget if isinstance(attr, property) else getattr(attr, '__func__', attr)
+                code = getattr(func, '__code__', None)
+                if code is not None:
+                    _INDEXED_QUALNAMES[code] = func.__qualname__
+
+
+def _indexed_qualname(code) -> str:
+    return _INDEXED_QUALNAMES.get(code, code.co_name)
+
+
+if sys.version_info >= (3, 11):
+    def _qualname(code) -> str:
+        return code.co_qualname
+else:
+    _qualname = _indexed_qualname
+
+
+def frame_label(code) -> str:
+    """Имя кадра для свернутых стеков: файл:функция (без пробелов и ';')"""
+    return f"{os.path.basename(code.co_filename)}:{_qualname(code)}"
+
+
+def component_of(codes: List) -> str:
+    """
+    Компонент стека: самый внешний кадр известного класса. Кадры Telethon внутри
+    обработки сообщения - отправка ответа, вне ее - собственные задачи клиента (прием, пинги)
+    """
+    in_message = False
+    for code in codes:
+        qualname = _qualname(code)
+        if TELETHON_DIR in code.co_filename:
+            return 'Telethon send' if in_message else 'Telethon'
+        component = COMPONENTS.get(qualname.split('.', 1)[0])
+        if component:
+            return component
+        in_message = in_message or qualname in MESSAGE_FUNCTIONS
+    return 'other'
+
+
+def coroutine_codes(task: asyncio.Task) -> List:
+    """Цепочка ожидающих корутин задачи от внешней к внутренней (где задача сейчас ждет)"""
+    codes = []
+    coro = task.get_coro()
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None) \
+            or getattr(coro, 'ag_frame', None)
+        if frame is None:
+            break
+        codes.append(frame.f_code)
+        coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None) \
+            or getattr(coro, 'ag_await', None)
+    return codes
+
+
+class ProfileSession:
+    """
+    Профилирование работающего автоответчика без перезапуска: N сообщений или T секунд.
+    Два сэмплера:
+    - поток снимает стек потока event loop (sys._current_frames) - где тратится CPU;
+    - задача в event loop обходит ожидающие задачи обработки сообщений (цепочки cr_await) -
+      где сообщения ждут: LLM, хранилище, отправка в Telegram.
+    Вес выборки - реальное время с предыдущей (микросекунды), поэтому задержки сэмплера
+    не искажают доли. Результат: свернутые стеки для flamegraph.pl/speedscope и текстовый отчет.
+    """
+
+    def __init__(self, output_dir: str = "logs/profiles", messages: int = None, seconds: float = None,
+                 interval: float = 0.005, top: int = 20,
+                 on_finish: Callable[['ProfileSession'], None] = None):
+        if not messages and not seconds:
+            raise ValueError("Нужно ограничение профилирования: число сообщений или секунды")
+        self.output_dir = output_dir
+        self.messages = messages
+        self.seconds = seconds
+        self.interval = interval
+        self.top = top
+        self.on_finish = on_finish
+
+        self.cpu: Counter = Counter()
+        self.wall: Counter = Counter()
+        self.idle_us = 0
+        self.processed = 0
+        self.started = 0.0
+        self.finished = 0.0
+        self.report_path: Optional[str] = None
+        self._loop_thread: Optional[int] = None
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stopping: Optional[asyncio.Task] = None
+
+    @property
+    def active(self) -> bool:
+        return self._running
+
+    def start(self):
+        """Запускается из event loop, который нужно профилировать"""
+        self._loop_thread = threading.get_ident()
+        if sys.version_info < (3, 11):
+            index_qualnames()
+        self._running = True
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample_cpu, name="profiler", daemon=True)
+        self._thread.start()
+        self._tasks.append(asyncio.create_task(self._sample_tasks()))
+        if self.seconds:
+            self._tasks.append(asyncio.create_task(self._stop_after(self.seconds)))
+        limits = ', '.join(filter(None, [f"{self.messages} сообщений" if self.messages else '',
+                                         f"{self.seconds:g} с" if self.seconds else '']))
+        logger.info(f"🔬 Профилирование запущено ({limits})")
+
+    def message_done(self):
+        """Сообщение обработано: по достижении лимита сессия завершается"""
+        self.processed += 1
+        if self.messages and self.processed >= self.messages and self._stopping is None:
+            self._stopping = asyncio.create_task(self.stop())
+
+    async def _stop_after(self, seconds: float):
+        await asyncio.sleep(seconds)
+        if self._stopping is None:
+            self._stopping = asyncio.create_task(self.stop())
+
+    def _sample_cpu(self):
+        previous = time.perf_counter()
+        while self._running:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            weight, previous = int((now - previous) * 1e6), now
+            frame = sys._current_frames().get(self._loop_thread)
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            codes.reverse()
+            # Event loop ждет событий в select: это простой, а не работа
+            if not codes or (codes[-1].co_name in ('select', 'poll', 'epoll', 'kqueue')
+                             and 'selectors' in codes[-1].co_filename):
+                self.idle_us += weight
+                continue
+            self.cpu[tuple(codes)] += weight
+
+    async def _sample_tasks(self):
+        current = asyncio.current_task()
+        previous = time.perf_counter()
+        while True:
+            await asyncio.sleep(self.interval * 2)
+            now = time.perf_counter()
+            weight, previous = int((now - previous) * 1e6), now
+            for task in asyncio.all_tasks():
+                if task is current or task.done():
+                    continue
+                codes = coroutine_codes(task)
+                if any(_qualname(code) in MESSAGE_FUNCTIONS for code in codes):
+                    self.wall[tuple(codes)] += weight
+
+    async def stop(self) -> Optional[str]:
+        """Останавливает сэмплеры и записывает результаты; возвращает путь к отчету"""
+        if not self._running:
+            return self.report_path
+        self._running = False
+        self.finished = time.perf_counter()
+        current = asyncio.current_task()
+        for task in self._tasks:
+            if task is not current:
+                task.cancel()
+        await asyncio.gather(*(task for task in self._tasks if task is not current), return_exceptions=True)
+        await asyncio.to_thread(self._thread.join)
+        self.report_path = await asyncio.to_thread(self._write)
+        logger.info(f"🔬 Профилирование завершено: {self.report_path}")
+        if self.on_finish:
+            self.on_finish(self)
+        return self.report_path
+
+    @staticmethod
+    def collapse(samples: Counter) -> List[str]:
+        """Свернутые стеки: "кадр;кадр;кадр вес" (вход flamegraph.pl и speedscope)"""
+        folded: Counter = Counter()
+        for codes, weight in samples.items():
+            folded[';'.join(frame_label(code) for code in codes)] += weight
+        return [f"{stack} {weight}" for stack, weight in folded.most_common()]
+
+    def _write(self) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}")
+        for suffix, samples in (('cpu', self.cpu), ('wall', self.wall)):
+            with open(f"{base}.{suffix}.collapsed", 'w', encoding='utf-8') as f:
+                f.write('\n'.join(self.collapse(samples)) + '\n')
+        with open(f"{base}.txt", 'w', encoding='utf-8') as f:
+            f.write(self.report())
+        return f"{base}.txt"
+
+    def report(self) -> str:
+        """Текстовый отчет: доли компонентов и top-N функций"""
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        cpu_total = sum(self.cpu.values())
+        lines = [
+            f"Профиль: {elapsed:.1f} с, сообщений {self.processed}",
+            f"Поток event loop: работа {cpu_total / 1e6:.2f} с, простой {self.idle_us / 1e6:.2f} с",
+            f"Ожидание в обработке сообщений (сумма по задачам): {sum(self.wall.values()) / 1e6:.2f} с",
+        ]
+        for title, samples in (("CPU потока event loop по компонентам", self.cpu),
+                               ("Время сообщений (включая await) по компонентам", self.wall)):
+            lines += ["", title + ":"] + self._component_lines(samples)
+        lines += ["", f"Top-{self.top} функций по CPU (собственное время):"]
+        lines += self._function_lines(self.cpu, inclusive=False)
+        lines += ["", f"Top-{self.top} функций по времени сообщений (включая вложенные и await):"]
+        lines += self._function_lines(self.wall, inclusive=True)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _component_lines(samples: Counter) -> List[str]:
+        by_component: Dict[str, int] = defaultdict(int)
+        for codes, weight in samples.items():
+            by_component[component_of(codes)] += weight
+        total = sum(by_component.values()) or 1
+        return [f"  {name:<18} {weight / 1e3:10.1f} мс  {weight / total:6.1%}"
+                for name, weight in sorted(by_component.items(), key=lambda item: -item[1])]
+
+    def _function_lines(self, samples: Counter, inclusive: bool) -> List[str]:
+        by_function: Dict[str, int] = defaultdict(int)
+        for codes, weight in samples.items():
+            labels = {frame_label(code) for code in codes} if inclusive else {frame_label(codes[-1])}
+            for label in labels:
+                by_function[label] += weight
+        total = sum(samples.values()) or 1
+        top = sorted(by_function.items(), key=lambda item: -item[1])[:self.top]
+        return [f"  {weight / 1e3:10.1f} мс  {weight / total:6.1%}  {label}" for label, weight in top]
@@ -0,0 +1,121 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from redis import asyncio as aioredis
+
+from core.state_manager import StateManager, UserContext
+
+logger = logging.getLogger(__name__)
+
+
+class RedisStateManager(StateManager):
+    """
+    Общее для нескольких процессов хранилище состояния в Redis.
+    Контекст пользователя - хеш (поле -> JSON-значение) с TTL, история - список.
+    Перед обработкой сообщения load_user() читает контекст и историю одним
+    конвейером, после - commit_user() записывает все изменения одной транзакцией;
+    между ними методы StateManager работают с локальной копией.
+    Записываются только изменившиеся поля: контексты LLM, не менявшиеся
+    с загрузки, повторно не сериализуются и не передаются.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 6379, password: str = None,
+                 db: int = 0, ttl: int = 7 * 24 * 3600, prefix: str = "tg_agent",
+                 client: aioredis.Redis = None, context_ttl: float = None):
+        super().__init__(context_ttl=context_ttl)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.redis = client or aioredis.Redis(
+            host=host, port=port, password=password or None, db=db, decode_responses=True
+        )
+        self._dirty: Set[str] = set()
+        self._new_history: Dict[str, List[Dict]] = {}
+        # Поля хеша и JSON контекстов LLM на момент загрузки (для записи только изменений)
+        self._loaded: Dict[str, Tuple[Set[str], Optional[str]]] = {}
+        self.round_trips = 0
+
+    def _context_key(self, user_id: str) -> str:
+        return f"{self.prefix}:ctx:{user_id}"
+
+    def _history_key(self, user_id: str) -> str:
+        return f"{self.prefix}:hist:{user_id}"
+
+    async def load_user(self, user_id: str):
+        """Читает контекст и историю пользователя за один запрос"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(self._context_key(user_id))
+            pipe.lrange(self._history_key(user_id), -self.HISTORY_LIMIT, -1)
+            fields, history = await pipe.execute()
+        self.round_trips += 1
+
+        record = self.user_states[user_id] = UserContext(self.HISTORY_LIMIT)
+        contexts = fields.pop('llm_contexts', None)
+        record.update({key: json.loads(value) for key, value in fields.items()})
+        if contexts is not None:
+            record.load_contexts_json(contexts)
+            fields['llm_contexts'] = contexts
+        self._loaded[user_id] = (set(fields), record.contexts_json())
+        record.history.extend(json.loads(item) for item in history)
+
+    def _touch(self, user_id: str):
+        self._dirty.add(user_id)
+
+    def update_dialog_history(self, user_id: str, user_message: str, bot_response: str):
+        super().update_dialog_history(user_id, user_message, bot_response)
+        self._new_history.setdefault(user_id, []).append({
+            'user': user_message,
+            'bot': bot_response
+        })
+
+    async def commit_user(self, user_id: str):
+        """Записывает изменения пользователя одной транзакцией и освобождает локальную копию"""
+        new_history = self._new_history.pop(user_id, [])
+        dirty = user_id in self._dirty
+        self._dirty.discard(user_id)
+        loaded_fields, loaded_contexts = self._loaded.pop(user_id, (set(), None))
+
+        if dirty or new_history:
+            context_key = self._context_key(user_id)
+            history_key = self._history_key(user_id)
+            async with self.redis.pipeline(transaction=True) as pipe:
+                if dirty:
+                    record = self.user_states.get(user_id)
+                    mapping = {
+                        key: json.dumps(value, ensure_ascii=False, default=str)
+                        for key, value in (record.to_dict() if record is not None else {}).items()
+                    }
+                    contexts = record.contexts_json() if record is not None else None
+                    if contexts is not None:
+                        mapping['llm_contexts'] = contexts
+                    removed = loaded_fields - set(mapping)
+                    if removed:
+                        pipe.hdel(context_key, *removed)
+                    if contexts is not None and contexts is loaded_contexts:
+                        del mapping['llm_contexts']
+                    if mapping:
+                        pipe.hset(context_key, mapping=mapping)
+                    if mapping or loaded_fields - removed:
+                        pipe.expire(context_key, self.ttl)
+                if new_history:
+                    pipe.rpush(history_key, *(json.dumps(item, ensure_ascii=False)
+                                              for item in new_history))
+                    pipe.ltrim(history_key, -self.HISTORY_LIMIT, -1)
+                    pipe.expire(history_key, self.ttl)
+                await pipe.execute()
+            self.round_trips += 1
+
+        # Локальная копия не хранится: другой процесс мог изменить состояние
+        self.user_states.pop(user_id, None)
+
+    async def close(self):
+        """Сохраняет несохраненные изменения и закрывает соединение"""
+        for user_id in set(self._dirty) | set(self._new_history):
+            await self.commit_user(user_id)
+        await self.redis.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'round_trips': self.round_trips,
+            'ttl': self.ttl
+        }
@@ -1,28 +1,96 @@
 import json
-from typing import Dict, Any
+from string import Formatter
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+class TemplateError(ValueError):
+    """Ошибка в шаблоне ответа: синтаксис или неизвестное поле"""
+
+class CompiledTemplate:
+    """
+    Шаблон, разобранный один раз при загрузке конфигурации.
+    Части - литералы и места под поля; отрисовка заполняет места и делает один join.
+    """
+    
+    __slots__ = ('name', 'parts', 'fields')
+    
+    def __init__(self, name: str, source: str):
+        self.name = name
+        self.parts: List[str] = []
+        # (индекс в parts, имя поля)
+        self.fields: List[Tuple[int, str]] = []
+        try:
+            parsed = list(Formatter().parse(source))
+        except ValueError as e:
+            raise TemplateError(f"Шаблон '{name}': {e}") from e
+        
+        for literal, field, format_spec, conversion in parsed:
+            if literal:
+                self.parts.append(literal)
+            if field is None:
+                continue
+            if not field.isidentifier() or format_spec or conversion:
+                raise TemplateError(f"Шаблон '{name}': поддерживаются только поля вида {{имя}}, "
+                                    f"а не {{{field}{'!' + conversion if conversion else ''}"
+                                    f"{':' + format_spec if format_spec else ''}}}")
+            self.fields.append((len(self.parts), field))
+            self.parts.append('')
+    
+    def render(self, values: Dict = None) -> str:
+        if not self.fields:
+            return ''.join(self.parts)
+        parts = self.parts.copy()
+        values = values or {}
+        for index, field in self.fields:
+            value = values.get(field)
+            # Несобранное поле дает пустую строку, а не "{user_company}" в ответе
+            parts[index] = '' if value is None else str(value)
+        return ''.join(parts)
 
 class ResponseGenerator:
-    """Генератор ответов на основе конфигурации"""
+    """
+    Генератор ответов на основе конфигурации.
+    Шаблоны компилируются при создании; поля проверяются по известным слотам,
+    поэтому ошибка в конфигурации обнаруживается при запуске, а не в ответе клиенту.
+    """
     
-    def __init__(self, config: Dict):
+    FALLBACK_TEXT = 'Извините, я не понял вопрос.'
+    
+    def __init__(self, config: Dict, known_slots: Iterable[str] = None):
         self.config = config
         self.templates = config.get('templates', {})
+        self.known_fields = set(known_slots or ()) | self._flow_entities(config)
+        self.compiled: Dict[str, CompiledTemplate] = {
+            name: self.compile(name, source) for name, source in self.templates.items()
+        }
+        self._fallback = self.compiled.get('fallback') or CompiledTemplate('fallback', self.FALLBACK_TEXT)
+    
+    @staticmethod
+    def _flow_entities(config: Dict) -> set:
+        """Слоты, которые собирают dialog_flows"""
+        return {
+            step['entity']
+            for steps in config.get('dialog_flows', {}).values()
+            for step in steps
+            if step.get('type') == 'collect_entity' and step.get('entity')
+        }
+    
+    def compile(self, name: str, source: str) -> CompiledTemplate:
+        """Компилирует шаблон и проверяет, что все его поля известны"""
+        if not isinstance(source, str):
+            raise TemplateError(f"Шаблон '{name}' должен быть строкой")
+        template = CompiledTemplate(name, source)
+        unknown = sorted({field for _, field in template.fields} - self.known_fields)
+        if unknown:
+            raise TemplateError(f"Шаблон '{name}': неизвестные поля {unknown}; "
+                                f"доступны {sorted(self.known_fields)}")
+        return template
     
     def generate_from_template(self, template_name: str, context: Dict = None) -> str:
         """Генерирует ответ из шаблона"""
-        template = self.templates.get(template_name)
-        
-        if not template:
-            return self.templates.get('fallback', 'Извините, я не понял вопрос.')
-        
-        # Подстановка значений из контекста
-        if context:
-            for key, value in context.items():
-                placeholder = '{' + key + '}'
-                if placeholder in template:
-                    template = template.replace(placeholder, str(value))
-        
-        return template
+        template: Optional[CompiledTemplate] = self.compiled.get(template_name)
+        if template is None:
+            return self._fallback.render()
+        return template.render(context)
     
     def generate_entity_prompt(self, entity_name: str) -> str:
         """Генерирует запрос на ввод сущности"""
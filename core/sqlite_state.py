@@ -0,0 +1,281 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from core.state_manager import StateManager, UserContext
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contexts (
+    user_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dialog_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    user_message TEXT NOT NULL,
+    bot_response TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_dialog_history_user ON dialog_history (user_id, id);
+"""
+
+
+def sqlite_path_from_url(url: str) -> str:
+    """sqlite:///./chat_history.db -> ./chat_history.db"""
+    prefix = "sqlite:///"
+    return url[len(prefix):] if url.startswith(prefix) else url
+
+
+class SQLiteStateManager(StateManager):
+    """
+    Хранилище состояния на SQLite (WAL) с отложенной записью.
+    Чтение идет из памяти; измененные контексты и новые строки истории
+    сбрасываются пачками в одной транзакции фоновой задачей в отдельном потоке,
+    поэтому обработка сообщения никогда не ждет fsync.
+    При старте контексты и последние сообщения истории загружаются из базы;
+    updated_at хранит время последней активности для истечения по idle_ttl.
+    Вытеснение по max_users освобождает только память: строка в базе остается,
+    и load_user() читает ее обратно при следующем сообщении пользователя.
+    """
+
+    def __init__(self, path: str = "chat_history.db", flush_interval: float = 0.5,
+                 batch_size: int = 500, idle_ttl: float = None, max_users: int = None,
+                 context_ttl: float = None):
+        super().__init__(idle_ttl=idle_ttl, max_users=max_users, context_ttl=context_ttl)
+        self.path = sqlite_path_from_url(path)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._dirty: Set[str] = set()
+        self._history_rows: List[Tuple[str, str, str, float]] = []
+        # Снимки (JSON) вытесненных из памяти контекстов, еще не записанные в базу
+        self._evicted: Dict[str, Tuple[str, float]] = {}
+        # Пользователи, чьи изменения еще не в базе: перед чтением их строк нужна запись
+        self._unflushed: Set[str] = set()
+        self._io_lock: asyncio.Lock = None
+        self._flush_task: asyncio.Task = None
+        self._wakeup: asyncio.Event = None
+        # Соединение используется только из потока записи, но под замком
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+        self.flushes = 0
+        self.warmup_seconds = self._load()
+
+    def _load(self) -> float:
+        """Загружает контексты и хвосты истории в память; возвращает время загрузки"""
+        started = time.perf_counter()
+
+        records: Dict[str, UserContext] = {}
+        for user_id, data, updated_at in self._db.execute(
+                "SELECT user_id, data, updated_at FROM contexts"):
+            record = records[user_id] = UserContext(self.HISTORY_LIMIT, updated_at)
+            record.update(json.loads(data))
+
+        rows = self._db.execute(
+            "SELECT user_id, user_message, bot_response, created_at FROM ("
+            "  SELECT user_id, user_message, bot_response, created_at, id,"
+            "         ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id DESC) AS rn"
+            "  FROM dialog_history"
+            ") WHERE rn <= ? ORDER BY id",
+            (self.HISTORY_LIMIT,)
+        )
+        for user_id, user_message, bot_response, created_at in rows:
+            record = records.get(user_id)
+            if record is None:
+                record = records[user_id] = UserContext(self.HISTORY_LIMIT, created_at)
+            record.last_seen = max(record.last_seen, created_at)
+            record.history.append({
+                'user': user_message,
+                'bot': bot_response
+            })
+
+        # Порядок последней активности, затем истечение и вытеснение по лимитам
+        for user_id, record in sorted(records.items(), key=lambda item: item[1].last_seen):
+            self.user_states[user_id] = record
+            self._track_contexts(user_id, record)
+        self._enforce_limits(time.time())
+
+        elapsed = time.perf_counter() - started
+        logger.info(f"💾 Загружено {len(self.user_states)} контекстов из {self.path} "
+                    f"за {elapsed * 1000:.0f} мс")
+        return elapsed
+
+    async def start(self):
+        """Запускает фоновую запись"""
+        if self._io_lock is None:
+            self._io_lock = asyncio.Lock()
+        if self._flush_task is None:
+            self._wakeup = asyncio.Event()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    def _touch(self, user_id: str):
+        self._dirty.add(user_id)
+        self._unflushed.add(user_id)
+        self._evicted.pop(user_id, None)
+        self._maybe_wakeup()
+
+    def _evict(self, user_id: str):
+        """Освобождает память; несохраненные изменения запишутся из снимка"""
+        record = self.user_states.pop(user_id)
+        if user_id in self._dirty:
+            self._evicted[user_id] = (record.dump_json(), record.last_seen)
+
+    async def load_user(self, user_id: str):
+        """Возвращает в память пользователя, вытесненного по max_users (одним запросом)"""
+        if user_id in self.user_states:
+            return
+        if self._io_lock is None:
+            self._io_lock = asyncio.Lock()
+        async with self._io_lock:
+            # Вытесненный до записи пользователь: сначала запись, иначе прочитаем старую строку
+            if user_id in self._unflushed:
+                await self._flush_locked()
+            record = await asyncio.to_thread(self._read_user, user_id)
+        if record is not None and user_id not in self.user_states:
+            self.user_states[user_id] = record
+            self.user_states.move_to_end(user_id)
+            self._track_contexts(user_id, record)
+
+    def _read_user(self, user_id: str) -> Optional[UserContext]:
+        with self._db_lock:
+            row = self._db.execute("SELECT data, updated_at FROM contexts WHERE user_id = ?",
+                                   (user_id,)).fetchone()
+            history = self._db.execute(
+                "SELECT user_message, bot_response, created_at FROM dialog_history "
+                "WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                (user_id, self.HISTORY_LIMIT)
+            ).fetchall()
+        if row is None and not history:
+            return None
+        record = UserContext(self.HISTORY_LIMIT, row[1] if row else history[0][2])
+        if row is not None:
+            record.update(json.loads(row[0]))
+        for user_message, bot_response, created_at in reversed(history):
+            record.last_seen = max(record.last_seen, created_at)
+            record.history.append({
+                'user': user_message,
+                'bot': bot_response
+            })
+        return record
+
+    def update_dialog_history(self, user_id: str, user_message: str, bot_response: str):
+        super().update_dialog_history(user_id, user_message, bot_response)
+        self._history_rows.append((user_id, user_message, bot_response, time.time()))
+        self._unflushed.add(user_id)
+        self._maybe_wakeup()
+
+    def _maybe_wakeup(self):
+        """Запись раньше интервала, если накопилась большая пачка"""
+        if self._wakeup and len(self._dirty) + len(self._history_rows) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except sqlite3.Error as e:
+                logger.error(f"❌ Ошибка записи состояния в SQLite: {e}")
+
+    def _take_batch(self) -> Tuple[List[Tuple[str, str, float]], List[str], List[Tuple]]:
+        """Снимок изменений (в потоке event loop, чтобы контексты не менялись во время сериализации)"""
+        upserts, deletes = [], []
+        for user_id in self._dirty:
+            record = self.user_states.get(user_id)
+            if record is not None:
+                # Контексты LLM берутся уже сериализованными: меняются реже остального
+                context, last_seen = record.dump_json(), record.last_seen
+            else:
+                # Вытесненная запись пишется из снимка; без снимка запись удалена (истечение)
+                context, last_seen = self._evicted.get(user_id, (None, None))
+            if context is None or context == '{}':
+                deletes.append(user_id)
+            else:
+                upserts.append((user_id, context, last_seen))
+        history_rows = self._history_rows
+
+        self._dirty = set()
+        self._history_rows = []
+        self._evicted = {}
+        self._unflushed = set()
+        return upserts, deletes, history_rows
+
+    def _write_batch(self, upserts: List, deletes: List, history_rows: List):
+        """Записывает пачку одной транзакцией"""
+        with self._db_lock, self._db:
+            if upserts:
+                self._db.executemany(
+                    "INSERT INTO contexts (user_id, data, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, "
+                    "updated_at = excluded.updated_at",
+                    upserts
+                )
+            if deletes:
+                self._db.executemany("DELETE FROM contexts WHERE user_id = ?",
+                                     [(user_id,) for user_id in deletes])
+            if history_rows:
+                self._db.executemany(
+                    "INSERT INTO dialog_history (user_id, user_message, bot_response, created_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    history_rows
+                )
+
+    async def flush(self):
+        """Сбрасывает накопленные изменения в базу, не блокируя event loop"""
+        if not self._dirty and not self._history_rows:
+            return
+        if self._io_lock is None:
+            self._io_lock = asyncio.Lock()
+        async with self._io_lock:
+            await self._flush_locked()
+
+    async def _flush_locked(self):
+        upserts, deletes, history_rows = self._take_batch()
+        try:
+            await asyncio.to_thread(self._write_batch, upserts, deletes, history_rows)
+        except sqlite3.Error:
+            # Возвращаем пачку в очередь: запишется при следующей попытке
+            for user_id, data, last_seen in upserts:
+                if user_id not in self.user_states:
+                    self._evicted[user_id] = (data, last_seen)
+            self._dirty.update(user_id for user_id, _, _ in upserts)
+            self._dirty.update(deletes)
+            self._unflushed.update(self._dirty)
+            self._unflushed.update(user_id for user_id, _, _, _ in history_rows)
+            self._history_rows = history_rows + self._history_rows
+            raise
+        self.flushes += 1
+
+    async def close(self):
+        """Останавливает фоновую запись, сохраняет остаток и закрывает базу"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        if self._dirty or self._history_rows:
+            self._write_batch(*self._take_batch())
+        with self._db_lock:
+            self._db.close()
+
+    def stats(self) -> Dict:
+        return {
+            'dirty': len(self._dirty),
+            'pending_history': len(self._history_rows),
+            'flushes': self.flushes,
+            'warmup_seconds': self.warmup_seconds
+        }
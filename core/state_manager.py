@@ -1,41 +1,388 @@
+import base64
 import json
-from typing import Dict, Any, Optional
+import logging
+import sys
+import time
+from array import array
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional
+
+from core.metrics import FLOWS
+
+logger = logging.getLogger(__name__)
+
+class LLMContextHandle:
+    """
+    Контекст Ollama для шаблона промпта. Идентификаторы токенов доходят до размера
+    словаря модели (десятки тысяч), поэтому в списке каждый - отдельный объект int;
+    array('i') хранит их по 4 байта. Во внешних хранилищах токены - base64 от этих байтов.
+    """
+    
+    __slots__ = ('version', 'tokens', 'saved_at')
+    
+    def __init__(self, version: str, tokens, saved_at: float = None):
+        self.version = version
+        self.tokens = tokens if isinstance(tokens, array) else array('i', tokens)
+        self.saved_at = saved_at if saved_at is not None else time.time()
+    
+    def dump(self) -> Dict:
+        tokens = base64.b64encode(self.tokens.tobytes()).decode('ascii')
+        return {'version': self.version, 'tokens': tokens, 'saved_at': self.saved_at}
+    
+    @classmethod
+    def restore(cls, data: Any) -> Optional['LLMContextHandle']:
+        """Из сохраненного вида: base64 или список токенов (записи до упаковки)"""
+        if isinstance(data, cls):
+            return data
+        tokens = data.get('tokens') if isinstance(data, dict) else None
+        if isinstance(tokens, str):
+            packed = array('i')
+            packed.frombytes(base64.b64decode(tokens))
+        elif isinstance(tokens, list):
+            packed = array('i', tokens)
+        else:
+            return None
+        return cls(data.get('version'), packed, data.get('saved_at'))
+    
+    def approx_size(self) -> int:
+        return sys.getsizeof(self) + sys.getsizeof(self.tokens) + sys.getsizeof(self.version)
+
+class UserContext:
+    """
+    Компактная запись состояния пользователя (__slots__ вместо вложенных словарей).
+    История диалога - кольцевой буфер фиксированного размера.
+    llm_contexts - токены контекста Ollama по шаблонам промптов; как и история,
+    переживают сброс диалога.
+    """
+    
+    __slots__ = ('active_goal', 'current_step', 'collected_data', 'awaiting_slot',
+                 'last_intent', 'extra', '_llm_contexts', '_contexts_json', 'history', 'last_seen')
+    
+    FIELDS = ('active_goal', 'current_step', 'collected_data', 'awaiting_slot', 'last_intent')
+    
+    def __init__(self, history_limit: int = 10, last_seen: float = None):
+        self.active_goal = None
+        self.current_step = None
+        self.collected_data = None
+        self.awaiting_slot = None
+        self.last_intent = None
+        # Поля, которых нет в FIELDS: редкие, поэтому словарь создается по требованию
+        self.extra = None
+        self._llm_contexts = None
+        self._contexts_json = None
+        self.history = deque(maxlen=history_limit)
+        self.last_seen = last_seen if last_seen is not None else time.time()
+    
+    @property
+    def llm_contexts(self) -> Optional[Dict[str, LLMContextHandle]]:
+        return self._llm_contexts
+    
+    @llm_contexts.setter
+    def llm_contexts(self, contexts: Optional[Dict[str, LLMContextHandle]]):
+        # Словарь контекстов не изменяется на месте, только заменяется: сброс кеша JSON здесь
+        self._llm_contexts = contexts
+        self._contexts_json = None
+    
+    def contexts_json(self) -> Optional[str]:
+        """JSON контекстов LLM: сериализуется один раз после изменения, а не при каждой записи"""
+        if self._contexts_json is None and self._llm_contexts:
+            self._contexts_json = json.dumps(
+                {purpose: handle.dump() for purpose, handle in self._llm_contexts.items()}
+            )
+        return self._contexts_json
+    
+    def load_contexts_json(self, raw: str):
+        """Восстанавливает контексты из JSON хранилища, запоминая его как уже сериализованный"""
+        self.set('llm_contexts', json.loads(raw))
+        if self._llm_contexts:
+            self._contexts_json = raw
+    
+    def set(self, key: str, value: Any):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        elif key == 'llm_contexts':
+            contexts = {purpose: LLMContextHandle.restore(handle) for purpose, handle in (value or {}).items()}
+            self.llm_contexts = {purpose: handle for purpose, handle in contexts.items() if handle} or None
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+    
+    def update(self, data: Dict):
+        for key, value in data.items():
+            self.set(key, value)
+    
+    def reset(self):
+        """Сбрасывает контекст диалога, сохраняя историю"""
+        for key in self.FIELDS:
+            setattr(self, key, None)
+        self.extra = None
+    
+    def to_dict(self) -> Dict:
+        """Контекст диалога в виде словаря (без истории и контекстов LLM)"""
+        data = {key: getattr(self, key) for key in self.FIELDS if getattr(self, key) is not None}
+        if self.extra:
+            data.update(self.extra)
+        return data
+    
+    def dump(self) -> Dict:
+        """Всё, что сохраняется во внешнем хранилище (история хранится отдельно)"""
+        data = self.to_dict()
+        if self.llm_contexts:
+            data['llm_contexts'] = {purpose: handle.dump() for purpose, handle in self.llm_contexts.items()}
+        return data
+    
+    def dump_json(self) -> str:
+        """dump() в виде JSON; контексты LLM берутся из кеша contexts_json()"""
+        data = json.dumps(self.to_dict(), ensure_ascii=False, default=str)
+        contexts = self.contexts_json()
+        if contexts is None:
+            return data
+        return data[:-1] + (', ' if len(data) > 2 else '') + '"llm_contexts": ' + contexts + '}'
+    
+    def approx_size(self) -> int:
+        """Приблизительный объем записи в байтах"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.history)
+        for key in self.FIELDS:
+            value = getattr(self, key)
+            if isinstance(value, str):
+                size += sys.getsizeof(value)
+        for mapping in (self.collected_data, self.extra):
+            if mapping:
+                size += sys.getsizeof(mapping)
+                size += sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in mapping.items())
+        if self.llm_contexts:
+            size += sys.getsizeof(self.llm_contexts)
+            size += sum(handle.approx_size() for handle in self.llm_contexts.values())
+            if self._contexts_json is not None:
+                size += sys.getsizeof(self._contexts_json)
+        for turn in self.history:
+            size += sys.getsizeof(turn) + sys.getsizeof(turn['user']) + sys.getsizeof(turn['bot'])
+        return size
 
 class StateManager:
-    """Менеджер состояния диалога"""
+    """
+    Менеджер состояния диалога.
+    Записи хранятся в порядке последней активности: простаивающие дольше idle_ttl
+    истекают, а при превышении max_users вытесняются самые давние (LRU).
+    Контексты Ollama (самая крупная часть записи) истекают отдельно, через context_ttl
+    после сохранения: диалог помнится сутки, а контекст нужен, пока пользователь пишет.
+    """
+    
+    HISTORY_LIMIT = 10
     
-    def __init__(self):
-        self.user_states = {}
+    def __init__(self, idle_ttl: float = None, max_users: int = None, context_ttl: float = None):
+        self.idle_ttl = idle_ttl
+        self.max_users = max_users
+        self.context_ttl = context_ttl
+        self.user_states: "OrderedDict[str, UserContext]" = OrderedDict()
+        # Пользователи с контекстами Ollama в порядке их сохранения (для истечения с начала)
+        self._context_order: "OrderedDict[str, float]" = OrderedDict()
+        self.expired = 0
+        self.evicted = 0
+        self.contexts_expired = 0
+    
+    async def start(self):
+        """Запуск фоновых задач хранилища (у хранилища в памяти их нет)"""
+    
+    async def close(self):
+        """Сохранение несохраненных данных и освобождение ресурсов"""
+    
+    async def load_user(self, user_id: str):
+        """
+        Подготавливает состояние пользователя перед обработкой сообщения.
+        Внешние хранилища читают всё нужное за один запрос; в памяти делать нечего.
+        """
+    
+    async def commit_user(self, user_id: str):
+        """Сохраняет изменения пользователя после обработки сообщения (одним запросом)"""
+    
+    def _touch(self, user_id: str):
+        """Отмечает контекст пользователя как измененный"""
+    
+    def _is_expired(self, record: UserContext, now: float) -> bool:
+        return self.idle_ttl is not None and now - record.last_seen > self.idle_ttl
+    
+    def _record(self, user_id: str) -> Optional[UserContext]:
+        """Запись пользователя; истекшая запись удаляется"""
+        record = self.user_states.get(user_id)
+        if record is not None and self._is_expired(record, time.time()):
+            logger.info(f"⌛ Диалог {user_id} истек после {self.idle_ttl:.0f} с бездействия")
+            self._count_abandoned(record)
+            self._drop(user_id)
+            self.expired += 1
+            return None
+        return record
+    
+    def _active_record(self, user_id: str) -> UserContext:
+        """Запись для изменения: создается при необходимости и становится самой свежей"""
+        now = time.time()
+        record = self._record(user_id)
+        if record is None:
+            record = self.user_states[user_id] = UserContext(self.HISTORY_LIMIT, now)
+        else:
+            record.last_seen = now
+            self.user_states.move_to_end(user_id)
+        self._enforce_limits(now)
+        self._expire_contexts(now)
+        return record
+    
+    def _context_expired(self, handle: LLMContextHandle, now: float) -> bool:
+        return self.context_ttl is not None and now - handle.saved_at > self.context_ttl
+    
+    def _expire_contexts(self, now: float):
+        """Сбрасывает контексты Ollama, сохраненные дольше context_ttl назад (с начала очереди)"""
+        if self.context_ttl is None:
+            return
+        while self._context_order:
+            user_id, saved_at = next(iter(self._context_order.items()))
+            if now - saved_at <= self.context_ttl:
+                break
+            del self._context_order[user_id]
+            record = self.user_states.get(user_id)
+            if record is not None and record.llm_contexts:
+                contexts = {purpose: handle for purpose, handle in record.llm_contexts.items()
+                            if not self._context_expired(handle, now)}
+                if len(contexts) != len(record.llm_contexts):
+                    self.contexts_expired += len(record.llm_contexts) - len(contexts)
+                    record.llm_contexts = contexts or None
+                    self._touch(user_id)
+                if contexts:
+                    self._context_order[user_id] = max(handle.saved_at for handle in contexts.values())
+    
+    def _track_contexts(self, user_id: str, record: UserContext):
+        """Ставит в очередь истечения контексты записи, загруженной из хранилища"""
+        if record.llm_contexts:
+            self._context_order[user_id] = max(handle.saved_at for handle in record.llm_contexts.values())
+    
+    @staticmethod
+    def _count_abandoned(record: UserContext):
+        """Незавершенный сценарий удаленной записи считается брошенным"""
+        if record.active_goal:
+            FLOWS.labels(record.active_goal, 'abandoned').inc()
+    
+    def _drop(self, user_id: str):
+        """Удаляет запись вместе с сохраненной копией (истечение)"""
+        del self.user_states[user_id]
+        self._context_order.pop(user_id, None)
+        self._touch(user_id)
+    
+    def _evict(self, user_id: str):
+        """
+        Освобождает память, занятую записью (LRU). В памяти это потеря диалога;
+        внешние хранилища переопределяют метод и сохраненную копию не трогают.
+        """
+        self._count_abandoned(self.user_states.pop(user_id))
+        self._context_order.pop(user_id, None)
+    
+    def _enforce_limits(self, now: float):
+        """Удаляет истекшие записи с начала очереди и вытесняет лишние (LRU)"""
+        while self.user_states:
+            user_id, oldest = next(iter(self.user_states.items()))
+            if self._is_expired(oldest, now):
+                self.expired += 1
+                self._count_abandoned(oldest)
+                self._drop(user_id)
+            elif self.max_users is not None and len(self.user_states) > self.max_users:
+                self.evicted += 1
+                self._evict(user_id)
+            else:
+                break
     
     def get_user_context(self, user_id: str) -> Dict:
         """Возвращает контекст пользователя"""
-        return self.user_states.get(user_id, {})
+        record = self._record(user_id)
+        return record.to_dict() if record is not None else {}
     
     def set_user_context(self, user_id: str, context: Dict):
         """Устанавливает контекст пользователя"""
-        self.user_states[user_id] = context
+        record = self._active_record(user_id)
+        record.reset()
+        record.update(context)
+        self._touch(user_id)
+    
+    def update_user_context(self, user_id: str, updates: Dict):
+        """Обновляет отдельные поля контекста пользователя"""
+        self._active_record(user_id).update(updates)
+        self._touch(user_id)
+    
+    def update_user_data(self, user_id: str, data: Dict):
+        """Дополняет собранные данные пользователя"""
+        record = self._active_record(user_id)
+        record.collected_data = {**(record.collected_data or {}), **data}
+        self._touch(user_id)
     
     def update_dialog_history(self, user_id: str, user_message: str, bot_response: str):
-        """Обновляет историю диалога"""
-        if user_id not in self.user_states:
-            self.user_states[user_id] = {
-                'dialog_history': [],
-                'context': {}
-            }
-        
-        if 'dialog_history' not in self.user_states[user_id]:
-            self.user_states[user_id]['dialog_history'] = []
-        
-        self.user_states[user_id]['dialog_history'].append({
+        """Обновляет историю диалога (кольцевой буфер последних 10 сообщений)"""
+        self._active_record(user_id).history.append({
             'user': user_message,
             'bot': bot_response
         })
-        
-        # Ограничиваем историю последними 10 сообщениями
-        if len(self.user_states[user_id]['dialog_history']) > 10:
-            self.user_states[user_id]['dialog_history'] = self.user_states[user_id]['dialog_history'][-10:]
+    
+    def get_dialog_history(self, user_id: str) -> List[Dict]:
+        """Возвращает последние сообщения диалога"""
+        record = self._record(user_id)
+        return list(record.history) if record is not None else []
+    
+    def get_llm_context(self, user_id: str, purpose: str, version: str) -> Optional[List[int]]:
+        """Токены контекста Ollama для шаблона промпта; None, если шаблон или модель сменились"""
+        record = self._record(user_id)
+        if record is None or not record.llm_contexts:
+            return None
+        handle = record.llm_contexts.get(purpose)
+        if not handle or handle.version != version or self._context_expired(handle, time.time()):
+            return None
+        return handle.tokens.tolist()
+    
+    def set_llm_context(self, user_id: str, purpose: str, version: str, tokens: Optional[List[int]]):
+        """Сохраняет (или сбрасывает при tokens=None) контекст Ollama для шаблона промпта"""
+        record = self._active_record(user_id)
+        contexts = dict(record.llm_contexts or {})
+        if tokens:
+            handle = contexts[purpose] = LLMContextHandle(version, tokens)
+            self._context_order[user_id] = handle.saved_at
+            self._context_order.move_to_end(user_id)
+        elif contexts.pop(purpose, None) is None:
+            return
+        record.llm_contexts = contexts or None
+        if not contexts:
+            self._context_order.pop(user_id, None)
+        self._touch(user_id)
     
     def clear_user_context(self, user_id: str):
-        """Очищает контекст пользователя"""
-        if user_id in self.user_states:
-            del self.user_states[user_id]
\ No newline at end of file
+        """Очищает контекст пользователя (история сохраняется)"""
+        record = self._record(user_id)
+        if record is not None:
+            record.reset()
+            self._touch(user_id)
+    
+    def memory_stats(self) -> Dict[str, int]:
+        """Количество записей и их приблизительный объем в памяти"""
+        return {
+            'entries': len(self.user_states),
+            'active_dialogs': sum(1 for record in self.user_states.values() if record.active_goal),
+            'approx_bytes': sys.getsizeof(self.user_states) + sum(
+                sys.getsizeof(user_id) + record.approx_size()
+                for user_id, record in self.user_states.items()
+            ),
+            'llm_context_bytes': sum(
+                handle.approx_size()
+                for record in self.user_states.values() for handle in (record.llm_contexts or {}).values()
+            ),
+            'expired': self.expired,
+            'evicted': self.evicted,
+            'contexts_expired': self.contexts_expired
+        }
+
+
+def create_state_manager(backend: str = "memory", **options: Any) -> StateManager:
+    """Создает хранилище состояния: memory, sqlite или redis"""
+    if backend == "memory":
+        return StateManager(**options)
+    if backend == "sqlite":
+        from core.sqlite_state import SQLiteStateManager
+        return SQLiteStateManager(**options)
+    if backend == "redis":
+        from core.redis_state import RedisStateManager
+        return RedisStateManager(**options)
+    raise ValueError(f"Неизвестное хранилище состояния: {backend}")
@@ -0,0 +1,133 @@
+import json
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core.config_snapshot import ConfigSnapshot, ConfigWatcher
+from core.intent_matcher import IntentMatcher
+from core.nlu import NLUModule
+
+logger = logging.getLogger(__name__)
+
+
+class AgentTenant:
+    """
+    Один агент в многоагентном процессе: свой снимок конфигурации (автоматы, шаблоны,
+    инструменты), свой NLU (общие клиент Ollama и кеш LLM) и свое пространство имен
+    в общем хранилище состояния.
+    NLU зависит от снимка (намерения, ключевые слова, извлечение сущностей, примеры
+    эмбеддингов), поэтому для каждого снимка создается новый через nlu_factory.
+    """
+
+    def __init__(self, name: str, config_path: str, snapshot: ConfigSnapshot,
+                 nlu_factory: Callable[[ConfigSnapshot], NLUModule],
+                 state_namespace: str = '', reload_interval: float = 0):
+        self.name = name
+        self.config_path = config_path
+        self.nlu_factory = nlu_factory
+        self.snapshot = snapshot
+        self.nlu = nlu_factory(snapshot)
+        self.state_namespace = state_namespace
+        self.config_watcher = ConfigWatcher(
+            config_path, self._apply_snapshot, interval=reload_interval
+        ) if reload_interval > 0 else None
+
+    def state_key(self, user_id: str) -> str:
+        """Ключ пользователя в хранилище состояния"""
+        return f"{self.state_namespace}:{user_id}" if self.state_namespace else user_id
+
+    async def _apply_snapshot(self, snapshot: ConfigSnapshot):
+        """
+        Атомарно подменяет конфигурацию: новый NLU готовится заранее, затем снимок и NLU
+        меняются вместе без await между ними. Обрабатываемые сообщения держат ссылки
+        на прежние объекты и дорабатывают со старой конфигурацией целиком.
+        """
+        nlu = self.nlu_factory(snapshot)
+        await nlu.prepare()
+        self.snapshot, self.nlu = snapshot, nlu
+        logger.info(f"🔄 Конфигурация агента {self.name} ({self.config_path}) "
+                    f"перезагружена (версия {snapshot.version})")
+
+    def start(self):
+        if self.config_watcher:
+            self.config_watcher.start()
+
+    async def stop(self):
+        if self.config_watcher:
+            await self.config_watcher.stop()
+
+
+class TenantRouter:
+    """
+    Выбирает агента для входящего сообщения по таблице маршрутизации:
+    аккаунт отправителя, затем чат, затем уже начатый разговор, затем ключевые слова
+    первого сообщения, иначе агент по умолчанию. Выбор по ключевым словам и по умолчанию
+    запоминается, чтобы весь разговор оставался у одного агента.
+    """
+
+    def __init__(self, agents: List[str], default: str, accounts: Dict[str, str] = None,
+                 chats: Dict[str, str] = None, keywords: Dict[str, List[str]] = None,
+                 max_assignments: int = 100000):
+        self.agents = list(agents)
+        self.default = default
+        self.accounts = {str(key): agent for key, agent in (accounts or {}).items()}
+        self.chats = {str(key): agent for key, agent in (chats or {}).items()}
+        self.keywords = keywords or {}
+        for agent in [default, *self.accounts.values(), *self.chats.values(), *self.keywords]:
+            if agent not in self.agents:
+                raise ValueError(f"Маршрут на неизвестного агента: {agent}")
+        self.keyword_matcher = IntentMatcher(self.keywords) if self.keywords else None
+
+        self.max_assignments = max_assignments
+        self._assignments: "OrderedDict[str, str]" = OrderedDict()
+        self.routed: Dict[str, int] = {agent: 0 for agent in self.agents}
+
+    def route(self, user_id: str, chat_id: Optional[str] = None, text: str = '') -> Tuple[str, str]:
+        """(агент, причина выбора)"""
+        agent, reason = self._select(user_id, chat_id, text)
+        self.routed[agent] += 1
+        return agent, reason
+
+    def _select(self, user_id: str, chat_id: Optional[str], text: str) -> Tuple[str, str]:
+        if user_id in self.accounts:
+            return self.accounts[user_id], 'account'
+        if chat_id is not None and chat_id in self.chats:
+            return self.chats[chat_id], 'chat'
+
+        agent = self._assignments.get(user_id)
+        if agent is not None:
+            self._assignments.move_to_end(user_id)
+            return agent, 'conversation'
+
+        agent, reason = self.default, 'default'
+        if self.keyword_matcher and text:
+            matched, _ = self.keyword_matcher.match(text)
+            if matched != 'unknown':
+                agent, reason = matched, 'keyword'
+
+        self._assignments[user_id] = agent
+        if len(self._assignments) > self.max_assignments:
+            self._assignments.popitem(last=False)
+        return agent, reason
+
+    def stats(self) -> Dict:
+        return {
+            'assignments': len(self._assignments),
+            'routed': dict(self.routed)
+        }
+
+
+def load_routing(path: str) -> Dict:
+    """
+    Читает таблицу маршрутизации:
+    {"agents": {"leads": "config/leads.json", ...}, "default": "leads",
+     "accounts": {"<sender_id>": "support"}, "chats": {"<chat_id>": "support"},
+     "keywords": {"ecommerce": ["заказ*", "доставк*"]}}
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        routing = json.load(f)
+    agents = routing.get('agents')
+    if not agents or not isinstance(agents, dict):
+        raise ValueError(f"{path}: нужен непустой раздел agents (имя -> путь к конфигу)")
+    routing.setdefault('default', next(iter(agents)))
+    return routing
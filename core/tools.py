@@ -1,6 +1,12 @@
+import time
 import aiohttp
 from typing import Dict, Any, List
 
+from core.metrics import TOOL_CALLS, stage
+from core.tracing import stage_done
+
+TOOL_SECONDS = stage('tool')
+
 class ToolExecutor:
     """Исполнитель внешних инструментов"""
     
@@ -9,6 +15,14 @@ class ToolExecutor:
     
     async def execute(self, tool_name: str, params: Dict) -> Dict:
         """Выполняет инструмент с заданными параметрами"""
+        started = time.perf_counter()
+        result = await self._execute(tool_name, params)
+        outcome = 'success' if result.get('success') else 'error'
+        stage_done(TOOL_SECONDS, 'tool', started, tool=tool_name, result=outcome)
+        TOOL_CALLS.labels(tool_name, outcome).inc()
+        return result
+    
+    async def _execute(self, tool_name: str, params: Dict) -> Dict:
         tool = self.tools_config.get(tool_name)
         
         if not tool:
@@ -25,7 +39,7 @@ class ToolExecutor:
                 'message': f'Время {params.get("date", "завтра")} доступно для записи'
             }
         
-        elif tool_name == 'save_lead':
+        elif tool_name in ('save_lead', 'save_lead_crm'):
             return {
                 'success': True,
                 'message': 'Лид успешно сохранен в CRM',
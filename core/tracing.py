@@ -0,0 +1,262 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from core.ollama_health import percentile_of
+
+logger = logging.getLogger(__name__)
+
+
+class Trace:
+    """Трасса одного входящего сообщения: этапы (spans) со смещением от начала и длительностью"""
+
+    __slots__ = ('trace_id', 'started', 'wall_started', 'attrs', 'spans')
+
+    def __init__(self, trace_id: str, **attrs: Any):
+        self.trace_id = trace_id
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.attrs = attrs
+        self.spans: List[Dict] = []
+
+    def add_span(self, name: str, started: float, finished: float, **attrs: Any):
+        """Этап по отметкам time.perf_counter(), уже снятым для метрик"""
+        span = {'name': name,
+                'start_ms': round((started - self.started) * 1000, 3),
+                'duration_ms': round((finished - started) * 1000, 3)}
+        if attrs:
+            span.update(attrs)
+        self.spans.append(span)
+
+    def to_dict(self, duration: float) -> Dict:
+        return dict(self.attrs, trace_id=self.trace_id, ts=self.wall_started,
+                    duration_ms=round(duration * 1000, 3), spans=self.spans)
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar('trace', default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    """Трасса обрабатываемого сообщения (None, если трассировка выключена)"""
+    return _current.get()
+
+
+def stage_done(histogram, name: str, started: float, **attrs: Any) -> float:
+    """
+    Завершает этап: время в гистограмму метрик и, если сообщение трассируется, в трассу.
+    Одна отметка времени на оба получателя.
+    """
+    finished = time.perf_counter()
+    histogram.observe(finished - started)
+    trace = _current.get()
+    if trace is not None:
+        trace.add_span(name, started, finished, **attrs)
+    return finished
+
+
+class TraceWriter:
+    """
+    Фоновая запись JSONL (трассы, корпус NLU) с ротацией по размеру: path, path.1 ... path.<backups>;
+    max_bytes=None - без ротации. Очередь ограничена: при переполнении записи отбрасываются,
+    обработка сообщений не ждет диска.
+    """
+
+    def __init__(self, path: str, max_bytes: Optional[int] = 10 * 2 ** 20, backups: int = 5,
+                 max_queue: int = 10000, flush_interval: float = 1.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self._queue: "asyncio.Queue[Dict]" = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._pending: List[Dict] = []
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+
+    def start(self):
+        if self._task is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._task = asyncio.create_task(self._run())
+
+    def put(self, record: Dict):
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def _drain(self):
+        while not self._queue.empty():
+            self._pending.append(self._queue.get_nowait())
+
+    async def _run(self):
+        while True:
+            # Копим трассы flush_interval секунд и пишем одним обращением к диску
+            self._pending.append(await self._queue.get())
+            await asyncio.sleep(self.flush_interval)
+            self._drain()
+            batch, self._pending = self._pending, []
+            await self._write(batch)
+
+    async def _write(self, batch: List[Dict]):
+        lines = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in batch)
+        try:
+            await asyncio.to_thread(self._append, lines)
+            self.written += len(batch)
+        except OSError as e:
+            self.dropped += len(batch)
+            logger.warning(f"⚠️ Не удалось записать {len(batch)} записей в {self.path}: {e}")
+
+    def _append(self, lines: str):
+        if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            self._rotate()
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+
+    def _rotate(self):
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.rotations += 1
+
+    async def close(self):
+        """Останавливает фоновую задачу и дописывает то, что осталось в очереди"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._drain()
+        batch, self._pending = self._pending, []
+        if batch:
+            await self._write(batch)
+
+
+class Tracer:
+    """
+    Трассировка сообщений с выборкой: сохраняется доля sample_rate трасс
+    и все трассы не быстрее slow_ms. Этапы собираются для каждого сообщения
+    (это несколько словарей), решение о записи принимается в конце.
+    """
+
+    def __init__(self, writer: TraceWriter, sample_rate: float = 0.01, slow_ms: float = 2000.0):
+        self.writer = writer
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.traces = 0
+        self.sampled = 0
+        self.slow = 0
+
+    def start(self):
+        self.writer.start()
+
+    def begin(self, **attrs: Any) -> contextvars.Token:
+        """Начинает трассу сообщения в текущей задаче"""
+        return _current.set(Trace(os.urandom(8).hex(), **attrs))
+
+    def end(self, token: contextvars.Token):
+        trace = _current.get()
+        _current.reset(token)
+        if trace is None:
+            return
+        self.traces += 1
+        duration = time.perf_counter() - trace.started
+        slow = self.slow_ms > 0 and duration * 1000 >= self.slow_ms
+        if slow:
+            self.slow += 1
+        elif random.random() >= self.sample_rate:
+            return
+        self.sampled += 1
+        record = trace.to_dict(duration)
+        record['slow'] = slow
+        self.writer.put(record)
+
+    async def close(self):
+        await self.writer.close()
+
+    def stats(self) -> Dict:
+        return {
+            'traces': self.traces,
+            'sampled': self.sampled,
+            'slow': self.slow,
+            'written': self.writer.written,
+            'dropped': self.writer.dropped
+        }
+
+
+def read_traces(path: str) -> List[Dict]:
+    """Трассы из файла и его ротированных копий (path.1, path.2, ...)"""
+    traces = []
+    for candidate in [path] + [f"{path}.{index}" for index in range(1, 100)]:
+        if not os.path.exists(candidate):
+            continue
+        with open(candidate, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    traces.append(json.loads(line))
+                except ValueError:
+                    continue
+    return traces
+
+
+def summarize(traces: List[Dict], top: int = 10) -> str:
+    """Самые медленные трассы и разбивка времени по этапам"""
+    lines = [f"📊 Трасс: {len(traces)}, медленных: {sum(1 for trace in traces if trace.get('slow'))}"]
+    if not traces:
+        return lines[0]
+
+    lines.append(f"\n🐢 Самые медленные ({min(top, len(traces))}):")
+    for trace in sorted(traces, key=lambda trace: trace['duration_ms'], reverse=True)[:top]:
+        when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(trace.get('ts', 0)))
+        lines.append(f"  {trace['trace_id']}  {trace['duration_ms']:9.1f} мс  {when}  "
+                     f"user={trace.get('user')} intent={trace.get('intent')} ({trace.get('source')})")
+        for span in sorted(trace['spans'], key=lambda span: span['start_ms']):
+            details = ', '.join(f"{key}={value}" for key, value in span.items()
+                                if key not in ('name', 'start_ms', 'duration_ms'))
+            lines.append(f"      +{span['start_ms']:8.1f}  {span['name']:<14} {span['duration_ms']:9.1f} мс"
+                         + (f"  {details}" if details else ''))
+
+    durations: Dict[str, List[float]] = defaultdict(list)
+    for trace in traces:
+        for span in trace['spans']:
+            durations[span['name']].append(span['duration_ms'])
+    total = sum(trace['duration_ms'] for trace in traces) or 1.0
+    lines.append("\n⏱️  Этапы (доля от суммарного времени сообщений; вложенные этапы входят во внешние):")
+    lines.append(f"  {'этап':<14} {'кол-во':>7} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'доля':>7}")
+    for name, values in sorted(durations.items(), key=lambda item: sum(item[1]), reverse=True):
+        lines.append(f"  {name:<14} {len(values):>7} {percentile_of(values, 50):>9.1f} "
+                     f"{percentile_of(values, 95):>9.1f} {percentile_of(values, 99):>9.1f} "
+                     f"{sum(values) / total:>6.0%}")
+    return '\n'.join(lines)
+
+
+def main(argv: List[str] = None):
+    """
+    Сводка трасс: python -m core.tracing summary logs/traces.jsonl [число медленных]
+    """
+    argv = argv if argv is not None else sys.argv[1:]
+    if len(argv) not in (2, 3) or argv[0] != 'summary':
+        print(main.__doc__)
+        return 1
+
+    traces = read_traces(argv[1])
+    if not traces:
+        print(f"❌ В {argv[1]} нет трасс")
+        return 1
+    print(summarize(traces, int(argv[2]) if len(argv) == 3 else 10))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
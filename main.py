@@ -6,8 +6,10 @@ import asyncio
 import json
 import logging
 import os
+import signal
 import sys
-from typing import Dict, Any, List  # ДОБАВЛЕНО List
+import time
+from typing import Dict, Any, List, Optional, Tuple
 from dotenv import load_dotenv
 from telethon import TelegramClient
 
@@ -22,43 +24,316 @@ logger = logging.getLogger(__name__)
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
-    from core.nlu import NLUModule
-    from core.dialog_manager import DialogManager
-    from core.response_generator import ResponseGenerator
-    from core.state_manager import StateManager
+    from core.nlu import NLUModule, LocalIntentClassifier
+    from core.llm_cache import LLMCache
+    from core.ollama_client import OllamaClient
+    from core.ollama_health import OllamaHealth
+    from core.ollama_pool import OllamaPool
+    from core.embedding_intent import EmbeddingIntentClassifier
+    from core.config_snapshot import ConfigSnapshot
+    from core.tenants import AgentTenant, TenantRouter, load_routing
+    from core.state_manager import create_state_manager
     from core.scraper import TelegramScraper
-    from core.tools import ToolExecutor
+    from core.dispatcher import MessageDispatcher
+    from core.coalescer import MessageCoalescer
+    from core.answer_streamer import AnswerStreamer, ProgressiveReply
+    from core.llm_context import LLMContextSession, prompt_version
+    from core.metrics import FLOWS, REGISTRY, MetricsServer, stage
+    from core.tracing import TraceWriter, Tracer, current_trace, stage_done
+    from core.profiler import ProfileSession
 except ImportError as e:
     logger.error(f"❌ Ошибка импорта: {e}")
     logger.info("Создайте недостающие файлы модулей")
     sys.exit(1)
 
+# Гистограммы этапов обработки сообщения
+MESSAGE_SECONDS = stage('message')
+STATE_LOAD_SECONDS = stage('state_load')
+STATE_COMMIT_SECONDS = stage('state_commit')
+REPLY_SEND_SECONDS = stage('reply_send')
+LLM_ANSWER_SECONDS = stage('llm_answer')
+
 class UniversalTelegramAgent:
     """Главный класс универсального агента"""
     
-    def __init__(self, config_path: str = "config/leads.json"):
-        # Загрузка конфигурации
-        with open(config_path, 'r', encoding='utf-8') as f:
-            self.config = json.load(f)
-        
-        # Инициализация модулей
-        self.nlu = NLUModule(
-            ollama_url=os.getenv("OLLAMA_URL", "http://localhost:11434"),
-            model=os.getenv("OLLAMA_MODEL", "phi")
+    # Инструмент из секции tools конфига, которым сохраняется собранный лид
+    LEAD_TOOL = 'save_lead_crm'
+    
+    def __init__(self, config_path: str = "config/leads.json", routing_path: str = None):
+        # Общие для всех агентов процесса ресурсы: клиент Ollama (один пул соединений),
+        # кеш LLM, хранилище состояния, диспетчер и склейка сообщений
+        self.ollama_client = self._create_ollama_client()
+        # Контексты Ollama по пользователям (хранятся вместе с состоянием диалога)
+        self.llm_context_reuse = os.getenv("OLLAMA_CONTEXT_REUSE", "true").lower() == "true"
+        self.llm_context_max_tokens = int(os.getenv("OLLAMA_CONTEXT_MAX_TOKENS", "1536"))
+        self.llm_cache = LLMCache(
+            max_size=int(os.getenv("NLU_CACHE_SIZE", "5000")),
+            ttl=float(os.getenv("NLU_CACHE_TTL", "86400")),
+            persist_path=os.getenv("NLU_CACHE_PATH") or None
         )
         
-        self.dialog_manager = DialogManager(self.config)
-        self.response_gen = ResponseGenerator(self.config)
-        self.state_manager = StateManager()
-        self.tool_executor = ToolExecutor(self.config.get('tools', []))
+        self.state_manager = create_state_manager(
+            os.getenv("STATE_BACKEND", "memory"),
+            **self._state_backend_options(os.getenv("STATE_BACKEND", "memory"))
+        )
+        self.dispatcher = MessageDispatcher(
+            workers=int(os.getenv("DISPATCHER_WORKERS", "8")),
+            max_pending=int(os.getenv("DISPATCHER_MAX_PENDING", "1000"))
+        )
+        coalesce_window = float(os.getenv("COALESCE_WINDOW", "0"))
+        self.coalescer = MessageCoalescer(
+            self._dispatch_message,
+            window=coalesce_window,
+            max_hold=float(os.getenv("COALESCE_MAX_HOLD", "4"))
+        ) if coalesce_window > 0 else None
+        # Генеративные ответы на свободные вопросы (потоком, с правкой сообщения)
+        self.answer_streamer = AnswerStreamer(
+            self.ollama_client,
+            intents=tuple(os.getenv("LLM_ANSWER_INTENTS", "unknown,ask_about_product").split(',')),
+            max_tokens=int(os.getenv("LLM_ANSWER_MAX_TOKENS", "200")),
+            max_seconds=float(os.getenv("LLM_ANSWER_MAX_SECONDS", "20"))
+        ) if os.getenv("LLM_ANSWERS", "false").lower() == "true" else None
+        self.answer_edit_interval = float(os.getenv("LLM_ANSWER_EDIT_INTERVAL", "1"))
+        # Корпусы размеченных сообщений для обучения классификатора (по пути: агенты
+        # без {agent} в NLU_CORPUS_PATH пишут в один файл через один фоновый поток)
+        self.corpus_writers: Dict[str, TraceWriter] = {}
+        
+        # Агенты: один конфиг или несколько по таблице маршрутизации.
+        # У каждого свой скомпилированный снимок конфигурации и пространство имен состояния
+        if routing_path:
+            routing = load_routing(routing_path)
+        else:
+            name = os.path.splitext(os.path.basename(config_path))[0]
+            routing = {'agents': {name: config_path}, 'default': name}
+        agents = routing['agents']
+        reload_interval = float(os.getenv("CONFIG_RELOAD_INTERVAL", "1"))
+        self.tenants: Dict[str, AgentTenant] = {
+            name: self._create_tenant(name, path, name if len(agents) > 1 else '', reload_interval)
+            for name, path in agents.items()
+        }
+        self.router = TenantRouter(
+            list(self.tenants), routing['default'],
+            accounts=routing.get('accounts'),
+            chats=routing.get('chats'),
+            keywords=routing.get('keywords')
+        )
+        self.default_tenant = self.tenants[routing['default']]
+        
+        # Метрики Prometheus: http://METRICS_HOST:METRICS_PORT/metrics (0 - выключено)
+        metrics_port = int(os.getenv("METRICS_PORT", "0"))
+        self.metrics_server = MetricsServer(
+            REGISTRY, host=os.getenv("METRICS_HOST", "127.0.0.1"), port=metrics_port
+        ) if metrics_port else None
+        self._register_metrics()
+        # Трассировка сообщений с выборкой (медленные - всегда) в JSONL с ротацией
+        trace_path = os.getenv("TRACE_PATH")
+        self.tracer = Tracer(
+            TraceWriter(trace_path,
+                        max_bytes=int(float(os.getenv("TRACE_MAX_MB", "10")) * 2 ** 20),
+                        backups=int(os.getenv("TRACE_BACKUPS", "5"))),
+            sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "0.01")),
+            slow_ms=float(os.getenv("TRACE_SLOW_MS", "2000"))
+        ) if trace_path else None
+        # Профилирование по запросу, без перезапуска: PROFILE_MESSAGES/PROFILE_SECONDS
+        # при запуске автоответчика, пункт меню или сигнал SIGUSR1 во время работы
+        self.profiler: Optional[ProfileSession] = None
         
         # Telegram клиент
         self.client = None
         self.scraper = None
         
-        logger.info(f"🤖 Агент инициализирован: {self.config['agent_config']['name']}")
-        logger.info(f"🎯 Цели: {self.config['goals']}")
-        logger.info(f"📊 Намерения: {', '.join(self.config['intents'])}")
+        for tenant in self.tenants.values():
+            config = tenant.snapshot.config
+            logger.info(f"🤖 Агент инициализирован: {config['agent_config']['name']} ({tenant.name})")
+            logger.info(f"🎯 Цели: {config['goals']}")
+            logger.info(f"📊 Намерения: {', '.join(config['intents'])}")
+        logger.info(f"💾 Хранилище состояния: {type(self.state_manager).__name__}")
+    
+    @staticmethod
+    def _create_ollama_client() -> OllamaClient:
+        """Один сервер Ollama или пул (OLLAMA_URLS через запятую) с балансировкой и дублированием"""
+        urls = [url.strip() for url in os.getenv("OLLAMA_URLS", "").split(',') if url.strip()]
+        urls = urls or [os.getenv("OLLAMA_URL", "http://localhost:11434")]
+        backends = [
+            OllamaClient(
+                base_url=url,
+                model=os.getenv("OLLAMA_MODEL", "phi"),
+                timeout=float(os.getenv("OLLAMA_TIMEOUT", "10")),
+                keep_alive=os.getenv("OLLAMA_KEEP_ALIVE") or None,
+                health=OllamaHealth(
+                    name=f"Ollama {url}",
+                    failure_threshold=int(os.getenv("OLLAMA_FAILURE_THRESHOLD", "3")),
+                    probe_interval=float(os.getenv("OLLAMA_PROBE_INTERVAL", "5"))
+                )
+            )
+            for url in urls
+        ]
+        if len(backends) == 1:
+            return backends[0]
+        return OllamaPool(
+            backends,
+            hedge_percentile=float(os.getenv("OLLAMA_HEDGE_PERCENTILE", "95")),
+            hedge_min_delay=float(os.getenv("OLLAMA_HEDGE_MIN_DELAY", "0.2"))
+        )
+    
+    def _create_tenant(self, name: str, config_path: str, state_namespace: str,
+                       reload_interval: float) -> AgentTenant:
+        """Агент для конфига: снимок конфигурации и NLU поверх общих клиента и кеша"""
+        # Загрузка конфигурации: проверенный и скомпилированный снимок,
+        # который подменяется целиком при изменении файла
+        snapshot = ConfigSnapshot.load(config_path)
+        
+        # Пути модели и корпуса могут содержать {agent}: у каждого агента свои намерения
+        local_classifier = None
+        classifier_path = os.getenv("NLU_CLASSIFIER_PATH", "").replace("{agent}", name)
+        if classifier_path and os.path.exists(classifier_path):
+            local_classifier = LocalIntentClassifier.load(classifier_path)
+            logger.info(f"🧮 Локальный классификатор загружен: {classifier_path}")
+        corpus_path = os.getenv("NLU_CORPUS_PATH", "").replace("{agent}", name)
+        corpus_writer = None
+        if corpus_path:
+            corpus_writer = self.corpus_writers.setdefault(corpus_path, TraceWriter(corpus_path, max_bytes=None))
+        
+        def create_nlu(snapshot: ConfigSnapshot) -> NLUModule:
+            return self._create_nlu(snapshot, local_classifier, corpus_writer)
+        
+        return AgentTenant(name, config_path, snapshot, create_nlu,
+                           state_namespace=state_namespace, reload_interval=reload_interval)
+    
+    def _create_nlu(self, snapshot: ConfigSnapshot, local_classifier: Optional[LocalIntentClassifier],
+                    corpus_writer: Optional[TraceWriter]) -> NLUModule:
+        """NLU для снимка конфигурации: при перезагрузке создается новый и подменяется вместе со снимком"""
+        embedding_classifier = None
+        if snapshot.config.get('intent_examples') and os.getenv("OLLAMA_EMBED_MODEL"):
+            embedding_classifier = EmbeddingIntentClassifier(
+                self.ollama_client,
+                snapshot.config['intent_examples'],
+                model=os.getenv("OLLAMA_EMBED_MODEL"),
+                cache_dir=os.getenv("EMBEDDINGS_CACHE_DIR", ".cache/embeddings")
+            )
+        
+        return NLUModule(
+            ollama_url=self.ollama_client.base_url,
+            model=self.ollama_client.model,
+            client=self.ollama_client,
+            llm_timeout=self.ollama_client.timeout,
+            intent_keywords=snapshot.intent_keywords,
+            llm_cache=self.llm_cache,
+            entity_extractor=snapshot.entity_extractor,
+            llm_mode=os.getenv("NLU_MODE", "intent"),
+            intents=list(snapshot.intents),
+            embedding_classifier=embedding_classifier,
+            local_classifier=local_classifier,
+            corpus_writer=corpus_writer,
+            state_manager=self.state_manager if self.llm_context_reuse else None,
+            context_max_tokens=self.llm_context_max_tokens
+        )
+    
+    # Интерактивный режим работает с агентом по умолчанию; компоненты,
+    # зависящие от конфигурации, берутся из его текущего снимка
+    @property
+    def snapshot(self) -> ConfigSnapshot:
+        return self.default_tenant.snapshot
+    
+    @property
+    def nlu(self) -> NLUModule:
+        return self.default_tenant.nlu
+    
+    @property
+    def config(self) -> Dict:
+        return self.snapshot.config
+    
+    @property
+    def dialog_manager(self):
+        return self.snapshot.dialog_manager
+    
+    @property
+    def response_gen(self):
+        return self.snapshot.response_gen
+    
+    @property
+    def tool_executor(self):
+        return self.snapshot.tool_executor
+    
+    @staticmethod
+    def _state_backend_options(backend: str) -> Dict[str, Any]:
+        """Параметры хранилища состояния из окружения"""
+        context_ttl = float(os.getenv("OLLAMA_CONTEXT_TTL", "1800")) or None
+        limits = {
+            'idle_ttl': float(os.getenv("STATE_IDLE_TTL", "86400")) or None,
+            'max_users': int(os.getenv("STATE_MAX_USERS", "100000")) or None,
+            'context_ttl': context_ttl
+        }
+        if backend == "memory":
+            return limits
+        if backend == "sqlite":
+            return {
+                'path': os.getenv("DATABASE_URL", "sqlite:///./chat_history.db"),
+                'flush_interval': float(os.getenv("STATE_FLUSH_INTERVAL", "0.5")),
+                **limits
+            }
+        if backend == "redis":
+            return {
+                'host': os.getenv("REDIS_HOST", "localhost"),
+                'port': int(os.getenv("REDIS_PORT", "6379")),
+                'password': os.getenv("REDIS_PASSWORD") or None,
+                'ttl': int(os.getenv("STATE_TTL", str(7 * 24 * 3600))),
+                'context_ttl': context_ttl
+            }
+        return {}
+    
+    def _register_metrics(self):
+        """Показатели, которые вычисляются при запросе /metrics, а не на каждое сообщение"""
+        REGISTRY.gauge_function('agent_dispatcher_pending', 'Сообщений в очереди диспетчера',
+                                lambda: self.dispatcher.stats()['pending'])
+        REGISTRY.gauge_function('agent_dispatcher_active', 'Сообщений в обработке',
+                                lambda: self.dispatcher.stats()['active'])
+        REGISTRY.gauge_function('agent_dispatcher_rejected_total', 'Сообщений, отброшенных при заполненной очереди',
+                                lambda: self.dispatcher.stats()['rejected'], kind='counter')
+        REGISTRY.gauge_function('agent_state_entries', 'Контекстов пользователей в памяти',
+                                lambda: self.state_manager.memory_stats()['entries'])
+        REGISTRY.gauge_function('agent_state_active_dialogs', 'Незавершенных диалогов в памяти',
+                                lambda: self.state_manager.memory_stats()['active_dialogs'])
+        REGISTRY.gauge_function('agent_llm_cache_entries', 'Записей в кеше LLM',
+                                lambda: self.llm_cache.stats()['size'])
+        REGISTRY.gauge_function(
+            'agent_ollama_up', 'Выключатель сервера Ollama замкнут (1) или разомкнут (0)',
+            lambda: {(url, ): float(backend['state'] == 'closed')
+                     for url, backend in self.ollama_client.stats()['backends'].items()},
+            ['backend']
+        )
+    
+    async def start_services(self):
+        """
+        Запускает фоновые задачи (запись состояния, слежение за конфигурацией, метрики)
+        и готовит уровни NLU, которым нужна Ollama (эмбеддинги примеров)
+        """
+        await self.state_manager.start()
+        await self.ollama_client.start()
+        for tenant in self.tenants.values():
+            await tenant.nlu.prepare()
+            tenant.start()
+        if self.metrics_server:
+            await self.metrics_server.start()
+        if self.tracer:
+            self.tracer.start()
+        for writer in self.corpus_writers.values():
+            writer.start()
+    
+    async def shutdown(self):
+        """Сохраняет состояние и закрывает соединения"""
+        for tenant in self.tenants.values():
+            await tenant.stop()
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        if self.tracer:
+            await self.tracer.close()
+        for writer in self.corpus_writers.values():
+            await writer.close()
+        # Клиент Ollama и кеш LLM общие: закрываются один раз
+        self.llm_cache.save()
+        await self.ollama_client.close()
+        await self.state_manager.close()
     
     async def connect_telegram(self):
         """Подключение к Telegram"""
@@ -95,32 +370,105 @@ class UniversalTelegramAgent:
         if not message_text:
             return
         
-        # Обрабатываем сообщение
-        response = await self._process_message_logic(user_id, message_text)
-        
-        # Отправляем ответ
-        await event.reply(response)
+        # Сообщения, отправленные очередью, склеиваются в одно
+        if self.coalescer:
+            await self.coalescer.add(user_id, event, message_text)
+        else:
+            await self._dispatch_message(user_id, [event], message_text)
+    
+    async def _dispatch_message(self, user_id: str, events: List, message_text: str):
+        """Через диспетчер: сообщения пользователя по порядку, разных пользователей - параллельно"""
+        event = events[-1]
+        chat_id = getattr(event, 'chat_id', None)
+        agent, reason = self.router.route(user_id, str(chat_id) if chat_id is not None else None,
+                                          message_text)
+        if len(self.tenants) > 1:
+            logger.info(f"🔀 {user_id} -> агент {agent} ({reason})")
+        tenant = self.tenants[agent]
+        # Очередь заполнена: сообщение отбрасывается сразу, иначе ожидающие задачи
+        # обработчика (Telethon создает по задаче на сообщение) копятся без ограничения
+        if not await self.dispatcher.try_submit(
+                user_id, lambda: self._reply_to_message(event, user_id, message_text, tenant)):
+            logger.warning(f"🚫 Очередь заполнена ({self.dispatcher.max_pending}), "
+                           f"сообщение от {user_id} отброшено: {message_text[:50]}")
+    
+    async def _reply_to_message(self, event, user_id: str, message_text: str, tenant: AgentTenant = None):
+        """Обрабатывает сообщение и отправляет ответ (на последнее сообщение пачки)"""
+        # Трасса охватывает и отправку ответа
+        trace = self._begin_trace(user_id, tenant or self.default_tenant)
+        try:
+            # Генеративный ответ может быть уже отправлен по частям во время обработки
+            reply = ProgressiveReply(event.reply, edit_interval=self.answer_edit_interval)
+            response = await self._process_message_logic(user_id, message_text, tenant, reply)
+            started = time.perf_counter()
+            if reply.sent:
+                await reply.finish(response)
+            else:
+                await event.reply(response)
+            stage_done(REPLY_SEND_SECONDS, 'reply_send', started)
+        finally:
+            if trace is not None:
+                self.tracer.end(trace)
+            if self.profiler is not None:
+                self.profiler.message_done()
+    
+    def _begin_trace(self, user_id: str, tenant: AgentTenant):
+        """Начинает трассу, если трассировка включена и сообщение еще не трассируется"""
+        if self.tracer is None or current_trace() is not None:
+            return None
+        return self.tracer.begin(user=user_id, agent=tenant.name)
+    
+    async def _process_message_logic(self, user_id: str, message: str, tenant: AgentTenant = None,
+                                     reply: ProgressiveReply = None) -> str:
+        """Логика обработки сообщения (с записью в историю диалога)"""
+        tenant = tenant or self.default_tenant
+        state_key = tenant.state_key(user_id)
+        trace = self._begin_trace(user_id, tenant)
+        # Внешние хранилища: одно чтение до и одна запись после обработки
+        started = time.perf_counter()
+        await self.state_manager.load_user(state_key)
+        stage_done(STATE_LOAD_SECONDS, 'state_load', started)
+        try:
+            # Снимок конфигурации фиксируется на всё время обработки сообщения
+            response = await self._run_dialog_pipeline(state_key, message, tenant.nlu, tenant.snapshot, reply)
+            self.state_manager.update_dialog_history(state_key, message, response)
+        finally:
+            processed = time.perf_counter()
+            await self.state_manager.commit_user(state_key)
+            finished = stage_done(STATE_COMMIT_SECONDS, 'state_commit', processed)
+            MESSAGE_SECONDS.observe(finished - started)
+            if trace is not None:
+                self.tracer.end(trace)
+        return response
     
-    async def _process_message_logic(self, user_id: str, message: str) -> str:
-        """Логика обработки сообщения"""
+    async def _run_dialog_pipeline(self, user_id: str, message: str, nlu: NLUModule,
+                                   snapshot: ConfigSnapshot, reply: ProgressiveReply = None) -> str:
+        """NLU, диалоговый автомат и генерация ответа"""
+        dialog_manager, response_gen = snapshot.dialog_manager, snapshot.response_gen
         logger.info(f"📥 Сообщение от {user_id}: {message[:100]}")
         
         # 1. Получаем контекст
         context = self.state_manager.get_user_context(user_id)
         
         # 2. Анализируем намерение
-        nlu_result = self.nlu.extract_intent_and_entities(message, context)
+        nlu_result = await nlu.extract_intent_and_entities(message, context, user_id=user_id)
         intent = nlu_result['intent']
         entities = nlu_result['entities']
         
         logger.info(f"🧠 Намерение: {intent} (уверенность: {nlu_result['confidence']:.2f})")
+        trace = current_trace()
+        if trace is not None:
+            trace.attrs.update(intent=intent, source=nlu_result['source'])
         if entities:
             logger.info(f"📝 Сущности: {entities}")
         
-        # 3. Обработка специальных намерений
+        # 3. Обработка специальных намерений (сброс незавершенного сценария - брошенный сценарий)
+        if intent in ('greeting', 'goodbye', 'decline_offer') and context.get('active_goal'):
+            FLOWS.labels(context['active_goal'], 'abandoned').inc()
+        
         if intent == 'greeting':
             self.state_manager.clear_user_context(user_id)
-            return self.response_gen.generate_from_template('welcome_message')
+            return response_gen.generate_from_template('welcome_message')
         
         elif intent == 'goodbye':
             self.state_manager.clear_user_context(user_id)
@@ -129,114 +477,75 @@ class UniversalTelegramAgent:
         elif intent == 'thanks':
             return "Всегда рад помочь! 😊"
         
-        # 4. Если нет активного диалога, начинаем новый
-        if not context.get('active_goal'):
-            # Определяем цель по намерению
-            goal_map = {
-                'express_interest': 'collect_contact_info',
-                'ask_about_product': 'qualify_lead',
-                'request_price': 'collect_contact_info',
-                'schedule_meeting': 'schedule_demo',
-                'request_info': 'collect_contact_info'
-            }
-            
-            goal = goal_map.get(intent, 'collect_contact_info')
-            
-            # Инициализируем диалог
-            self.dialog_manager.initialize_conversation(goal)
-            self.state_manager.set_user_context(user_id, {
-                'active_goal': goal,
-                'current_step': 0,
-                'collected_data': {},
-                'last_intent': intent
-            })
-            
-            # Если есть сущности, сразу сохраняем
-            if entities:
-                self.state_manager.update_user_data(user_id, entities)
-            
-            # Возвращаем первый вопрос
-            return self._get_next_question(user_id)
-        
-        # 5. Если диалог активен, продолжаем
+        elif intent == 'decline_offer':
+            self.state_manager.clear_user_context(user_id)
+            return "Понял, не буду беспокоить. Если передумаете - просто напишите!"
+        
+        # Свободный вопрос вне ожидания ответа на вопрос сценария: генеративный ответ.
+        # Положение в диалоге не меняется; при ошибке LLM отвечает обычный сценарий
+        if (self.answer_streamer and intent in self.answer_streamer.intents
+                and not context.get('awaiting_slot') and self.ollama_client.available):
+            started = time.perf_counter()
+            answer = await self._generate_answer(user_id, message, snapshot, reply)
+            stage_done(LLM_ANSWER_SECONDS, 'llm_answer', started)
+            if answer:
+                return answer
+        
+        # 4. Если нет активного диалога, начинаем новый; иначе продолжаем текущий.
+        # Положение в диалоге хранится только в контексте пользователя
+        # (цель, удаленная из конфигурации при перезагрузке, начинается заново)
+        if context.get('active_goal') not in dialog_manager.flows:
+            context = dialog_manager.initialize_conversation(intent)
+            FLOWS.labels(context['active_goal'], 'started').inc()
         else:
-            # Обновляем собранные данные
-            if entities:
-                self.state_manager.update_user_data(user_id, entities)
-            
-            # Переходим к следующему шагу
-            return self._get_next_question(user_id)
-    
-    def _get_next_question(self, user_id: str) -> str:
-        """Получает следующий вопрос для пользователя"""
-        context = self.state_manager.get_user_context(user_id)
-        goal = context.get('active_goal')
-        step = context.get('current_step', 0)
-        
-        if not goal:
-            return self.response_gen.generate_from_template('welcome_message')
-        
-        # Получаем следующий шаг из конфигурации
-        flows = self.config.get('dialog_flows', {}).get(goal, [])
+            context = dict(context, last_intent=intent)
         
-        if step >= len(flows):
-            # Диалог завершен
-            collected_data = context.get('collected_data', {})
-            
-            # Проверяем, есть ли достаточные данные
-            if self._has_enough_data(collected_data):
-                # Вызываем инструмент для сохранения лида
-                self._save_lead_data(user_id, collected_data)
-                
-                # Очищаем контекст
-                self.state_manager.clear_user_context(user_id)
-                
-                return self.response_gen.generate_from_template('success_message', collected_data)
-            else:
-                # Запрашиваем недостающие данные
-                return self._ask_for_missing_data(collected_data)
+        context['collected_data'] = dialog_manager.fill_slots(context, message, entities)
         
-        # Получаем текущий шаг
-        current_step = flows[step]
+        # 5. Следующий шаг автомата: O(1) переход по заранее посчитанной таблице
+        action, updates = dialog_manager.get_next_action(context)
+        context.update(updates)
+        collected_data = context['collected_data']
         
-        # Обновляем шаг
-        self.state_manager.update_user_context(user_id, {'current_step': step + 1})
-        
-        # Генерируем ответ
-        if current_step.get('type') == 'generate_response':
-            template = current_step.get('template', 'welcome_message')
-            return self.response_gen.generate_from_template(template, context.get('collected_data', {}))
+        if action.type == 'complete':
+            # Вызываем инструмент для сохранения лида и очищаем контекст
+            await self._save_lead_data(user_id, collected_data, snapshot)
+            self.state_manager.clear_user_context(user_id)
+            FLOWS.labels(context['active_goal'], 'completed').inc()
+            return response_gen.generate_from_template(action.template, collected_data)
         
-        elif current_step.get('type') == 'collect_entity':
-            entity = current_step.get('entity')
-            template = current_step.get('question_template', f'ask_{entity}')
-            
-            # Проверяем, может быть уже собрали эту сущность
-            if entity in context.get('collected_data', {}):
-                return self._get_next_question(user_id)
-            
-            return self.response_gen.generate_from_template(template, {})
+        self.state_manager.set_user_context(user_id, context)
         
-        return "Как я могу вам помочь?"
+        if action.type == 'ask':
+            return response_gen.generate_from_template(action.template, {})
+        return response_gen.generate_from_template(action.template, collected_data)
     
-    def _has_enough_data(self, data: Dict) -> bool:
-        """Проверяет, достаточно ли данных для сохранения лида"""
-        required = ['name', 'email']
-        return all(key in data and data[key] for key in required)
-    
-    def _ask_for_missing_data(self, data: Dict) -> str:
-        """Запрашивает недостающие данные"""
-        if 'name' not in data or not data['name']:
-            return self.response_gen.generate_entity_prompt('user_name')
-        elif 'email' not in data or not data['email']:
-            return self.response_gen.generate_entity_prompt('user_email')
-        
-        return "Что еще вас интересует?"
+    async def _generate_answer(self, user_id: str, message: str, snapshot: ConfigSnapshot,
+                               reply: ProgressiveReply = None) -> Optional[str]:
+        """Генеративный ответ; при сохраненном контексте Ollama отправляется только новая реплика"""
+        streamer = self.answer_streamer
+        instruction = streamer.instruction(snapshot.config)
+        if not self.llm_context_reuse:
+            prompt = instruction + streamer.history_block(self.state_manager.get_dialog_history(user_id))
+            return await streamer.answer(prompt + streamer.turn(message), reply)
+        
+        session = LLMContextSession(
+            self.state_manager, user_id, 'answer',
+            prompt_version(self.ollama_client.model, instruction),
+            max_tokens=self.llm_context_max_tokens
+        )
+        prompt, extra = session.request(
+            instruction + streamer.history_block(self.state_manager.get_dialog_history(user_id)),
+            streamer.turn(message)
+        )
+        return await streamer.answer(prompt, reply, context=extra.get('context'), session=session)
     
-    def _save_lead_data(self, user_id: str, data: Dict):
-        """Сохраняет данные лида (заглушка)"""
+    async def _save_lead_data(self, user_id: str, data: Dict, snapshot: ConfigSnapshot):
+        """Сохраняет данные лида инструментом LEAD_TOOL из конфигурации (через ToolExecutor)"""
         logger.info(f"💾 Сохранение лида от {user_id}: {data}")
-        # Здесь будет вызов API CRM
+        result = await snapshot.tool_executor.execute(self.LEAD_TOOL, {'user_id': user_id, **data})
+        if not result.get('success'):
+            logger.warning(f"⚠️ Лид от {user_id} не сохранен: {result.get('error')}")
     
     async def parse_group_command(self, group_identifier: str):
         """Команда парсинга группы"""
@@ -295,11 +604,12 @@ class UniversalTelegramAgent:
         print("3. Рассылка по спаршеным пользователям")
         print("4. Статистика")
         print("5. Запуск автоответчика")
+        print("6. Запуск автоответчика с профилированием")
         print("0. Выход")
         print("="*60)
         
         while True:
-            choice = input("\nВыберите действие (0-5): ").strip()
+            choice = input("\nВыберите действие (0-6): ").strip()
             
             if choice == "1":
                 await self.test_dialog()
@@ -311,6 +621,8 @@ class UniversalTelegramAgent:
                 self.show_stats()
             elif choice == "5":
                 await self.start_auto_responder()
+            elif choice == "6":
+                await self.profile_ui()
             elif choice == "0":
                 print("👋 Выход...")
                 break
@@ -323,7 +635,10 @@ class UniversalTelegramAgent:
         print("-"*30)
         
         test_user = "test_user_001"
-        self.state_manager.clear_user_context(test_user)
+        state_key = self.default_tenant.state_key(test_user)
+        await self.state_manager.load_user(state_key)
+        self.state_manager.clear_user_context(state_key)
+        await self.state_manager.commit_user(state_key)
         
         while True:
             user_input = input("\nВы: ").strip()
@@ -389,10 +704,100 @@ class UniversalTelegramAgent:
         print(f"🤖 Агент: {self.config['agent_config']['name']}")
         print(f"🎯 Цели: {', '.join(self.config['goals'])}")
         print(f"🧠 Модель NLU: {self.nlu.model}")
-        print(f"💾 Состояний в памяти: {len(self.state_manager.user_states)}")
+        ollama = self.ollama_client.stats()
+        for url, health in ollama['backends'].items():
+            print(f"🔌 Ollama {url}: {'доступен' if health['state'] == 'closed' else 'НЕДОСТУПЕН'}, "
+                  f"в работе {health['in_flight']}, ошибок {health['error_rate']:.0%}, "
+                  f"p50 {health['p50'] * 1000:.0f} мс, p95 {health['p95'] * 1000:.0f} мс, "
+                  f"размыканий {health['times_opened']}")
+        if 'hedged' in ollama:
+            print(f"🔀 Дублирование запросов: {ollama['hedged']} (выиграли {ollama['hedge_wins']}), "
+                  f"переключений после ошибки {ollama['failovers']}")
+        for tenant in self.tenants.values():
+            if tenant.config_watcher:
+                watcher = tenant.config_watcher.stats()
+                print(f"🔄 Конфигурация {tenant.name}: версия {watcher['version']}, "
+                      f"перезагрузок {watcher['reloads']}, ошибок {watcher['failures']}")
+        if len(self.tenants) > 1:
+            routes = self.router.stats()
+            print(f"🔀 Маршрутизация: {', '.join(f'{agent}={count}' for agent, count in routes['routed'].items())}; "
+                  f"закреплено разговоров {routes['assignments']}")
+        memory = self.state_manager.memory_stats()
+        print(f"💾 Состояний в памяти: {memory['entries']} (активных диалогов {memory['active_dialogs']}), "
+              f"~{memory['approx_bytes'] / 1024:.1f} КБ; истекло {memory['expired']}, "
+              f"вытеснено {memory['evicted']}")
+        if hasattr(self.state_manager, 'stats'):
+            storage = self.state_manager.stats()
+            print(f"🗄️  Хранилище: {', '.join(f'{key}={value}' for key, value in storage.items())}")
+        cache = self.llm_cache.stats()
+        print(f"⚡ Кеш LLM: {cache['size']} записей, попаданий {cache['hits']}, "
+              f"промахов {cache['misses']} ({cache['hit_rate']:.0%})")
+        queue = self.dispatcher.stats()
+        print(f"📬 Очередь сообщений: {queue['pending']} ожидают, {queue['active']}/{queue['workers']} в работе, "
+              f"обработано {queue['processed']}, отброшено {queue['rejected']}, ожидание ср. {queue['avg_wait'] * 1000:.0f} мс, "
+              f"макс. {queue['max_wait'] * 1000:.0f} мс")
+        if self.answer_streamer:
+            answers = self.answer_streamer.stats()
+            print(f"✍️  Генеративные ответы: {answers['answers']} (обрезано {answers['truncated']}, "
+                  f"ошибок {answers['failures']}), первый текст ср. {answers['avg_first_text'] * 1000:.0f} мс")
+        if self.coalescer:
+            bursts = self.coalescer.stats()
+            print(f"🧩 Склейка: получено {bursts['received']}, передано {bursts['flushed']} "
+                  f"(окно {self.coalescer.window} с)")
+        if self.metrics_server:
+            print(f"📈 Метрики: http://{self.metrics_server.host}:{self.metrics_server.port}/metrics")
+        if self.tracer:
+            traces = self.tracer.stats()
+            print(f"🧵 Трассы: {traces['traces']} сообщений, записано {traces['written']} "
+                  f"(медленных {traces['slow']}, отброшено {traces['dropped']}) в {self.tracer.writer.path}")
+    
+    @staticmethod
+    def _profile_limits() -> Tuple[Optional[int], Optional[float]]:
+        """Ограничения сессии профилирования из окружения (None - не задано)"""
+        messages = int(os.getenv("PROFILE_MESSAGES", "0")) or None
+        seconds = float(os.getenv("PROFILE_SECONDS", "0")) or None
+        return messages, seconds
+    
+    def start_profiling(self, messages: int = None, seconds: float = None) -> ProfileSession:
+        """Запускает профилирование работающего автоответчика (N сообщений или T секунд)"""
+        if self.profiler is not None and self.profiler.active:
+            logger.info("🔬 Профилирование уже идет")
+            return self.profiler
+        if not messages and not seconds:
+            messages, seconds = self._profile_limits()
+            seconds = seconds or (None if messages else 60.0)
+        self.profiler = ProfileSession(
+            output_dir=os.getenv("PROFILE_DIR", "logs/profiles"),
+            messages=messages,
+            seconds=seconds,
+            top=int(os.getenv("PROFILE_TOP", "20")),
+            on_finish=self._profiling_finished
+        )
+        self.profiler.start()
+        return self.profiler
+    
+    def _profiling_finished(self, session: ProfileSession):
+        print("\n" + session.report())
+        print(f"🔬 Отчет и свернутые стеки (.cpu/.wall.collapsed): {session.report_path}")
+        if self.profiler is session:
+            self.profiler = None
+    
+    async def profile_ui(self):
+        """Автоответчик с профилированием первых N сообщений или T секунд"""
+        print("\n🔬 ПРОФИЛИРОВАНИЕ АВТООТВЕТЧИКА")
+        print("-"*30)
+        messages = input("Сколько сообщений профилировать (Enter - без ограничения): ").strip()
+        seconds = input("Сколько секунд профилировать (Enter - 60, если не задано число сообщений): ").strip()
+        try:
+            messages = int(messages) if messages else None
+            seconds = float(seconds) if seconds else (None if messages else 60.0)
+        except ValueError:
+            print("❌ Нужно число")
+            return
+        await self.start_auto_responder(profile=(messages, seconds))
     
-    async def start_auto_responder(self):
-        """Запускает автоответчика"""
+    async def start_auto_responder(self, profile: Tuple[Optional[int], Optional[float]] = None):
+        """Запускает автоответчика (profile - сразу включить профилирование: сообщений, секунд)"""
         print("\n🤖 ЗАПУСК АВТООТВЕТЧИКА")
         print("-"*30)
         print("Бот будет отвечать на все входящие сообщения")
@@ -402,10 +807,28 @@ class UniversalTelegramAgent:
         async def handler(event):
             await self.process_incoming_message(event)
         
+        self.dispatcher.start()
+        if profile or any(self._profile_limits()):
+            self.start_profiling(*(profile or self._profile_limits()))
+        # Профилирование без перезапуска: kill -USR1 <pid>
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGUSR1, self.start_profiling)
+            print(f"🔬 Профилирование во время работы: kill -USR1 {os.getpid()}")
+        except (NotImplementedError, AttributeError):
+            loop = None  # нет сигналов (Windows): только через меню и окружение
         try:
             await self.client.run_until_disconnected()
         except KeyboardInterrupt:
             print("\n⏹️  Автоответчик остановлен")
+        finally:
+            if loop is not None:
+                loop.remove_signal_handler(signal.SIGUSR1)
+            if self.profiler is not None:
+                await self.profiler.stop()
+            if self.coalescer:
+                await self.coalescer.flush_all()
+            await self.dispatcher.stop()
 
 async def main():
     """Главная функция"""
@@ -423,15 +846,19 @@ async def main():
         return
     
     # Создаем агента
-    agent = UniversalTelegramAgent("config/leads.json")
+    agent = UniversalTelegramAgent("config/leads.json", routing_path=os.getenv("AGENT_ROUTING") or None)
+    await agent.start_services()
     
-    # Подключаемся к Telegram
-    if not await agent.connect_telegram():
-        print("❌ Не удалось подключиться к Telegram")
-        return
-    
-    # Запускаем интерактивный режим
-    await agent.interactive_mode()
+    try:
+        # Подключаемся к Telegram
+        if not await agent.connect_telegram():
+            print("❌ Не удалось подключиться к Telegram")
+            return
+        
+        # Запускаем интерактивный режим
+        await agent.interactive_mode()
+    finally:
+        await agent.shutdown()
     
     # Отключаемся
     if agent.client:
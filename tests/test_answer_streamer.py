@@ -0,0 +1,99 @@
+import asyncio
+
+from benchmarks.fake_ollama import FakeOllama
+from core.answer_streamer import AnswerStreamer, ProgressiveReply, first_sentence
+from core.ollama_client import OllamaClient
+from core.ollama_health import OllamaHealth
+
+ANSWER = "Мы помогаем автоматизировать продажи. Подробности расскажет менеджер."
+
+
+class FakeMessage:
+    def __init__(self, text, fail_edits=False):
+        self.texts = [text]
+        self.fail_edits = fail_edits
+
+    async def edit(self, text):
+        if self.fail_edits:
+            raise RuntimeError("flood wait")
+        self.texts.append(text)
+
+
+class FakeChat:
+    def __init__(self, fail_edits=False):
+        self.fail_edits = fail_edits
+        self.messages = []
+
+    async def send(self, text):
+        message = FakeMessage(text, self.fail_edits)
+        self.messages.append(message)
+        return message
+
+
+def test_first_sentence():
+    assert first_sentence("Да. Мы работаем с CRM. И еще") == "Да. Мы работаем с CRM."
+    assert first_sentence("Версия 2.0 вышла") is None
+    assert first_sentence("Первая строка\nвторая") == "Первая строка"
+
+
+def test_progressive_reply_throttles_edits():
+    chat = FakeChat()
+
+    async def scenario():
+        reply = ProgressiveReply(chat.send, edit_interval=60)
+        await reply.update("Первое.")
+        await reply.update("Первое. Второе")
+        await reply.finish("Первое. Второе. Третье.")
+        return reply
+
+    reply = asyncio.run(scenario())
+    assert len(chat.messages) == 1
+    assert chat.messages[0].texts == ["Первое.", "Первое. Второе. Третье."]
+    assert reply.edits == 1
+
+
+def test_failed_edit_is_not_fatal():
+    chat = FakeChat(fail_edits=True)
+
+    async def scenario():
+        reply = ProgressiveReply(chat.send, edit_interval=0)
+        await reply.update("Первое.")
+        await reply.finish("Первое. Второе.")
+        return reply
+
+    reply = asyncio.run(scenario())
+    assert reply.text == "Первое." and reply.edits == 0
+
+
+def _answer(max_tokens=200, url=None, reply_chat=None):
+    async def scenario():
+        server = FakeOllama(latency=0.0, tokens_per_second=500)
+        client = OllamaClient(url or await server.start(), "phi", health=OllamaHealth(probe_interval=0))
+        streamer = AnswerStreamer(client, max_tokens=max_tokens)
+        reply = ProgressiveReply(reply_chat.send, edit_interval=60) if reply_chat else None
+        try:
+            return await streamer.answer("Вопрос", reply), streamer.stats()
+        finally:
+            await client.close()
+            await server.stop()
+
+    return asyncio.run(scenario())
+
+
+def test_answer_streams_first_sentence_then_final_text():
+    chat = FakeChat()
+    text, stats = _answer(reply_chat=chat)
+    assert text == ANSWER
+    assert chat.messages[0].texts == ["Мы помогаем автоматизировать продажи.", ANSWER]
+    assert stats['answers'] == 1 and stats['avg_first_text'] > 0
+
+
+def test_token_budget_truncates_answer():
+    text, stats = _answer(max_tokens=3)
+    assert text == "Мы помогаем автоматизировать…"
+    assert stats['truncated'] == 1
+
+
+def test_unreachable_server_falls_back_to_scenario():
+    text, stats = _answer(url="http://127.0.0.1:1")
+    assert text is None and stats['failures'] == 1
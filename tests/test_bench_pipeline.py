@@ -0,0 +1,18 @@
+import asyncio
+import json
+
+from benchmarks import bench_pipeline
+
+
+def test_pipeline_benchmark_smoke(tmp_path):
+    output = str(tmp_path / "pipeline.json")
+    asyncio.run(bench_pipeline.main(['--concurrency', '1,2', '--rounds', '1', '--latency', '0',
+                                     '--jitter', '0', '--output', output]))
+
+    with open(output, encoding='utf-8') as f:
+        result = json.load(f)
+    assert [level['concurrency'] for level in result['levels']] == [1, 2]
+    for level in result['levels']:
+        assert level['messages'] > 0 and level['errors'] == 0
+        assert level['total']['p95_ms'] >= level['total']['p50_ms']
+        assert 'nlu_rules' in level['stages']
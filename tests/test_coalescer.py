@@ -0,0 +1,86 @@
+import asyncio
+
+from core.coalescer import MessageCoalescer
+
+
+def _collector():
+    flushed = []
+
+    async def on_flush(user_id, events, text):
+        flushed.append((user_id, events, text))
+
+    return flushed, on_flush
+
+
+def test_burst_is_joined_into_one_message():
+    flushed, on_flush = _collector()
+
+    async def scenario():
+        coalescer = MessageCoalescer(on_flush, window=0.05, max_hold=1)
+        for index, text in enumerate(["привет", "сколько стоит", "для 10 человек"]):
+            await coalescer.add("u", index, text)
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+        return coalescer.stats()
+
+    stats = asyncio.run(scenario())
+    assert flushed == [("u", [0, 1, 2], "привет\nсколько стоит\nдля 10 человек")]
+    assert stats == {'holding': 0, 'received': 3, 'flushed': 1}
+
+
+def test_users_are_coalesced_separately():
+    flushed, on_flush = _collector()
+
+    async def scenario():
+        coalescer = MessageCoalescer(on_flush, window=0.02)
+        await coalescer.add("a", 1, "привет")
+        await coalescer.add("b", 2, "здравствуйте")
+        await asyncio.sleep(0.06)
+
+    asyncio.run(scenario())
+    assert sorted(text for _, _, text in flushed) == ["здравствуйте", "привет"]
+
+
+def test_max_hold_limits_delay_of_continuous_typing():
+    flushed, on_flush = _collector()
+
+    async def scenario():
+        coalescer = MessageCoalescer(on_flush, window=0.05, max_hold=0.1)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        # Сообщения чаще окна: без max_hold пачка не отдавалась бы никогда
+        while loop.time() - started < 0.25:
+            await coalescer.add("u", None, "ещё")
+            await asyncio.sleep(0.02)
+        await coalescer.flush_all()
+
+    asyncio.run(scenario())
+    assert len(flushed) >= 2
+
+
+def test_flush_all_delivers_pending_bursts_once():
+    flushed, on_flush = _collector()
+
+    async def scenario():
+        coalescer = MessageCoalescer(on_flush, window=10)
+        await coalescer.add("u", 1, "привет")
+        await coalescer.flush_all()
+        await coalescer.flush_all()
+
+    asyncio.run(scenario())
+    assert flushed == [("u", [1], "привет")]
+
+
+def test_flush_error_does_not_break_coalescer():
+    async def failing(user_id, events, text):
+        raise RuntimeError("сбой")
+
+    async def scenario():
+        coalescer = MessageCoalescer(failing, window=0.01)
+        await coalescer.add("u", 1, "привет")
+        await asyncio.sleep(0.05)
+        await coalescer.add("u", 2, "еще")
+        await coalescer.flush_all()
+        return coalescer.stats()
+
+    assert asyncio.run(scenario())['flushed'] == 2
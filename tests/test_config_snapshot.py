@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+import pytest
+
+from core.config_snapshot import ConfigSnapshot, ConfigWatcher
+from utils.config_loader import ConfigError
+
+with open("config/leads.json", encoding='utf-8') as f:
+    LEADS = json.load(f)
+
+
+def _write(path, config):
+    path.write_text(json.dumps(config, ensure_ascii=False), encoding='utf-8')
+
+
+def test_invalid_configs_are_rejected(tmp_path):
+    path = tmp_path / "agent.json"
+    path.write_text('{"agent_config": ', encoding='utf-8')
+    with pytest.raises(ConfigError):
+        ConfigSnapshot.load(str(path))
+
+    _write(path, {key: value for key, value in LEADS.items() if key != 'goals'})
+    with pytest.raises(ConfigError):
+        ConfigSnapshot.load(str(path))
+
+
+def test_watcher_applies_valid_change_and_keeps_old_on_error(tmp_path):
+    path = tmp_path / "agent.json"
+    _write(path, LEADS)
+    applied = []
+
+    async def on_reload(snapshot):
+        applied.append(snapshot)
+
+    async def scenario():
+        watcher = ConfigWatcher(str(path), on_reload, interval=0.01)
+        watcher.start()
+
+        _write(path, dict(LEADS, templates=dict(LEADS['templates'], fallback="Уточните вопрос")))
+        await asyncio.sleep(0.1)
+        path.write_text('{"broken": ', encoding='utf-8')
+        await asyncio.sleep(0.1)
+        await watcher.stop()
+        return watcher.stats()
+
+    stats = asyncio.run(scenario())
+    assert [snapshot.version for snapshot in applied] == [2]
+    assert applied[0].response_gen.generate_from_template('missing') == "Уточните вопрос"
+    assert stats['reloads'] == 1 and stats['failures'] == 1 and stats['version'] == 2
+    assert stats['last_error']
+
+
+def test_failed_apply_keeps_version(tmp_path):
+    path = tmp_path / "agent.json"
+    _write(path, LEADS)
+
+    async def on_reload(snapshot):
+        raise RuntimeError("не удалось применить")
+
+    watcher = ConfigWatcher(str(path), on_reload)
+    assert not asyncio.run(watcher.reload())
+    assert watcher.version == 1 and watcher.failures == 1
@@ -0,0 +1,12 @@
+import glob
+
+import pytest
+
+from core.config_snapshot import ConfigSnapshot
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob("config/*.json")))
+def test_shipped_configs_are_valid(path):
+    snapshot = ConfigSnapshot.load(path)
+    assert snapshot.dialog_manager.flows
+    assert snapshot.dialog_manager.default_goal in snapshot.goals
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from core.dialog_manager import DialogConfigError, DialogManager
+from core.entity_extractor import EntityExtractor
+
+with open("config/leads.json", 'r', encoding='utf-8') as f:
+    CONFIG = json.load(f)
+
+
+@pytest.fixture
+def manager():
+    return DialogManager(CONFIG)
+
+
+@pytest.fixture
+def extractor():
+    return EntityExtractor(CONFIG)
+
+
+def awaiting(slot, collected=None):
+    return {'active_goal': 'collect_contact_info', 'current_step': 2,
+            'collected_data': collected or {}, 'awaiting_slot': slot}
+
+
+def test_free_text_answer_fills_awaited_slot(manager, extractor):
+    message = "Иван"
+    collected = manager.fill_slots(awaiting('user_name'), message, extractor.extract_slots(message))
+    assert collected == {'user_name': "Иван"}
+
+
+def test_other_entity_does_not_fill_awaited_free_text_slot(manager, extractor):
+    message = "ivan@example.com"
+    collected = manager.fill_slots(awaiting('user_name'), message, extractor.extract_slots(message))
+    assert collected == {'user_email': "ivan@example.com"}
+
+
+def test_validated_slot_is_not_filled_with_free_text(manager):
+    collected = manager.fill_slots(awaiting('user_email', {'user_name': "Иван"}), "не скажу", {})
+    assert collected == {'user_name': "Иван"}
+
+
+def test_flow_skips_collected_slots_and_completes(manager):
+    context = manager.initialize_conversation('express_interest')
+    assert context['active_goal'] == 'collect_contact_info'
+
+    action, changes = manager.get_next_action(context)
+    assert action.type == 'respond'
+    context.update(changes, collected_data={'user_name': "Иван"})
+
+    # Имя уже известно: следующим спрашивается email
+    action, changes = manager.get_next_action(context)
+    assert (action.type, action.entity) == ('ask', 'user_email')
+    context.update(changes)
+
+    context['collected_data'] = manager.fill_slots(context, "ivan@mail.ru", {'user_email': "ivan@mail.ru"})
+    action, changes = manager.get_next_action(context)
+    assert action.type == 'respond'
+    context.update(changes)
+    action, _ = manager.get_next_action(context)
+    assert action.type == 'complete'
+
+
+def test_context_is_not_mutated(manager):
+    context = manager.initialize_conversation('schedule_meeting')
+    snapshot = dict(context)
+    manager.get_next_action(context)
+    assert context == snapshot
+
+
+def test_unknown_template_is_rejected():
+    config = {'templates': {'success_message': "ok"},
+              'dialog_flows': {'collect_contact_info': [{'type': 'generate_response', 'template': 'missing'}]}}
+    with pytest.raises(DialogConfigError):
+        DialogManager(config)
@@ -0,0 +1,87 @@
+import asyncio
+
+from core.dispatcher import MessageDispatcher
+
+
+def test_messages_of_one_user_run_in_order():
+    async def scenario():
+        dispatcher = MessageDispatcher(workers=4)
+        done = []
+
+        def job(user_id, index):
+            async def run():
+                await asyncio.sleep(0.01 * (3 - index))
+                done.append((user_id, index))
+            return run
+
+        for index in range(3):
+            for user_id in ("a", "b"):
+                await dispatcher.submit(user_id, job(user_id, index))
+        await dispatcher.stop()
+        return done
+
+    done = asyncio.run(scenario())
+    for user_id in ("a", "b"):
+        assert [index for user, index in done if user == user_id] == [0, 1, 2]
+
+
+def test_users_processed_in_parallel():
+    async def scenario():
+        dispatcher = MessageDispatcher(workers=2)
+        gate = asyncio.Event()
+        started = []
+
+        async def wait(user_id):
+            started.append(user_id)
+            await gate.wait()
+
+        await dispatcher.submit("a", lambda: wait("a"))
+        await dispatcher.submit("b", lambda: wait("b"))
+        await asyncio.sleep(0.01)
+        gate.set()
+        await dispatcher.stop()
+        return started
+
+    assert sorted(asyncio.run(scenario())) == ["a", "b"]
+
+
+def test_failed_job_does_not_stop_user_queue():
+    async def scenario():
+        dispatcher = MessageDispatcher(workers=1)
+        done = []
+
+        async def fail():
+            raise RuntimeError("сбой")
+
+        async def ok():
+            done.append("ok")
+
+        await dispatcher.submit("a", fail)
+        await dispatcher.submit("a", ok)
+        await dispatcher.stop()
+        return dispatcher.stats(), done
+
+    stats, done = asyncio.run(scenario())
+    assert done == ["ok"]
+    assert stats['failed'] == 1 and stats['processed'] == 1
+
+
+def test_try_submit_rejects_when_full():
+    async def scenario():
+        dispatcher = MessageDispatcher(workers=1, max_pending=2)
+        gate = asyncio.Event()
+
+        async def blocked():
+            await gate.wait()
+
+        accepted = [await dispatcher.try_submit(str(i), blocked) for i in range(4)]
+        gate.set()
+        await dispatcher.join()
+        # Место освободилось: снова принимается
+        accepted.append(await dispatcher.try_submit("later", blocked))
+        await dispatcher.stop()
+        return accepted, dispatcher.stats()
+
+    accepted, stats = asyncio.run(scenario())
+    assert accepted == [True, True, False, False, True]
+    assert stats['rejected'] == 2
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from core.embedding_intent import EmbeddingIntentClassifier
+from core.ollama_client import OllamaError
+
+EXAMPLES = {
+    'request_price': ["сколько стоит", "какая цена"],
+    'schedule_meeting': ["давайте созвонимся", "назначим встречу"]
+}
+VECTORS = {
+    "сколько стоит": [1.0, 0.0], "какая цена": [0.9, 0.1],
+    "давайте созвонимся": [0.0, 1.0], "назначим встречу": [0.1, 0.9],
+    "почем услуга": [1.0, 0.05]
+}
+
+
+class FakeClient:
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.calls = 0
+
+    async def embed(self, texts, model=None, timeout=None):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise OllamaError("недоступна")
+        return [VECTORS[text] for text in texts]
+
+
+def _classifier(client, tmp_path):
+    return EmbeddingIntentClassifier(client, EXAMPLES, cache_dir=str(tmp_path))
+
+
+def test_classifies_by_nearest_examples(tmp_path):
+    classifier = _classifier(FakeClient(), tmp_path)
+
+    async def scenario():
+        assert await classifier.prepare()
+        return await classifier.classify("почем услуга")
+
+    intent, similarity = asyncio.run(scenario())
+    assert intent == 'request_price'
+    assert similarity > 0.9
+
+
+def test_failed_prepare_retries_after_backoff(tmp_path):
+    client = FakeClient(failures=1)
+    classifier = _classifier(client, tmp_path)
+
+    async def scenario():
+        assert not await classifier.prepare()
+        assert classifier.available and not classifier.ready
+        # Пауза после ошибки: ни prepare(), ни классификация Ollama не трогают
+        assert not await classifier.prepare()
+        assert await classifier.classify("почем услуга") is None
+        await asyncio.sleep(0)
+        assert client.calls == 1
+
+        classifier._retry_at = 0.0
+        assert await classifier.classify("почем услуга") is None
+        await classifier._prepare_task
+        assert classifier.ready
+        return await classifier.classify("почем услуга")
+
+    assert asyncio.run(scenario())[0] == 'request_price'
+    assert classifier._retry_delay == classifier.RETRY_DELAY
+
+
+def test_backoff_doubles_up_to_limit(tmp_path):
+    classifier = _classifier(FakeClient(failures=10), tmp_path)
+
+    async def scenario():
+        delays = []
+        for _ in range(6):
+            classifier._retry_at = 0.0
+            await classifier.prepare()
+            delays.append(classifier._retry_delay)
+        return delays
+
+    delays = asyncio.run(scenario())
+    assert delays[0] == 2 * classifier.RETRY_DELAY
+    assert delays[-1] == classifier.MAX_RETRY_DELAY
+
+
+def test_matrix_cached_on_disk(tmp_path):
+    asyncio.run(_classifier(FakeClient(), tmp_path).prepare())
+
+    client = FakeClient()
+    assert asyncio.run(_classifier(client, tmp_path).prepare())
+    assert client.calls == 0
@@ -0,0 +1,75 @@
+from datetime import date
+
+import pytest
+
+from core.entity_extractor import EntityExtractor, _normalize_date
+
+
+@pytest.fixture(scope='module')
+def extractor():
+    return EntityExtractor()
+
+
+@pytest.mark.parametrize('text', [
+    "какой из тарифов лучше",
+    "я из Москвы, меня зовут Петр",
+    "из них нам подходит второй",
+])
+def test_bare_iz_is_not_a_company(extractor, text):
+    assert 'user_company' not in extractor.extract_slots(text)
+
+
+@pytest.mark.parametrize('text, company', [
+    ("Я из компании Ромашка и хочу узнать цену на внедрение", "Ромашка"),
+    ("Компания: Ромашка", "Ромашка"),
+    ("я работаю в компании Сбер", "Сбер"),
+    ("мы из ООО Вектор, нужна CRM", "ООО Вектор"),
+    ("мы из «Рога и копыта»", "Рога и копыта"),
+    ("работаю в ООО «Вектор», звоните", "ООО «Вектор»"),
+    ("компания Альфа Строй Групп Плюс Еще Что-то", "Альфа Строй Групп Плюс"),
+])
+def test_company(extractor, text, company):
+    assert extractor.extract_slots(text)['user_company'] == company
+
+
+@pytest.mark.parametrize('text', [
+    "Среди наших клиентов много банков",
+    "в рабочей среде всё работает",
+    "в среде разработки",
+])
+def test_weekday_stem_inside_words_is_not_a_date(extractor, text):
+    assert 'preferred_date' not in extractor.extract_slots(text)
+
+
+@pytest.mark.parametrize('text', ["давайте в среду", "до пятницы успеем?", "на следующий вторник", "Среда"])
+def test_weekday_dates(extractor, text):
+    assert 'preferred_date' in extractor.extract_slots(text)
+
+
+def test_weekday_resolves_to_next_such_day():
+    friday = date(2026, 10, 16)
+    assert _normalize_date("в среду", friday) == "2026-10-21"
+    assert _normalize_date("до пятницы", friday) == "2026-10-23"
+    assert _normalize_date("завтра", friday) == "2026-10-17"
+    assert _normalize_date("05.01.27", friday) == "2027-01-05"
+
+
+def test_all_matches_with_spans_and_normalized_values(extractor):
+    text = "Меня зовут иван, почта Ivan@Mail.ru, телефон 8 (999) 123-45-67, в 15:00"
+    matches = extractor.extract(text)
+    assert [m.slot for m in matches] == ['user_name', 'user_email', 'user_phone', 'preferred_time']
+    assert [m.value for m in matches] == ["Иван", "ivan@mail.ru", "79991234567", "15:00"]
+    for match in matches:
+        assert text[match.start:match.end] == match.raw
+
+
+def test_normalize_slot_validates_external_values(extractor):
+    assert extractor.normalize_slot('user_email', "Ivan@Mail.ru") == "ivan@mail.ru"
+    assert extractor.normalize_slot('user_email', "не скажу") is None
+    assert extractor.normalize_slot('user_company', "«Ромашка»") == "Ромашка"
+
+
+def test_config_maps_validation_kind_to_slot():
+    config = {'dialog_flows': {'goal': [{'type': 'collect_entity', 'entity': 'contact_email',
+                                         'validation': 'email'}]}}
+    assert EntityExtractor(config).extract_slots("a@b.ru") == {'contact_email': "a@b.ru"}
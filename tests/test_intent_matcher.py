@@ -0,0 +1,58 @@
+import pytest
+
+from core.intent_matcher import IntentMatcher
+from core.nlu import NLUModule
+
+KEYWORDS = {
+    'express_interest': ['хочу', 'интерес*'],
+    'decline_offer': ['не интерес*', 'не надо'],
+    'request_price': ['цен*', 'сколько стоит'],
+    'greeting': ['привет*']
+}
+
+
+@pytest.fixture
+def matcher():
+    return IntentMatcher(KEYWORDS)
+
+
+def test_stem_and_whole_word_keywords(matcher):
+    assert matcher.scores("Интересное предложение") == {'express_interest': 1}
+    # Без звездочки - только целое слово
+    assert matcher.scores("хочется") == {}
+    assert matcher.scores("Ценообразование") == {'request_price': 1}
+
+
+def test_phrase_beats_single_word(matcher):
+    assert matcher.scores("мне не интересно") == {'decline_offer': 2}
+    assert matcher.match("мне не интересно")[0] == 'decline_offer'
+
+
+def test_phrase_allows_punctuation_between_words(matcher):
+    assert matcher.scores("а сколько, стоит?") == {'request_price': 2}
+
+
+def test_yo_is_normalized():
+    assert IntentMatcher({'thanks': ['спасибо', 'ещё']}).scores("Еще раз спасибо") == {'thanks': 2}
+
+
+def test_confidence_grows_with_weight_and_drops_with_competition(matcher):
+    _, single = matcher.match("хочу")
+    _, double = matcher.match("хочу, интересно")
+    _, mixed = matcher.match("хочу узнать цену")
+    assert double > single > mixed > 0
+    assert matcher.match("ничего общего") == ('unknown', 0.0)
+
+
+def test_tie_goes_to_intent_declared_first(matcher):
+    assert matcher.match("привет, хочу")[0] == 'express_interest'
+
+
+def test_empty_table_matches_nothing():
+    assert IntentMatcher({}).match("привет") == ('unknown', 0.0)
+
+
+def test_default_keywords_compile():
+    default = IntentMatcher(NLUModule.DEFAULT_INTENT_KEYWORDS)
+    assert default.match("Здравствуйте!")[0] == 'greeting'
+    assert default.match("Спасибо, не надо")[0] == 'decline_offer'
@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import pytest
+
+from core.llm_cache import LLMCache
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    cache = LLMCache(max_size=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    # "b" использовался давнее всех
+    assert cache.get("b") is None and cache.get("a") == 1
+
+    now = time.time()
+    monkeypatch.setattr('core.llm_cache.time.time', lambda: now + 11)
+    assert cache.get("a") is None
+
+
+def test_concurrent_callers_share_one_computation():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'greeting'
+
+    async def scenario():
+        cache = LLMCache()
+        results = await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+        assert await cache.get_or_compute("k", compute) == 'greeting'
+        return results, cache.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert results == ['greeting'] * 5
+    assert len(calls) == 1
+    assert stats['misses'] == 1 and stats['hits'] == 5
+
+
+def test_errors_are_shared_but_not_cached():
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("ollama")
+
+    async def scenario():
+        cache = LLMCache()
+        results = await asyncio.gather(*(cache.get_or_compute("k", failing) for _ in range(3)),
+                                       return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        with pytest.raises(RuntimeError):
+            await cache.get_or_compute("k", failing)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+
+
+def test_cancelled_owner_does_not_cancel_waiters():
+    started = []
+
+    async def compute():
+        started.append(1)
+        await asyncio.sleep(0.05)
+        return 'greeting'
+
+    async def scenario():
+        cache = LLMCache()
+        owner = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        # Ожидающий пересчитал значение сам, а не получил чужую отмену
+        return await waiter, cache.get("k")
+
+    assert asyncio.run(scenario()) == ('greeting', 'greeting')
+    assert len(started) == 2
+
+
+def test_persist_round_trip(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = LLMCache(persist_path=path)
+    cache.set("k", 'request_price')
+    cache.save()
+
+    assert LLMCache(persist_path=path).get("k") == 'request_price'
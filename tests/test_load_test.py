@@ -0,0 +1,27 @@
+import asyncio
+import json
+
+import pytest
+
+from benchmarks import load_test
+from benchmarks.load_test import parse_mix
+
+CORPUS = [{'name': "contact_rules", 'messages': []}, {'name': "free_form_llm", 'messages': []}]
+
+
+def test_load_test_smoke(tmp_path):
+    output = str(tmp_path / "load.json")
+    asyncio.run(load_test.main(['--users', '5', '--think', '0', '--send-latency', '0', '--latency', '0',
+                                '--jitter', '0', '--interval', '0.05', '--output', output]))
+
+    with open(output, encoding='utf-8') as f:
+        result = json.load(f)
+    assert result['sent'] > 0 and result['replied'] == result['sent']
+    assert result['timed_out'] == 0 and result['samples']
+
+
+def test_parse_mix():
+    assert parse_mix(None, CORPUS) == [1.0, 1.0]
+    assert parse_mix("free_form_llm=2", CORPUS) == [0.0, 2.0]
+    with pytest.raises(ValueError):
+        parse_mix("unknown=1", CORPUS)
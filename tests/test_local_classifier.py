@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from core.nlu import LocalIntentClassifier, main
+
+EXAMPLES = [
+    (text, intent)
+    for intent, texts in {
+        'request_price': ["сколько стоит", "какая цена", "пришлите прайс", "цена за месяц", "стоимость внедрения"],
+        'greeting': ["привет", "здравствуйте", "добрый день", "приветствую", "доброе утро"],
+        'goodbye': ["пока", "до свидания", "всего доброго", "до встречи", "хорошего дня"]
+    }.items()
+    for text in texts
+] * 4
+
+
+def test_trained_model_predicts_and_round_trips(tmp_path):
+    model = LocalIntentClassifier.train(EXAMPLES, target_precision=0.9)
+    assert model.predict("Сколько стоит?")[0] == 'request_price'
+    assert model.predict("привет!")[0] == 'greeting'
+
+    path = str(tmp_path / "model.npz")
+    model.save(path)
+    loaded = LocalIntentClassifier.load(path)
+    assert loaded.intents == model.intents
+    assert loaded.threshold == pytest.approx(model.threshold)
+    assert loaded.predict("до свидания") == model.predict("до свидания")
+
+
+def test_low_confidence_is_unknown():
+    model = LocalIntentClassifier.train(EXAMPLES)
+    model.threshold = 1.0
+    intent, confidence = model.predict("сколько стоит")
+    assert intent == 'unknown' and 0 < confidence < 1
+
+
+def test_load_corpus_skips_broken_and_unknown_rows(tmp_path):
+    path = tmp_path / "corpus.jsonl"
+    path.write_text('\n'.join([
+        json.dumps({'text': "привет", 'intent': 'greeting'}, ensure_ascii=False),
+        '{"text": "обрезанная строка',
+        json.dumps({'text': "ммм", 'intent': 'unknown'}, ensure_ascii=False),
+        json.dumps({'text': "", 'intent': 'greeting'})
+    ]), encoding='utf-8')
+
+    assert LocalIntentClassifier.load_corpus(str(path)) == [("привет", 'greeting')]
+
+
+def test_train_command(tmp_path):
+    corpus = tmp_path / "corpus.jsonl"
+    corpus.write_text('\n'.join(json.dumps({'text': text, 'intent': intent}, ensure_ascii=False)
+                                for text, intent in EXAMPLES), encoding='utf-8')
+    model_path = tmp_path / "models" / "intent.npz"
+
+    assert main(['train', str(corpus), str(model_path)]) == 0
+    assert LocalIntentClassifier.load(str(model_path)).predict("какая цена")[0] == 'request_price'
+    assert main(['train']) == 1
@@ -0,0 +1,71 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from core.metrics import Histogram, MetricsRegistry, MetricsServer
+
+
+def test_counter_and_histogram_exposition():
+    registry = MetricsRegistry()
+    calls = registry.counter('agent_tool_calls_total', "Вызовы", ['tool', 'result'])
+    latency = registry.histogram('agent_stage_seconds', "Этапы", ['stage'], buckets=(0.1, 1.0))
+    calls.labels('save_lead_crm', 'ok').inc()
+    calls.labels('save_lead_crm', 'ok').inc()
+    llm = latency.labels('llm')
+    for value in (0.05, 0.5, 3.0):
+        llm.observe(value)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE agent_tool_calls_total counter" in lines
+    assert 'agent_tool_calls_total{tool="save_lead_crm",result="ok"} 2' in lines
+    assert 'agent_stage_seconds_bucket{stage="llm",le="0.1"} 1' in lines
+    assert 'agent_stage_seconds_bucket{stage="llm",le="1"} 2' in lines
+    assert 'agent_stage_seconds_bucket{stage="llm",le="+Inf"} 3' in lines
+    assert 'agent_stage_seconds_sum{stage="llm"} 3.55' in lines
+    assert 'agent_stage_seconds_count{stage="llm"} 3' in lines
+
+
+def test_label_values_are_escaped_and_checked():
+    histogram = Histogram('h', "test", ['stage'])
+    histogram.labels('say "hi"\n').observe(1.0)
+    assert 'h_count{stage="say \\"hi\\"\\n"} 1' in histogram.render()
+
+    with pytest.raises(ValueError):
+        histogram.labels()
+
+
+def test_gauge_function_computed_on_render():
+    registry = MetricsRegistry()
+    queue = {'size': 3}
+    registry.gauge_function('agent_queue', "Очередь", lambda: queue['size'])
+    registry.gauge_function('agent_rejected_total', "Отказы", lambda: {('a',): 1, ('b',): 2},
+                            ['user'], kind='counter')
+    registry.gauge_function('agent_broken', "Сломано", lambda: 1 / 0)
+
+    queue['size'] = 5
+    text = registry.render()
+    assert "agent_queue 5\n" in text
+    assert "# TYPE agent_rejected_total counter" in text
+    assert 'agent_rejected_total{user="b"} 2' in text
+    assert "agent_broken" not in text
+
+
+def test_server_serves_metrics():
+    registry = MetricsRegistry()
+    registry.counter('agent_messages_total', "Сообщения").inc()
+
+    async def scenario():
+        server = MetricsServer(registry, port=0)
+        await server.start()
+        port = server._runner.addresses[0][1]
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+                    return response.headers['Content-Type'], await response.text()
+        finally:
+            await server.stop()
+
+    content_type, text = asyncio.run(scenario())
+    assert content_type.startswith("text/plain; version=0.0.4")
+    assert "agent_messages_total 1" in text
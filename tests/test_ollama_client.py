@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from core.ollama_client import OllamaClient, OllamaError, OllamaRequestError
+from core.ollama_health import OllamaHealth
+
+
+async def _serve(status: int, body: str, content_type: str = 'application/json'):
+    """Сервер, отвечающий на /api/generate заданным статусом и телом"""
+    calls = []
+
+    async def handler(request):
+        calls.append(await request.json())
+        return web.Response(status=status, text=body, content_type=content_type)
+
+    app = web.Application()
+    app.router.add_post('/api/generate', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', 0).start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}", calls
+
+
+def _client(url):
+    return OllamaClient(url, model="phi", keep_alive="30m",
+                        health=OllamaHealth(failure_threshold=2, probe_interval=0))
+
+
+def test_generate_sends_model_and_keep_alive():
+    async def scenario():
+        runner, url, calls = await _serve(200, '{"response": "greeting", "done": true}')
+        client = _client(url)
+        try:
+            result = await client.generate("привет", options={'num_predict': 5})
+            session = client._session
+            await client.generate("еще раз")
+            assert client._session is session
+        finally:
+            await client.close()
+            await runner.cleanup()
+        return result, calls
+
+    result, calls = asyncio.run(scenario())
+    assert result['response'] == "greeting"
+    assert calls[0]['model'] == "phi" and calls[0]['keep_alive'] == "30m"
+    assert calls[0]['stream'] is False and calls[0]['options'] == {'num_predict': 5}
+
+
+@pytest.mark.parametrize("status, body, content_type", [
+    (500, '{"error": "boom"}', 'application/json'),
+    (200, '<html>502 Bad Gateway</html>', 'text/html'),
+    (200, '[1, 2]', 'application/json'),
+])
+def test_server_failures_count_against_health(status, body, content_type):
+    async def scenario():
+        runner, url, _ = await _serve(status, body, content_type)
+        client = _client(url)
+        try:
+            with pytest.raises(OllamaError):
+                await client.generate("привет")
+            return client.health.consecutive_failures
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_client_errors_do_not_open_breaker():
+    async def scenario():
+        runner, url, _ = await _serve(404, '{"error": "model not found"}')
+        client = _client(url)
+        try:
+            for _ in range(3):
+                with pytest.raises(OllamaRequestError):
+                    await client.generate("привет")
+            return client.available
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    assert asyncio.run(scenario())
+
+
+def test_connection_error_is_ollama_error():
+    async def scenario():
+        client = _client("http://127.0.0.1:1")
+        try:
+            with pytest.raises(OllamaError):
+                await client.generate("привет", timeout=2)
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
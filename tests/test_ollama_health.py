@@ -0,0 +1,83 @@
+import asyncio
+
+from core.ollama_health import OllamaHealth, percentile_of
+
+
+def test_opens_after_consecutive_failures():
+    health = OllamaHealth(failure_threshold=3, probe_interval=0)
+    health.record_failure("timeout")
+    health.record_failure("timeout")
+    assert health.allow()
+    health.record_failure("timeout")
+
+    assert not health.available
+    assert not health.allow() and not health.allow()
+    assert health.stats()['rejected'] == 2 and health.times_opened == 1
+
+
+def test_success_resets_consecutive_failures():
+    health = OllamaHealth(failure_threshold=2, min_calls=100, probe_interval=0)
+    for _ in range(5):
+        health.record_failure()
+        health.record_success(0.1)
+    assert health.available
+
+
+def test_opens_on_error_rate_in_window():
+    health = OllamaHealth(failure_threshold=100, error_rate=0.5, window=10, min_calls=10, probe_interval=0)
+    for _ in range(4):
+        health.record_failure()
+        health.record_success(0.1)
+    health.record_failure()
+    assert health.available
+    health.record_success(0.1)
+    health.record_failure()
+    assert not health.available
+
+
+def test_probe_closes_breaker_when_server_recovers():
+    health = OllamaHealth(failure_threshold=1, probe_interval=0.01)
+    answers = [False, False, True]
+
+    async def probe():
+        return answers.pop(0) if answers else True
+
+    async def scenario():
+        health.record_failure("connection refused")
+        health.start(probe)
+        for _ in range(100):
+            if health.available:
+                break
+            await asyncio.sleep(0.01)
+        await health.stop()
+
+    asyncio.run(scenario())
+    assert health.available and health.times_opened == 1
+    assert health.stats()['error_rate'] == 0.0
+
+
+def test_failed_probe_opens_breaker_without_user_traffic():
+    health = OllamaHealth(failure_threshold=2, probe_interval=0.01)
+
+    async def probe():
+        raise ConnectionError("down")
+
+    async def scenario():
+        health.start(probe)
+        for _ in range(100):
+            if not health.available:
+                break
+            await asyncio.sleep(0.01)
+        await health.stop()
+
+    asyncio.run(scenario())
+    assert not health.available
+
+
+def test_latency_percentiles():
+    health = OllamaHealth(probe_interval=0)
+    for latency in (0.1, 0.2, 0.3, 0.4, 1.0):
+        health.record_success(latency)
+    assert health.latency_percentile(50) == 0.3
+    assert health.stats()['p95'] == 1.0
+    assert percentile_of([], 95) is None
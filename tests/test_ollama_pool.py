@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fake_ollama import FakeOllama
+from core.ollama_client import OllamaClient, OllamaError, OllamaUnavailable
+from core.ollama_health import OllamaHealth
+from core.ollama_pool import OllamaPool
+
+
+def _run_pool(servers, scenario, **options):
+    """Поднимает фейковые серверы, собирает над ними пул и выполняет scenario(pool)"""
+    async def run():
+        urls = [await server.start() for server in servers]
+        backends = [OllamaClient(url, "phi", health=OllamaHealth(name=url, failure_threshold=1,
+                                                                 probe_interval=0))
+                    for url in urls]
+        pool = OllamaPool(backends, **options)
+        try:
+            return await scenario(pool)
+        finally:
+            await pool.close()
+            for server in servers:
+                await server.stop()
+
+    return asyncio.run(run())
+
+
+def test_slow_backend_is_hedged_and_loser_cancelled():
+    slow, fast = FakeOllama(latency=2.0, intent='slow'), FakeOllama(latency=0.0, intent='fast')
+
+    async def scenario(pool):
+        result = await pool.generate("привет")
+        await asyncio.sleep(0.1)
+        return result, pool.stats()
+
+    result, stats = _run_pool([slow, fast], scenario, hedge_min_delay=0.05, hedge_default_delay=0.05)
+    assert result['response'] == 'fast'
+    assert stats['hedged'] == 1 and stats['hedge_wins'] == 1
+    assert slow.cancelled == 1
+    assert all(backend['in_flight'] == 0 for backend in stats['backends'].values())
+
+
+def test_failed_backend_fails_over_and_is_excluded():
+    broken, healthy = FakeOllama(latency=0.0), FakeOllama(latency=0.0, intent='greeting')
+    broken.down = True
+
+    async def scenario(pool):
+        first = await pool.generate("привет")
+        second = await pool.generate("привет")
+        return first, second, pool.stats()
+
+    first, second, stats = _run_pool([broken, healthy], scenario, hedge_percentile=0)
+    assert first['response'] == second['response'] == 'greeting'
+    assert stats['failovers'] == 1
+    # Выключатель сломанного сервера разомкнут: второй запрос к нему не ходил
+    assert broken.requests == 1 and healthy.requests == 2
+
+
+def test_all_backends_down():
+    servers = [FakeOllama(latency=0.0), FakeOllama(latency=0.0)]
+    for server in servers:
+        server.down = True
+
+    async def scenario(pool):
+        with pytest.raises(OllamaError):
+            await pool.generate("привет")
+        assert not pool.available
+        with pytest.raises(OllamaUnavailable):
+            await pool.generate("привет")
+
+    _run_pool(servers, scenario, hedge_percentile=0)
+    assert [server.requests for server in servers] == [1, 1]
+
+
+def test_requests_spread_by_in_flight():
+    servers = [FakeOllama(latency=0.2), FakeOllama(latency=0.2)]
+
+    async def scenario(pool):
+        await asyncio.gather(pool.generate("a"), pool.generate("b"))
+
+    _run_pool(servers, scenario, hedge_percentile=0)
+    assert [server.requests for server in servers] == [1, 1]
@@ -0,0 +1,18 @@
+from core import profiler
+from core.dialog_manager import DialogManager
+from core.profiler import component_of
+from core.state_manager import StateManager
+
+
+def test_component_is_outermost_known_class():
+    codes = [StateManager.get_user_context.__code__, DialogManager.fill_slots.__code__]
+    assert component_of(codes) == 'StateManager'
+    assert component_of([profiler.component_of.__code__]) == 'other'
+
+
+def test_indexed_qualnames_match_code_qualnames():
+    # Запасной путь для Python < 3.11 дает те же имена, что и co_qualname
+    profiler.index_qualnames()
+    for code in (DialogManager.fill_slots.__code__, StateManager.memory_stats.__code__):
+        assert profiler._indexed_qualname(code) == code.co_qualname
+    assert profiler._indexed_qualname(profiler.component_of.__code__) == 'component_of'
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from core.redis_state import RedisStateManager
+
+
+def _stores(count=2):
+    server = fakeredis.FakeServer()
+    return [RedisStateManager(client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True), ttl=60)
+            for _ in range(count)]
+
+
+def test_state_is_shared_between_processes():
+    async def scenario():
+        first, second = _stores()
+        await first.load_user("u")
+        first.set_user_context("u", {'active_goal': "schedule_demo", 'current_step': 1})
+        first.update_dialog_history("u", "хочу демо", "Когда удобно?")
+        await first.commit_user("u")
+
+        await second.load_user("u")
+        context, history = second.get_user_context("u"), second.get_dialog_history("u")
+        await second.commit_user("u")
+        for store in (first, second):
+            await store.redis.aclose()
+        return context, history
+
+    context, history = asyncio.run(scenario())
+    assert context == {'active_goal': "schedule_demo", 'current_step': 1}
+    assert history == [{'user': "хочу демо", 'bot': "Когда удобно?"}]
+
+
+def test_one_round_trip_per_load_and_commit():
+    async def scenario():
+        store, = _stores(1)
+        await store.load_user("u")
+        store.set_user_context("u", {'active_goal': "qualify_lead"})
+        store.update_dialog_history("u", "привет", "здравствуйте")
+        await store.commit_user("u")
+        # Без изменений commit не обращается к Redis
+        await store.load_user("u")
+        await store.commit_user("u")
+        trips, local = store.round_trips, dict(store.user_states)
+        await store.redis.aclose()
+        return trips, local
+
+    trips, local = asyncio.run(scenario())
+    assert trips == 3
+    assert local == {}
+
+
+def test_history_trimmed_and_keys_expire():
+    async def scenario():
+        store, = _stores(1)
+        for index in range(store.HISTORY_LIMIT + 5):
+            await store.load_user("u")
+            store.update_dialog_history("u", f"вопрос {index}", "ответ")
+            await store.commit_user("u")
+        length = await store.redis.llen(store._history_key("u"))
+        ttl = await store.redis.ttl(store._history_key("u"))
+        await store.redis.aclose()
+        return length, ttl
+
+    length, ttl = asyncio.run(scenario())
+    assert length == RedisStateManager.HISTORY_LIMIT
+    assert 0 < ttl <= 60
+
+
+def test_cleared_fields_are_removed():
+    async def scenario():
+        store, = _stores(1)
+        await store.load_user("u")
+        store.set_user_context("u", {'active_goal': "qualify_lead", 'awaiting_slot': "user_company"})
+        await store.commit_user("u")
+
+        await store.load_user("u")
+        store.clear_user_context("u")
+        await store.commit_user("u")
+        fields = await store.redis.hgetall(store._context_key("u"))
+        await store.redis.aclose()
+        return fields
+
+    assert asyncio.run(scenario()) == {}
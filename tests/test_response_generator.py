@@ -0,0 +1,45 @@
+import pytest
+
+from core.response_generator import CompiledTemplate, ResponseGenerator, TemplateError
+
+SLOTS = ['user_name', 'user_email']
+
+
+def _generator(templates):
+    return ResponseGenerator({'templates': templates}, known_slots=SLOTS)
+
+
+def test_render_fills_fields_and_blanks_missing():
+    generator = _generator({'done': "Спасибо, {user_name}! Пишем на {user_email}."})
+    assert generator.generate_from_template('done', {'user_name': "Иван", 'user_email': "i@x.ru"}) == \
+        "Спасибо, Иван! Пишем на i@x.ru."
+    assert generator.generate_from_template('done', {'user_name': "Иван"}) == "Спасибо, Иван! Пишем на ."
+
+
+def test_escaped_braces_are_literals():
+    assert CompiledTemplate('json', "{{\"ok\": true}}").render() == '{"ok": true}'
+
+
+@pytest.mark.parametrize("source", ["Привет, {user_name", "{user_name!r}", "{user_name:>10}", "{0}"])
+def test_unsupported_syntax_fails_at_load(source):
+    with pytest.raises(TemplateError):
+        _generator({'bad': source})
+
+
+def test_unknown_field_fails_at_load():
+    with pytest.raises(TemplateError, match="user_phone"):
+        _generator({'bad': "Перезвоним на {user_phone}"})
+
+
+def test_flow_entities_are_known_fields():
+    config = {
+        'templates': {'ask': "Ваш номер, {user_name}?", 'done': "Записали {user_phone}"},
+        'dialog_flows': {'callback': [{'type': 'collect_entity', 'entity': 'user_phone'}]}
+    }
+    assert ResponseGenerator(config, known_slots=SLOTS).generate_from_template(
+        'done', {'user_phone': "79990000000"}) == "Записали 79990000000"
+
+
+def test_unknown_template_uses_fallback():
+    assert _generator({'fallback': "Переформулируйте"}).generate_from_template('missing') == "Переформулируйте"
+    assert _generator({}).generate_from_template('missing') == ResponseGenerator.FALLBACK_TEXT
@@ -0,0 +1,127 @@
+import asyncio
+import sqlite3
+
+from core.sqlite_state import SQLiteStateManager
+
+
+def _rows(path):
+    db = sqlite3.connect(path)
+    try:
+        return {user_id for (user_id,) in db.execute("SELECT user_id FROM contexts")}
+    finally:
+        db.close()
+
+
+def test_eviction_keeps_persisted_rows(tmp_path):
+    path = str(tmp_path / "state.db")
+
+    async def scenario():
+        store = SQLiteStateManager(path, max_users=2)
+        await store.start()
+        for user_id in ("a", "b", "c"):
+            store.set_user_context(user_id, {'active_goal': f"goal_{user_id}"})
+            store.update_dialog_history(user_id, "привет", "здравствуйте")
+        assert "a" not in store.user_states
+        await store.flush()
+        await store.close()
+
+    asyncio.run(scenario())
+    assert _rows(path) == {"a", "b", "c"}
+
+    async def restart():
+        # Строк больше лимита: при загрузке вытесняются из памяти, но не из базы
+        store = SQLiteStateManager(path, max_users=2)
+        await store.start()
+        assert len(store.user_states) == 2
+        await store.load_user("a")
+        assert store.get_user_context("a") == {'active_goal': "goal_a"}
+        assert store.get_dialog_history("a") == [{'user': "привет", 'bot': "здравствуйте"}]
+        await store.flush()
+        await store.close()
+
+    asyncio.run(restart())
+    assert _rows(path) == {"a", "b", "c"}
+
+
+def test_evicted_before_flush_is_reloaded(tmp_path):
+    path = str(tmp_path / "state.db")
+
+    async def scenario():
+        store = SQLiteStateManager(path, max_users=1, flush_interval=60)
+        await store.start()
+        store.set_user_context("a", {'active_goal': "goal_a"})
+        store.set_user_context("b", {'active_goal': "goal_b"})
+        # "a" вытеснен до записи: load_user сначала сбрасывает снимок в базу
+        await store.load_user("a")
+        assert store.get_user_context("a") == {'active_goal': "goal_a"}
+        store.clear_user_context("a")
+        await store.close()
+
+    asyncio.run(scenario())
+    assert _rows(path) == {"b"}
+
+
+def test_restart_restores_context_and_history_tail(tmp_path):
+    path = str(tmp_path / "state.db")
+
+    async def scenario():
+        store = SQLiteStateManager(path, flush_interval=60)
+        await store.start()
+        store.set_user_context("a", {'active_goal': "qualify_lead", 'collected_data': {'user_name': "Иван"}})
+        for index in range(store.HISTORY_LIMIT + 3):
+            store.update_dialog_history("a", f"вопрос {index}", f"ответ {index}")
+        # Запись отложена: изменения накапливаются до flush или close
+        assert store.stats()['flushes'] == 0
+        await store.close()
+
+    asyncio.run(scenario())
+
+    store = SQLiteStateManager(path)
+    history = store.get_dialog_history("a")
+    assert store.get_user_context("a") == {'active_goal': "qualify_lead", 'collected_data': {'user_name': "Иван"}}
+    assert len(history) == store.HISTORY_LIMIT
+    assert history[-1] == {'user': "вопрос 12", 'bot': "ответ 12"}
+    store._db.close()
+
+
+def test_changes_are_written_in_one_batch(tmp_path):
+    path = str(tmp_path / "state.db")
+
+    async def scenario():
+        store = SQLiteStateManager(path, flush_interval=60)
+        await store.start()
+        for user_id in ("a", "b", "c"):
+            store.set_user_context(user_id, {'active_goal': "collect_contact_info"})
+            store.update_dialog_history(user_id, "привет", "здравствуйте")
+        await store.flush()
+        await store.flush()
+        flushes = store.flushes
+        await store.close()
+        return flushes
+
+    assert asyncio.run(scenario()) == 1
+    assert _rows(path) == {"a", "b", "c"}
+
+
+def test_idle_contexts_expire_on_load(tmp_path):
+    path = str(tmp_path / "state.db")
+
+    async def scenario():
+        store = SQLiteStateManager(path)
+        await store.start()
+        store.set_user_context("a", {'active_goal': "collect_contact_info"})
+        await store.close()
+
+    asyncio.run(scenario())
+    db = sqlite3.connect(path)
+    with db:
+        db.execute("UPDATE contexts SET updated_at = updated_at - 7200")
+    db.close()
+
+    async def restart():
+        store = SQLiteStateManager(path, idle_ttl=3600)
+        assert store.get_user_context("a") == {}
+        await store.close()
+
+    asyncio.run(restart())
+    assert _rows(path) == set()
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import sys
+import time
+from array import array
+
+import pytest
+
+from core.sqlite_state import SQLiteStateManager
+from core.state_manager import LLMContextHandle, StateManager, UserContext
+
+TOKENS = list(range(30000, 31000))
+
+
+def test_lru_eviction_keeps_recently_active_users():
+    store = StateManager(max_users=2)
+    for user_id in ("a", "b"):
+        store.set_user_context(user_id, {'active_goal': "collect_contact_info"})
+    store.update_user_context("a", {'current_step': 1})
+    store.set_user_context("c", {'active_goal': "schedule_demo"})
+
+    assert list(store.user_states) == ["a", "c"]
+    assert store.memory_stats()['evicted'] == 1
+
+
+def test_idle_records_expire(monkeypatch):
+    store = StateManager(idle_ttl=60)
+    store.set_user_context("a", {'active_goal': "collect_contact_info"})
+    store.update_dialog_history("a", "привет", "здравствуйте")
+
+    now = time.time()
+    monkeypatch.setattr('core.state_manager.time.time', lambda: now + 61)
+    assert store.get_user_context("a") == {}
+    assert store.get_dialog_history("a") == []
+    assert store.memory_stats()['expired'] == 1
+
+
+def test_reset_keeps_history_and_rare_fields_use_extra():
+    record = UserContext(history_limit=2)
+    record.update({'active_goal': "qualify_lead", 'ab_group': "B"})
+    for index in range(3):
+        record.history.append({'user': str(index), 'bot': "ok"})
+
+    assert record.to_dict() == {'active_goal': "qualify_lead", 'ab_group': "B"}
+    record.reset()
+    assert record.to_dict() == {}
+    assert [turn['user'] for turn in record.history] == ["1", "2"]
+
+
+def test_context_tokens_stored_compactly():
+    store = StateManager()
+    store.set_llm_context("u", "nlu", "v1", TOKENS)
+
+    handle = store.user_states["u"].llm_contexts["nlu"]
+    assert isinstance(handle.tokens, array)
+    assert store.get_llm_context("u", "nlu", "v1") == TOKENS
+    assert store.get_llm_context("u", "nlu", "v2") is None
+
+
+def test_approx_size_counts_token_bytes():
+    record = UserContext()
+    record.set('llm_contexts', {'nlu': {'version': "v1", 'tokens': TOKENS}})
+    # Не меньше 4 байт на токен: раньше считались только ссылки на список
+    assert record.approx_size() >= 4 * len(TOKENS)
+    assert record.approx_size() < sys.getsizeof(TOKENS) + sum(sys.getsizeof(t) for t in TOKENS)
+
+
+def test_dump_round_trip_and_legacy_lists():
+    record = UserContext()
+    record.set('active_goal', "qualify_lead")
+    record.set('llm_contexts', {'nlu': {'version': "v1", 'tokens': TOKENS}})
+
+    data = json.loads(record.dump_json())
+    assert data['active_goal'] == "qualify_lead"
+    assert isinstance(data['llm_contexts']['nlu']['tokens'], str)
+    assert data == json.loads(json.dumps(record.dump()))
+
+    restored = UserContext()
+    restored.update(data)
+    assert restored.llm_contexts['nlu'].tokens.tolist() == TOKENS
+
+    handle = LLMContextHandle.restore({'version': "v1", 'tokens': [1, 2, 3]})
+    assert handle.tokens.tolist() == [1, 2, 3]
+
+
+def test_contexts_json_cached_until_changed():
+    store = StateManager()
+    store.set_llm_context("u", "nlu", "v1", TOKENS)
+    record = store.user_states["u"]
+
+    first = record.contexts_json()
+    assert record.contexts_json() is first
+    store.set_llm_context("u", "answer", "v1", [1, 2])
+    assert record.contexts_json() is not first
+    store.set_llm_context("u", "nlu", "v1", None)
+    store.set_llm_context("u", "answer", "v1", None)
+    assert record.contexts_json() is None
+    assert record.dump_json() == "{}"
+
+
+def test_contexts_expire_before_dialog_state():
+    store = StateManager(idle_ttl=3600, context_ttl=60)
+    store.set_user_context("u", {'active_goal': "collect_contact_info"})
+    store.set_llm_context("u", "nlu", "v1", TOKENS)
+
+    handle = store.user_states["u"].llm_contexts["nlu"]
+    handle.saved_at -= 120
+    assert store.get_llm_context("u", "nlu", "v1") is None
+
+    store._context_order["u"] = handle.saved_at
+    store.update_dialog_history("other", "привет", "здравствуйте")
+    assert store.user_states["u"].llm_contexts is None
+    assert store.get_user_context("u") == {'active_goal': "collect_contact_info"}
+    assert store.memory_stats()['contexts_expired'] == 1
+
+
+def test_sqlite_persists_packed_contexts(tmp_path):
+    path = str(tmp_path / "state.db")
+
+    async def scenario():
+        store = SQLiteStateManager(path, context_ttl=600)
+        await store.start()
+        store.set_llm_context("u", "nlu", "v1", TOKENS)
+        await store.flush()
+        await store.close()
+
+    asyncio.run(scenario())
+
+    store = SQLiteStateManager(path, context_ttl=600)
+    assert store.get_llm_context("u", "nlu", "v1") == TOKENS
+    assert "u" in store._context_order
+    store._db.close()
+
+
+def test_redis_skips_unchanged_contexts():
+    fakeredis = pytest.importorskip("fakeredis")
+    from core.redis_state import RedisStateManager
+
+    async def scenario():
+        server = fakeredis.FakeServer()
+        store = RedisStateManager(client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+        await store.load_user("u")
+        store.set_user_context("u", {'active_goal': "qualify_lead"})
+        store.set_llm_context("u", "nlu", "v1", TOKENS)
+        await store.commit_user("u")
+
+        await store.load_user("u")
+        store.update_user_context("u", {'awaiting_slot': "user_name"})
+        store.set_llm_context("u", "answer", "v1", None)
+        record = store.user_states["u"]
+        loaded = record.contexts_json()
+        await store.commit_user("u")
+        # Контексты не менялись: JSON из загрузки не пересобирался
+        assert record.contexts_json() is loaded
+
+        await store.load_user("u")
+        assert store.get_user_context("u") == {'active_goal': "qualify_lead", 'awaiting_slot': "user_name"}
+        assert store.get_llm_context("u", "nlu", "v1") == TOKENS
+        store.clear_user_context("u")
+        await store.commit_user("u")
+
+        await store.load_user("u")
+        assert store.get_user_context("u") == {}
+        assert store.get_llm_context("u", "nlu", "v1") == TOKENS
+        await store.redis.aclose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fake_ollama import FakeOllama
+from core.ollama_client import OllamaClient, OllamaError
+from core.ollama_health import OllamaHealth
+from core.nlu import NLUModule
+
+
+def _nlu(url="http://127.0.0.1:1"):
+    client = OllamaClient(url, "phi", health=OllamaHealth(probe_interval=0))
+    return NLUModule(client=client, llm_mode="structured", intents=['request_price', 'greeting'])
+
+
+def test_one_json_request_per_message_and_cache():
+    async def scenario():
+        server = FakeOllama(latency=0.0, intent='request_price')
+        nlu = _nlu(await server.start())
+        try:
+            first = await nlu.extract_intent_and_entities("а по деньгам что выходит?")
+            second = await nlu.extract_intent_and_entities("А по деньгам что выходит")
+        finally:
+            await nlu.client.close()
+            await server.stop()
+        return first, second, server.requests
+
+    first, second, requests = asyncio.run(scenario())
+    assert (first['intent'], first['confidence'], first['source']) == ('request_price', 0.9, 'llm')
+    assert second['intent'] == 'request_price'
+    assert requests == 1
+
+
+def test_coerce_validates_intent_confidence_and_slots():
+    nlu = _nlu()
+    result = nlu._coerce_structured({
+        'intent': 'Request_Price ', 'confidence': 7,
+        'slots': {'user_email': 'IVAN@MAIL.RU', 'user_phone': 'не помню', 'password': 'x'}
+    })
+    assert result == {'intent': 'request_price', 'confidence': 1.0, 'slots': {'user_email': 'ivan@mail.ru'}}
+
+    result = nlu._coerce_structured({'intent': 'order_pizza', 'confidence': 'high'})
+    assert result == {'intent': 'unknown', 'confidence': nlu.LLM_CONFIDENCE, 'slots': {}}
+
+    with pytest.raises(OllamaError):
+        nlu._coerce_structured(['request_price'])
+
+
+def test_cache_version_depends_on_config():
+    assert _nlu()._structured_cache_version != NLUModule(llm_mode="structured")._structured_cache_version
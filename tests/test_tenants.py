@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+import pytest
+
+from core.config_snapshot import ConfigSnapshot
+from core.nlu import NLUModule
+from core.tenants import AgentTenant, TenantRouter, load_routing
+
+
+def _router(**kwargs):
+    return TenantRouter(['leads', 'support', 'shop'], 'leads', **kwargs)
+
+
+def test_route_priority():
+    router = _router(accounts={42: 'support'}, chats={'-100': 'shop'},
+                     keywords={'shop': ['заказ*', 'доставк*']})
+    assert router.route("42", "-100", "где заказ") == ('support', 'account')
+    assert router.route("7", "-100", "привет") == ('shop', 'chat')
+    assert router.route("8", None, "Где мой заказ?") == ('shop', 'keyword')
+    assert router.route("9", None, "привет") == ('leads', 'default')
+    assert router.stats()['routed'] == {'leads': 1, 'support': 1, 'shop': 2}
+
+
+def test_conversation_stays_with_first_agent():
+    router = _router(keywords={'shop': ['доставк*']})
+    assert router.route("u", None, "сколько стоит доставка")[0] == 'shop'
+    assert router.route("u", None, "а сколько стоит внедрение CRM") == ('shop', 'conversation')
+
+
+def test_assignments_are_bounded():
+    router = _router(max_assignments=2)
+    for user_id in ("a", "b", "c"):
+        router.route(user_id)
+    assert router.stats()['assignments'] == 2
+
+
+def test_unknown_agent_is_rejected():
+    with pytest.raises(ValueError):
+        _router(chats={'-100': 'billing'})
+
+
+def test_load_routing_defaults_to_first_agent(tmp_path):
+    path = tmp_path / "routing.json"
+    path.write_text(json.dumps({'agents': {'support': "config/support.json", 'leads': "config/leads.json"}}))
+    assert load_routing(str(path))['default'] == 'support'
+
+    path.write_text(json.dumps({'agents': {}}))
+    with pytest.raises(ValueError):
+        load_routing(str(path))
+
+
+def test_tenant_namespaces_state_and_swaps_nlu_with_snapshot():
+    tenant = AgentTenant('support', "config/support.json", ConfigSnapshot.load("config/support.json"),
+                         lambda snapshot: NLUModule(intent_keywords=snapshot.intent_keywords),
+                         state_namespace='support')
+    assert tenant.state_key("42") == "support:42"
+    assert tenant.nlu.intent_matcher.match("у меня ошибка")[0] == 'report_problem'
+
+    asyncio.run(tenant._apply_snapshot(ConfigSnapshot.load("config/ecommerce.json", version=2)))
+    assert tenant.snapshot.version == 2
+    assert tenant.nlu.intent_matcher.match("где мой заказ")[0] == 'track_order'
@@ -0,0 +1,46 @@
+import asyncio
+
+from core.metrics import TOOL_CALLS
+from core.tools import ToolExecutor
+
+
+def _calls(tool, result):
+    return TOOL_CALLS.labels(tool, result).value
+
+
+def test_execute_counts_outcomes():
+    executor = ToolExecutor([{'name': 'save_lead_crm'}])
+    success, missing = _calls('save_lead_crm', 'success'), _calls('unknown', 'error')
+
+    result = asyncio.run(executor.execute('save_lead_crm', {'user_name': "Иван"}))
+    assert result['success'] and result['data'] == {'user_name': "Иван"}
+    assert not asyncio.run(executor.execute('unknown', {}))['success']
+
+    assert _calls('save_lead_crm', 'success') == success + 1
+    assert _calls('unknown', 'error') == missing + 1
+
+
+def test_completed_flow_saves_lead_through_executor(monkeypatch):
+    monkeypatch.setenv("OLLAMA_URL", "http://127.0.0.1:1")
+    monkeypatch.setenv("STATE_BACKEND", "memory")
+    from main import UniversalTelegramAgent
+
+    async def scenario():
+        agent = UniversalTelegramAgent()
+        saved = []
+        execute = agent.tool_executor.execute
+
+        async def recording(tool_name, params):
+            saved.append((tool_name, params))
+            return await execute(tool_name, params)
+
+        agent.tool_executor.execute = recording
+        try:
+            for text in ("хочу подробнее", "ок", "Иван", "ivan@mail.ru", "ок"):
+                await agent._process_message_logic("u1", text)
+        finally:
+            await agent.shutdown()
+        return saved
+
+    saved = asyncio.run(scenario())
+    assert saved == [('save_lead_crm', {'user_id': "u1", 'user_name': "Иван", 'user_email': "ivan@mail.ru"})]
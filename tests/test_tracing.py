@@ -0,0 +1,98 @@
+import asyncio
+import json
+import logging
+
+from core.metrics import Histogram
+from core.tracing import TraceWriter, Tracer, current_trace, main, read_traces, stage_done, summarize
+
+
+def test_writer_appends_and_rotates(tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+    writer = TraceWriter(path, max_bytes=10, backups=1)
+
+    async def scenario():
+        for batch in range(3):
+            writer.put({'batch': batch})
+            await writer.close()
+
+    asyncio.run(scenario())
+    assert writer.written == 3 and writer.rotations == 2
+    with open(path, encoding='utf-8') as f:
+        assert [json.loads(line) for line in f] == [{'batch': 2}]
+    with open(path + ".1", encoding='utf-8') as f:
+        assert [json.loads(line) for line in f] == [{'batch': 1}]
+
+
+def test_corpus_writer_never_rotates(tmp_path):
+    path = str(tmp_path / "corpus.jsonl")
+    writer = TraceWriter(path, max_bytes=None)
+
+    async def scenario():
+        for index in range(3):
+            writer.put({'text': "привет" * 10, 'index': index})
+            await writer.close()
+
+    asyncio.run(scenario())
+    assert writer.rotations == 0
+    with open(path, encoding='utf-8') as f:
+        assert len(f.readlines()) == 3
+
+
+def test_write_failure_names_the_file(tmp_path, caplog):
+    # Путь - каталог: запись невозможна
+    writer = TraceWriter(str(tmp_path), max_bytes=None)
+    writer.put({'text': "привет"})
+
+    with caplog.at_level(logging.WARNING, logger="core.tracing"):
+        asyncio.run(writer.close())
+
+    assert writer.dropped == 1
+    assert str(tmp_path) in caplog.text
+
+
+def _traced(tracer, monkeypatch, duration):
+    """Одно сообщение длительностью duration секунд с одним этапом"""
+    now = [100.0]
+    monkeypatch.setattr('core.tracing.time.perf_counter', lambda: now[0])
+    token = tracer.begin(user_id="u")
+    stage_done(Histogram('test_seconds', "test"), 'nlu', now[0])
+    now[0] += duration
+    tracer.end(token)
+
+
+def test_tracer_keeps_slow_traces_and_samples_the_rest(tmp_path, monkeypatch):
+    path = str(tmp_path / "traces.jsonl")
+    tracer = Tracer(TraceWriter(path), sample_rate=0.0, slow_ms=500)
+    _traced(tracer, monkeypatch, 0.01)
+    _traced(tracer, monkeypatch, 1.0)
+    asyncio.run(tracer.close())
+
+    traces = read_traces(path)
+    assert tracer.stats()['traces'] == 2 and tracer.stats()['slow'] == 1
+    assert len(traces) == 1 and traces[0]['slow'] and traces[0]['user_id'] == "u"
+    assert traces[0]['duration_ms'] == 1000.0
+    assert [span['name'] for span in traces[0]['spans']] == ['nlu']
+
+
+def test_tracer_samples_everything_at_full_rate(tmp_path, monkeypatch):
+    path = str(tmp_path / "traces.jsonl")
+    tracer = Tracer(TraceWriter(path), sample_rate=1.0, slow_ms=0)
+    for _ in range(3):
+        _traced(tracer, monkeypatch, 0.01)
+    asyncio.run(tracer.close())
+
+    assert len(read_traces(path)) == 3
+    assert current_trace() is None
+
+
+def test_summary_lists_slowest_traces_and_stages(tmp_path, monkeypatch):
+    path = str(tmp_path / "traces.jsonl")
+    tracer = Tracer(TraceWriter(path), sample_rate=1.0, slow_ms=500)
+    _traced(tracer, monkeypatch, 0.01)
+    _traced(tracer, monkeypatch, 1.0)
+    asyncio.run(tracer.close())
+
+    assert main(['summary', path, '1']) == 0
+    report = summarize(read_traces(path), top=1)
+    assert "Трасс: 2, медленных: 1" in report
+    assert "1000.0 мс" in report and "nlu" in report
@@ -1,5 +1,66 @@
 import json
-from typing import Dict, Any
+from typing import Dict, Any, List, Literal, Optional
+
+from pydantic import BaseModel, ConfigDict, ValidationError, model_validator
+
+class ConfigError(ValueError):
+    """Конфигурация агента не прошла проверку"""
+
+class AgentSettings(BaseModel):
+    model_config = ConfigDict(extra='allow')
+    
+    name: str
+    language: str = 'ru'
+
+class FlowStepSettings(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+    
+    type: Literal['generate_response', 'collect_entity']
+    template: Optional[str] = None
+    entity: Optional[str] = None
+    question_template: Optional[str] = None
+    validation: Optional[str] = None
+    
+    @model_validator(mode='after')
+    def _check_entity(self):
+        if self.type == 'collect_entity' and not self.entity:
+            raise ValueError("для collect_entity нужно поле entity")
+        return self
+
+class ToolSettings(BaseModel):
+    model_config = ConfigDict(extra='allow')
+    
+    name: str
+    description: str = ''
+    endpoint: Optional[str] = None
+    method: str = 'POST'
+
+class AgentConfigModel(BaseModel):
+    """Схема конфигурации агента (config/*.json)"""
+    model_config = ConfigDict(extra='allow')
+    
+    agent_config: AgentSettings
+    goals: List[str]
+    intents: List[str]
+    templates: Dict[str, str]
+    dialog_flows: Dict[str, List[FlowStepSettings]] = {}
+    intent_goals: Optional[Dict[str, str]] = None
+    default_goal: Optional[str] = None
+    completion_templates: Dict[str, str] = {}
+    intent_keywords: Optional[Dict[str, List[str]]] = None
+    intent_examples: Optional[Dict[str, List[str]]] = None
+    tools: List[ToolSettings] = []
+    
+    @model_validator(mode='after')
+    def _check_references(self):
+        for goal, template in self.completion_templates.items():
+            if template not in self.templates:
+                raise ValueError(f"completion_templates.{goal}: нет шаблона '{template}'")
+        names = [tool.name for tool in self.tools]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"инструменты с одинаковыми именами: {duplicates}")
+        return self
 
 class ConfigLoader:
     """Загрузчик конфигурационных файлов"""
@@ -10,13 +71,32 @@ class ConfigLoader:
         with open(file_path, 'r', encoding='utf-8') as f:
             return json.load(f)
     
+    @staticmethod
+    def parse_config(config: Dict) -> Dict[str, Any]:
+        """
+        Проверяет конфигурацию по схеме и возвращает нормализованную копию
+        (значения по умолчанию заполнены, пустые поля убраны)
+        """
+        try:
+            return AgentConfigModel.model_validate(config).model_dump(exclude_none=True)
+        except ValidationError as e:
+            raise ConfigError(f"Ошибка конфигурации:\n{e}") from e
+    
+    @classmethod
+    def load_validated(cls, file_path: str) -> Dict[str, Any]:
+        """Загружает и проверяет конфиг; ConfigError при ошибке"""
+        try:
+            config = cls.load_config(file_path)
+        except (OSError, json.JSONDecodeError) as e:
+            raise ConfigError(f"Не удалось прочитать {file_path}: {e}") from e
+        return cls.parse_config(config)
+    
     @staticmethod
     def validate_config(config: Dict) -> bool:
         """Валидирует конфигурацию"""
-        required_sections = ['agent_config', 'goals', 'intents', 'templates']
-        
-        for section in required_sections:
-            if section not in config:
-                return False
+        try:
+            AgentConfigModel.model_validate(config)
+        except ValidationError:
+            return False
         
-        return True
\ No newline at end of file
+        return True